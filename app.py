@@ -7,18 +7,30 @@ from pydantic import BaseModel
 from dateutil import parser
 import datetime, os
 
+from core.command_log import CommandLog
+
 app = FastAPI()
 
+# BRIDGE_LOG_PATH (default bridge.log), rotated by size, written in the background
+bridge_log = CommandLog()
+
 class Cmd(BaseModel):
     command: str
 
 @app.post("/bridge")
 def bridge(cmd: Cmd):
-    ts = datetime.datetime.now().isoformat()
-    with open(r"C:\ShineAI\bridge.log","a") as f:
-        f.write(f"[{ts}] {cmd.command}\n")
+    bridge_log.append(cmd.command)
     return {"status":"ok","received":cmd.command}
 
+@app.get("/bridge/tail")
+def bridge_tail(n: int = 50):
+    # Recent commands from memory; never reads the log file
+    return {"status":"ok","commands":bridge_log.tail(min(max(n, 0), bridge_log.tail_size))}
+
+@app.on_event("shutdown")
+def flush_bridge_log():
+    bridge_log.flush()
+
 
 @app.get("/login")
 async def login_get(request: Request):
@@ -0,0 +1,93 @@
+# bench/bench_archive.py
+#
+# Reading old history: re-parsing a memory_<mode>.jsonl line by line (before)
+# vs the columnar, memory-mapped segment from core/archive.py (after), for
+#   - counting user turns
+#   - finding the turns that mention a word
+#   - fetching one page of 100 turns from the middle
+#
+#   python bench/bench_archive.py [--turns 1000000]
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.archive import Archive, compact_file  # noqa: E402
+
+PHRASES = (
+    "I slept badly again", "work was long today", "my sister is visiting",
+    "went for a walk on the beach", "I'm nervous about the exam", "the garden looks great",
+    "I cooked pasta tonight", "feeling a bit lonely", "the new roster has me on nights",
+)
+
+
+def _generate(path, turns):
+    rnd = random.Random(5)
+    ts = 1_700_000_000
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(turns):
+            ts += rnd.randint(1, 120)
+            role = "user" if i % 2 == 0 else "assistant"
+            text = rnd.choice(PHRASES) + (" and the dentist is on Thursday" if rnd.random() < 0.001 else "") + f" ({i})"
+            f.write(json.dumps({"ts": ts, "role": role, "content": text}) + "\n")
+
+
+def _jsonl_scan(path):
+    with open(path, "rb") as f:
+        for ln in f:
+            yield json.loads(ln)
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return (time.perf_counter() - t0) * 1000, out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=1000000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory_companion.jsonl")
+        _generate(path, args.turns)
+        mid = args.turns // 2
+
+        ms_compact, seg = _timed(lambda: compact_file(path, keep=0, min_lines=1))
+        jsonl_mb = os.path.getsize(path) / 1e6
+        seg_mb = os.path.getsize(seg) / 1e6
+
+        before = {
+            "count user turns": _timed(lambda: sum(1 for o in _jsonl_scan(path) if o["role"] == "user")),
+            "find 'dentist'": _timed(lambda: len([o for o in _jsonl_scan(path) if "dentist" in o["content"]])),
+            "page of 100 at middle": _timed(lambda: len([o for i, o in enumerate(_jsonl_scan(path)) if mid <= i < mid + 100])),
+        }
+
+        ms_open, archive = _timed(lambda: Archive(path))
+        s = archive.segments[0]
+        after = {
+            "count user turns": _timed(lambda: sum(1 for _ in s.rows_with_role("user"))),
+            "find 'dentist'": _timed(lambda: len(s.find("dentist"))),
+            "page of 100 at middle": _timed(lambda: len(archive.page(mid, 100))),
+        }
+        ms_ts, (lo, hi) = _timed(lambda: s.ts_range(s.ts[mid], s.ts[mid + 1000]))
+
+        print(f"{args.turns} turns: JSONL {jsonl_mb:.1f} MB -> segment {seg_mb:.1f} MB, compacted in {ms_compact:.0f} ms, "
+              f"opened in {ms_open:.2f} ms")
+        for name in before:
+            (b_ms, b_n), (a_ms, a_n) = before[name], after[name]
+            assert b_n == a_n, (name, b_n, a_n)
+            print(f"  {name:<22} JSONL {b_ms:9.1f} ms   segment {a_ms:8.2f} ms   ({b_n} rows)")
+        print(f"  ts window of 1000 turns  segment {ms_ts:.3f} ms ({hi - lo} rows)")
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
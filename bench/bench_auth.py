@@ -0,0 +1,76 @@
+# bench/bench_auth.py
+#
+# Per-request auth overhead: full JWT decode + users.json read (before) vs
+# verified-token cache + cached user store lookup (after), for both
+# identity/auth.py and server.py's get_current_user.
+#
+#   python bench/bench_auth.py [--requests 20000] [--users 1000]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+
+def _per_call_us(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=20000)
+    ap.add_argument("--users", type=int, default=1000)
+    args = ap.parse_args()
+
+    from jose import jwt as jose_jwt
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["USERS_DB_PATH"] = os.path.join(tmp, "users.db")
+
+        import identity.auth as auth
+        from identity.user_store import get_store
+
+        users_file = os.path.join(tmp, "users.json")
+        users = {f"user{i}": {"username": f"user{i}", "password_hash": "x"} for i in range(args.users)}
+        with open(users_file, "w", encoding="utf-8") as f:
+            json.dump({"users": users}, f)
+        get_store().add_many((name, "x", "") for name in users)
+
+        token = auth.create_access_token({"sub": "user7"})
+
+        def identity_before():
+            payload = jose_jwt.decode(token, auth._secret_key(), algorithms=[auth._algo()])
+            with open(users_file, "r", encoding="utf-8") as f:
+                json.load(f)["users"].get(payload["sub"])
+
+        before = _per_call_us(identity_before, args.requests)
+        after = _per_call_us(lambda: auth.get_current_user(token), args.requests)
+        print(f"identity/auth.py  before {before:8.1f} us/req   after {after:6.2f} us/req   ({before / after:.0f}x)")
+
+    os.environ["MEMORY_DB_PATH"] = os.path.join(tempfile.gettempdir(), "bench_auth_memory.db")
+
+    import jwt as pyjwt
+    from fastapi.security import HTTPAuthorizationCredentials
+
+    import server
+
+    token = server.create_token("user7")
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    before = _per_call_us(lambda: pyjwt.decode(token, server.JWT_SECRET, algorithms=[server.JWT_ALG])["id"], args.requests)
+    after = _per_call_us(lambda: server.get_current_user(creds), args.requests)
+    print(f"server.py         before {before:8.1f} us/req   after {after:6.2f} us/req   ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# bench/bench_brain.py
+#
+# Load test for the SafeSpace brain: the old single-connection HTTPServer
+# (before) vs brain.py's threaded keep-alive server (after), each with 100
+# concurrent clients, with and without one slow client that sends half a
+# request and then goes quiet.
+#
+#   python bench/bench_brain.py [--clients 100] [--seconds 5]
+#
+# Both servers run in their own process with stdout discarded; each client
+# is a thread with one http.client connection (reopened when the server
+# closes it).
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LEGACY = r'''
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json, sys
+
+class SafeSpaceHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        print("Connection:", format % args)
+
+    def do_POST(self):
+        content_length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(content_length)
+        try:
+            data = json.loads(body.decode())
+            msg = data.get("message","").lower()
+            reply = "Your name is Doug. I am here." if "name" in msg else "I hear you Doug."
+        except Exception as e:
+            reply = "Brain connected."
+        response = json.dumps({"reply": reply}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Access-Control-Allow-Origin","*")
+        self.send_header("Content-Length",str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+HTTPServer(("127.0.0.1", int(sys.argv[1])), SafeSpaceHandler).serve_forever()
+'''
+
+CURRENT = "import sys, brain; brain.serve(int(sys.argv[1]))"
+
+
+def _start(code: str, port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code, str(port)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("server did not start")
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] * 1000 if xs else 0.0
+
+
+def _run(port: int, clients: int, seconds: float, slow: bool):
+    body = json.dumps({"message": "what is my name?"})
+    lat = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    slow_sock = None
+    if slow:
+        # Half a request, then silence
+        slow_sock = socket.create_connection(("127.0.0.1", port))
+        slow_sock.sendall(b"POST / HTTP/1.1\r\nHost: x\r\n")
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        mine = []
+        errs = 0
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", "/", body, {"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                data = json.loads(resp.read())
+                assert data["reply"] == "Your name is Doug. I am here."
+                mine.append(time.perf_counter() - t0)
+            except Exception:
+                errs += 1
+                conn.close()
+        conn.close()
+        with lock:
+            lat.extend(mine)
+            errors[0] += errs
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if slow_sock is not None:
+        slow_sock.close()
+    return len(lat) / seconds, _pct(lat, 0.5), _pct(lat, 0.99), errors[0]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=100)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--port", type=int, default=8150)
+    args = ap.parse_args()
+
+    print(f"{args.clients} concurrent clients, {args.seconds:.0f}s per run, {os.cpu_count()} cpu(s)")
+    for name, code, port in (("HTTPServer (before)", LEGACY, args.port), ("brain.py (after)", CURRENT, args.port + 1)):
+        for slow in (False, True):
+            proc = _start(code, port)
+            try:
+                rps, p50, p99, errors = _run(port, args.clients, args.seconds, slow)
+            finally:
+                proc.kill()
+                proc.wait()
+            label = f"{name}{' + slow client' if slow else ''}"
+            print(f"{label:<36} {rps:8.0f} req/s   p50 {p50:7.1f}ms   p99 {p99:7.1f}ms   errors {errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# bench/bench_bridge_log.py
+#
+# Cost of logging one /bridge command: open + append + close per request
+# (before) vs CommandLog.append into the ring buffer + background writer
+# (after), from several threads at once.
+#
+#   python bench/bench_bridge_log.py [--threads 16] [--commands 2000]
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.command_log import CommandLog  # noqa: E402
+
+
+def _legacy(path):
+    def log(command):
+        ts = datetime.datetime.now().isoformat()
+        with open(path, "a") as f:
+            f.write(f"[{ts}] {command}\n")
+    return log
+
+
+def _run(log, threads, commands):
+    lat = []
+    lock = threading.Lock()
+
+    def worker(t):
+        mine = []
+        for i in range(commands):
+            t0 = time.perf_counter()
+            log(f"add lunch with Lyndal 1pm tomorrow ({t}/{i})")
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            lat.extend(mine)
+
+    start = time.perf_counter()
+    ts = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    elapsed = time.perf_counter() - start
+    lat.sort()
+    return len(lat) / elapsed, lat[len(lat) // 2] * 1e6, lat[int(len(lat) * 0.99)] * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--commands", type=int, default=2000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = _run(_legacy(os.path.join(tmp, "legacy.log")), args.threads, args.commands)
+
+        cl = CommandLog(os.path.join(tmp, "bridge.log"), max_bytes=1024 * 1024)
+        after = _run(cl.append, args.threads, args.commands)
+        t0 = time.perf_counter()
+        cl.flush()
+        drain = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _ in range(10000):
+            cl.tail(50)
+        tail_us = (time.perf_counter() - t0) / 10000 * 1e6
+
+        print(f"{args.threads} threads x {args.commands} commands")
+        for name, (rate, p50, p99) in (("open/append/close", before), ("CommandLog", after)):
+            print(f"{name:<18} {rate:9.0f} cmds/s   p50 {p50:7.1f} us   p99 {p99:7.1f} us")
+        print(f"writer drained the rest in {drain * 1000:.1f} ms, {cl.rotations} rotations; tail(50) {tail_us:.1f} us")
+        cl.close()
+
+
+if __name__ == "__main__":
+    main()
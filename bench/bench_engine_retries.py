@@ -0,0 +1,64 @@
+# bench/bench_engine_retries.py
+#
+# Runs AsyncCoreEngine against bench/fake_openai.py with injected failures and
+# prints how each scenario resolved and how long it held the caller.
+#
+#   python bench/bench_engine_retries.py
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_openai import FakeState, serve  # noqa: E402
+
+PORT = 8099
+
+SCENARIOS = [
+    # name, script, retry_after, expect_ok
+    ("transient 503 then ok", [503, 502, 200], None, True),
+    ("429 with Retry-After", [429, 200], 0.3, True),
+    ("400 is not retried", [400, 200], None, False),
+    ("401 is not retried", [401], None, False),
+    ("persistent 503 hits deadline", [503] * 50, None, False),
+]
+
+
+async def main() -> None:
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+    os.environ.setdefault("OPENAI_DEADLINE_S", "3")
+    os.environ.setdefault("OPENAI_BACKOFF_BASE_S", "0.2")
+
+    from core import http_pool
+    from core.engine import AsyncCoreEngine
+
+    server = serve(PORT, FakeState(), background=True)
+    engine = AsyncCoreEngine()
+    failures = 0
+    try:
+        for name, script, retry_after, expect_ok in SCENARIOS:
+            server.state.script = list(script)
+            server.state.retry_after = retry_after
+            before = server.state.requests
+
+            start = time.perf_counter()
+            result = await engine.safe_generate([{"role": "user", "content": "hi"}])
+            elapsed = time.perf_counter() - start
+            attempts = server.state.requests - before
+
+            ok = result["ok"] == expect_ok
+            failures += not ok
+            print(f"{'PASS' if ok else 'FAIL'}  {name:32s} ok={result['ok']!s:5s} attempts={attempts} {elapsed:5.2f}s")
+    finally:
+        await engine.aclose()
+        await http_pool.aclose()
+        server.shutdown()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+# bench/bench_http_pool.py
+#
+# Chat completion calls over HTTPS against bench/fake_openai.py (self-signed
+# cert for "localhost"): a fresh OpenAI client per call, as get_provider()
+# used to build (before), vs the shared client from core/http_pool.py (after).
+# Counts the TCP+TLS connections the server had to accept.
+#
+#   python bench/bench_http_pool.py [--threads 8] [--calls 50]
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8097
+
+
+def _cert(tmp: str):
+    key, crt = os.path.join(tmp, "key.pem"), os.path.join(tmp, "crt.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+         "-keyout", key, "-out", crt],
+        check=True, capture_output=True,
+    )
+    pem = os.path.join(tmp, "server.pem")
+    with open(pem, "w") as out:
+        out.write(open(crt).read() + open(key).read())
+    return pem, crt
+
+
+def _run(make_client, threads: int, calls: int):
+    lat = []
+    lock = threading.Lock()
+
+    def worker():
+        mine = []
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            client = make_client()
+            client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            lat.extend(mine)
+
+    start = time.perf_counter()
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    elapsed = time.perf_counter() - start
+    lat.sort()
+    return len(lat) / elapsed, lat[len(lat) // 2] * 1000, lat[int(len(lat) * 0.99)] * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--calls", type=int, default=50)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pem, crt = _cert(tmp)
+        os.environ["SSL_CERT_FILE"] = crt  # trusted by every httpx client below
+        base_url = f"https://localhost:{PORT}/v1"
+
+        from openai import OpenAI
+        from bench.fake_openai import FakeState, serve
+        from core import http_pool
+
+        server = serve(PORT, FakeState(), background=True, certfile=pem)
+        state = server.state
+        try:
+            rows = []
+            for name, make in (
+                ("client per call", lambda: OpenAI(api_key="sk-fake", base_url=base_url)),
+                ("http_pool shared", lambda: http_pool.openai_client("sk-fake", base_url)),
+            ):
+                before = state.connections
+                rate, p50, p99 = _run(make, args.threads, args.calls)
+                rows.append((name, rate, p50, p99, state.connections - before))
+
+            print(f"{args.threads} threads x {args.calls} calls over TLS, {os.cpu_count()} cpu(s)")
+            for name, rate, p50, p99, conns in rows:
+                print(f"{name:<18} {rate:7.0f} calls/s   p50 {p50:6.1f}ms   p99 {p99:6.1f}ms   connections {conns}")
+            print("pool:", http_pool.stats())
+        finally:
+            http_pool.close()
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
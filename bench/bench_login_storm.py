@@ -0,0 +1,169 @@
+# bench/bench_login_storm.py
+#
+# Chat latency while /login is being hammered: bcrypt inline on the server's
+# worker threads (before, /legacy/login) vs the identity.passwords process
+# pool (after, /login from identity/routes.py).
+#
+#   python bench/bench_login_storm.py [--seconds 8] [--storm 32] [--rounds 12]
+#
+# The server runs in a separate uvicorn process; this process only generates
+# load. /chat mimics server.py's hot path: a sync auth dependency (run on the
+# thread pool), prompt assembly, and a 20ms awaited upstream call.
+# PASSWORD_MAX_PER_IP is raised for the run because every storm client comes
+# from 127.0.0.1 -- otherwise the per-IP cap would simply 429 the storm.
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+PORT = 8096
+USER, PASSWORD = "storm", "correct horse battery staple"
+
+
+# ----- server side (imported by uvicorn in the child process) -----
+
+def _make_app():
+    import bcrypt
+    from fastapi import Depends, FastAPI
+    from pydantic import BaseModel
+
+    from core.prompt import PromptAssembler
+    from identity.routes import UserRequest, router
+    from identity.users import find_user
+
+    app = FastAPI()
+    app.include_router(router)
+    prompt = PromptAssembler(model="gpt-4o-mini")
+    history = [{"role": "user" if i % 2 else "assistant", "content": f"turn {i} " * 40} for i in range(40)]
+
+    @app.post("/legacy/login")
+    def legacy_login(user: UserRequest):
+        # Old behaviour: bcrypt on a server thread
+        u = find_user(user.username)
+        ok = u is not None and bcrypt.checkpw(user.password.encode()[:72], u["password_hash"].encode())
+        return {"status": "ok" if ok else "error"}
+
+    def current_user():
+        return "storm"
+
+    class ChatRequest(BaseModel):
+        message: str
+
+    @app.post("/chat")
+    async def chat(data: ChatRequest, user_id: str = Depends(current_user)):
+        messages = prompt.build("You are Shine.", history, data.message)
+        await asyncio.sleep(0.02)
+        return {"reply": "ok", "messages": len(messages)}
+
+    return app
+
+
+if os.getenv("LOGIN_STORM_SERVER"):
+    app = _make_app()
+
+
+# ----- load generator -----
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] * 1000 if xs else 0.0
+
+
+async def _phase(name: str, login_path, seconds: float, storm: int) -> None:
+    import httpx
+
+    base = f"http://127.0.0.1:{PORT}"
+    stop = time.monotonic() + seconds
+    chat_lat = []
+    logins = {"ok": 0, "error": 0, "429": 0, "503": 0}
+
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=httpx.Limits(max_connections=storm + 8)) as client:
+
+        async def chatter():
+            while time.monotonic() < stop:
+                t0 = time.perf_counter()
+                r = await client.post("/chat", json={"message": "hey, you there?"})
+                r.raise_for_status()
+                chat_lat.append(time.perf_counter() - t0)
+                await asyncio.sleep(0.01)
+
+        async def stormer():
+            while time.monotonic() < stop:
+                r = await client.post(login_path, json={"username": USER, "password": PASSWORD})
+                if r.status_code == 200:
+                    logins[r.json()["status"]] += 1
+                else:
+                    logins[str(r.status_code)] = logins.get(str(r.status_code), 0) + 1
+                    await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+
+        tasks = [chatter(), chatter()]
+        if login_path:
+            tasks += [stormer() for _ in range(storm)]
+        await asyncio.gather(*tasks)
+
+    print(f"{name:<22} chat n={len(chat_lat):>5}  p50={_pct(chat_lat, 0.50):7.1f}ms  "
+          f"p99={_pct(chat_lat, 0.99):7.1f}ms  logins/s={logins['ok'] / seconds:6.1f}  "
+          f"rejected={logins.get('429', 0) + logins.get('503', 0)}")
+
+
+def _wait_up() -> None:
+    import httpx
+
+    for _ in range(200):
+        try:
+            httpx.post(f"http://127.0.0.1:{PORT}/chat", json={"message": "up"}, timeout=1)
+            return
+        except Exception:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=8.0)
+    ap.add_argument("--storm", type=int, default=32)
+    ap.add_argument("--rounds", type=int, default=12)
+    ap.add_argument("--workers", type=int, default=1)
+    args = ap.parse_args()
+
+    from identity.passwords import _hash
+    from identity.user_store import UserStore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "users.db")
+        UserStore(db_path).add(USER, _hash(PASSWORD, args.rounds))
+
+        env = dict(os.environ,
+                   LOGIN_STORM_SERVER="1",
+                   USERS_DB_PATH=db_path,
+                   PYTHONPATH=ROOT + os.pathsep + os.path.join(ROOT, "bench"),
+                   BCRYPT_ROUNDS=str(args.rounds),
+                   PASSWORD_HASH_WORKERS=str(args.workers),
+                   PASSWORD_MAX_PER_IP="1000")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "bench_login_storm:app", "--port", str(PORT), "--log-level", "warning"],
+            cwd=tmp, env=env,
+        )
+        try:
+            _wait_up()
+            print(f"bcrypt rounds={args.rounds} storm={args.storm} clients, {args.seconds:.0f}s per phase, "
+                  f"{os.cpu_count()} cpu(s), {args.workers} hash worker(s)")
+            asyncio.run(_phase("idle", None, args.seconds, 0))
+            asyncio.run(_phase("storm, inline bcrypt", "/legacy/login", args.seconds, args.storm))
+            asyncio.run(_phase("storm, process pool", "/login", args.seconds, args.storm))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
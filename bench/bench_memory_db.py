@@ -0,0 +1,84 @@
+# bench/bench_memory_db.py
+#
+# Requests/second for the /chat memory path (one load_user_memory per turn,
+# one save_user_memory every few turns): connect-per-call vs pooled MemoryDB.
+#
+#   python bench/bench_memory_db.py [--threads 8] [--requests 4000]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.memory_db import SQL_INSERT, SQL_LOAD_RECENT, MemoryDB  # noqa: E402
+
+SAVE_EVERY = 5
+
+
+def _naive_turn(path: str, user_id: str, i: int) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute(SQL_LOAD_RECENT, (user_id, 20)).fetchall()
+    conn.close()
+
+    if i % SAVE_EVERY == 0:
+        conn = sqlite3.connect(path)
+        conn.execute(SQL_INSERT, (user_id, f"k{i}", f"v{i}"))
+        conn.commit()
+        conn.close()
+
+
+def _pooled_turn(db: MemoryDB, user_id: str, i: int) -> None:
+    db.load_user_memory(user_id, limit=20)
+    if i % SAVE_EVERY == 0:
+        db.save_user_memory(user_id, f"k{i}", f"v{i}")
+
+
+def _run(turn, threads: int, requests: int) -> float:
+    per_thread = requests // threads
+
+    def worker(t: int) -> None:
+        for i in range(per_thread):
+            turn(f"user{t % 50}", i)
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    return (per_thread * threads) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=4000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        naive_path = os.path.join(tmp, "naive.db")
+        MemoryDB(naive_path, pool_size=1).close()
+        # Put the baseline back on the default rollback journal.
+        conn = sqlite3.connect(naive_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+        before = _run(lambda u, i: _naive_turn(naive_path, u, i), args.threads, args.requests)
+
+        db = MemoryDB(os.path.join(tmp, "pooled.db"), pool_size=args.threads)
+        after = _run(lambda u, i: _pooled_turn(db, u, i), args.threads, args.requests)
+        db.close()
+
+    print(f"threads={args.threads} requests={args.requests}")
+    print(f"before (connect per call): {before:10.0f} req/s")
+    print(f"after  (pooled, WAL):      {after:10.0f} req/s")
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
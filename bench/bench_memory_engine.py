@@ -0,0 +1,92 @@
+# bench/bench_memory_engine.py
+#
+# memory_engine remember/recall: whole-file JSON rewrite per call (before)
+# vs snapshot + append-only log with an in-memory index (after), plus a
+# multi-process writer check.
+#
+#   python bench/bench_memory_engine.py [--keys 20000] [--ops 2000] [--procs 4]
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_engine import KeyValueLog  # noqa: E402
+
+
+class LegacyMemory:
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def set(self, key, value):
+        memory = self.load()
+        memory[key] = value
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(memory, f, indent=2)
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+
+def _writer(kind, path, proc, n):
+    store = LegacyMemory(path) if kind == "legacy" else KeyValueLog(path, compact_min=200)
+    for i in range(n):
+        store.set(f"p{proc}-k{i}", i)
+
+
+def _per_op_us(fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--keys", type=int, default=20000)
+    ap.add_argument("--ops", type=int, default=2000)
+    ap.add_argument("--procs", type=int, default=4)
+    args = ap.parse_args()
+
+    value = "likes long walks and quiet mornings"
+    seed = {f"key{i}": value for i in range(args.keys)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.keys:,} existing keys, {args.ops} ops each")
+        for kind in ("legacy", "log"):
+            path = os.path.join(tmp, f"{kind}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(seed, f, indent=2)
+            store = LegacyMemory(path) if kind == "legacy" else KeyValueLog(path)
+            ops = max(1, args.ops // 20) if kind == "legacy" else args.ops
+
+            w = _per_op_us(lambda i: store.set(f"new{i}", value), ops)
+            r = _per_op_us(lambda i: store.get(f"key{i % args.keys}"), ops)
+            print(f"{kind:<7} remember {w:10.1f} us   recall {r:10.1f} us")
+
+        for kind in ("legacy", "log"):
+            path = os.path.join(tmp, f"race-{kind}.json")
+            n = 100 if kind == "legacy" else 1000
+            procs = [multiprocessing.Process(target=_writer, args=(kind, path, p, n)) for p in range(args.procs)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+            kept = len(LegacyMemory(path).load()) if kind == "legacy" else len(KeyValueLog(path).snapshot())
+            print(f"{kind:<7} {args.procs} processes x {n} writes: {kept} of {args.procs * n} keys kept")
+
+
+if __name__ == "__main__":
+    main()
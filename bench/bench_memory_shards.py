@@ -0,0 +1,105 @@
+# bench/bench_memory_shards.py
+#
+# Per-user conversation shards at scale: --users distinct users each get
+# their own history file, then a skewed workload (a few hot users, a long
+# tail) runs append_turn + load_messages from several threads, with
+#   - one lock and one open file at a time (roughly the old store: every
+#     turn reopened the file under a global lock)
+#   - the default striped shard locks and append-handle LRU
+# and finally checks that no user sees anyone else's messages.
+#
+#   python bench/bench_memory_shards.py [--users 100000] [--turns 50000] [--threads 8]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.memory import MemoryStore  # noqa: E402
+
+
+def _users(n):
+    return [f"user{i:06d}" for i in range(n)]
+
+
+def _run(store, users, turns, threads, seed):
+    lat = []
+    lock = threading.Lock()
+    per_thread = turns // threads
+
+    def worker(t):
+        rnd = random.Random(seed + t)
+        mine = []
+        for i in range(per_thread):
+            # 80% of turns from 100 users in active conversations
+            if rnd.random() < 0.8:
+                u = users[rnd.randrange(min(100, len(users)))]
+            else:
+                u = rnd.choice(users)
+            t0 = time.perf_counter()
+            store.load_messages("companion", u)
+            store.append_turn("companion", f"{u} says hi {i}", f"hello {u}", u)
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            lat.extend(mine)
+
+    start = time.perf_counter()
+    ts = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    elapsed = time.perf_counter() - start
+    lat.sort()
+    return len(lat) / elapsed, lat[len(lat) // 2] * 1e6, lat[int(len(lat) * 0.99)] * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=100000)
+    ap.add_argument("--turns", type=int, default=50000)
+    ap.add_argument("--threads", type=int, default=8)
+    args = ap.parse_args()
+
+    users = _users(args.users)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MemoryStore(os.path.join(tmp, "data"), cache_bytes=4 * 1024 * 1024)
+        t0 = time.perf_counter()
+        for u in users:
+            store.append_turn("companion", f"{u} says hi", f"hello {u}", u)
+        seed_s = time.perf_counter() - t0
+        print(f"seeded {args.users} user shards in {seed_s:.1f}s ({args.users / seed_s:.0f} users/s)")
+
+        rows = []
+        for name, stripes, max_open in (("1 lock, reopen each turn", "1", 1), ("striped locks + handle LRU", "64", 128)):
+            os.environ["SHINE_MEMORY_LOCK_STRIPES"] = stripes
+            s = MemoryStore(os.path.join(tmp, "data"), cache_bytes=4 * 1024 * 1024, max_open=max_open)
+            rate, p50, p99 = _run(s, users, args.turns, args.threads, seed=len(rows))
+            rows.append((name, rate, p50, p99, s.handle_stats()))
+            s.close()
+
+        print(f"{args.turns} turns (load + append), {args.threads} threads, {os.cpu_count()} cpu(s)")
+        for name, rate, p50, p99, h in rows:
+            print(f"  {name:<28} {rate:7.0f} turns/s   p50 {p50:7.1f} us   p99 {p99:8.1f} us   "
+                  f"opens {h['opens']}  handle hits {h['hits']}")
+
+        leaves = [len(files) for _, _, files in os.walk(os.path.join(tmp, "data", "users")) if files]
+        print(f"layout: {len(leaves)} user dirs, {max(leaves)} files max per dir")
+
+        check = MemoryStore(os.path.join(tmp, "data"))
+        bad = 0
+        for u in random.Random(1).sample(users, 1000):
+            for m in check.load_messages("companion", u):
+                bad += u not in m["content"]
+        print(f"isolation: {bad} foreign messages in 1000 sampled histories")
+        store.close()
+        check.close()
+
+
+if __name__ == "__main__":
+    main()
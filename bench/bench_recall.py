@@ -0,0 +1,95 @@
+# bench/bench_recall.py
+#
+# Latency of recency and relevance-ranked recall on a large user_memory table:
+# the FTS5 probe in MemoryDB and the per-user postings of RecallIndex (what
+# server.py's MEMORY_RECALL_MODE=ranked uses), the latter from the saved file.
+#
+#   python bench/bench_recall.py [--rows 1000000] [--users 100000] [--queries 2000]
+#
+# Use --rows 10000000 for the 10M-row target (building the table takes a while).
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.memory_db import MemoryDB  # noqa: E402
+from core.recall_index import RecallIndex  # noqa: E402
+
+WORDS = (
+    "dog cat sister brother job nurse teacher garden coffee tea running anxiety sleep "
+    "music guitar piano london paris birthday march april football novel recipe pasta "
+    "therapy walk beach mountain car bike train school exam project deadline friend"
+).split()
+KEYS = ("name", "pet", "job", "hobby", "city", "family", "goal", "food", "worry", "birthday")
+
+
+def _populate(db: MemoryDB, rows: int, users: int) -> None:
+    rnd = random.Random(7)
+    batch = []
+    with db.connection() as conn:
+        for i in range(rows):
+            u = i % users
+            key = f"{KEYS[(i // users) % len(KEYS)]}{i // (users * len(KEYS))}"
+            value = " ".join(rnd.choice(WORDS) for _ in range(6))
+            batch.append((f"user{u}", key, value))
+            if len(batch) >= 50000:
+                conn.executemany("INSERT INTO user_memory (user_id, key, value) VALUES (?, ?, ?)", batch)
+                conn.commit()
+                batch.clear()
+        if batch:
+            conn.executemany("INSERT INTO user_memory (user_id, key, value) VALUES (?, ?, ?)", batch)
+            conn.commit()
+
+
+def _time(fn, queries: int) -> float:
+    start = time.perf_counter()
+    for _ in range(queries):
+        fn()
+    return (time.perf_counter() - start) / queries * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--users", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=2000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = MemoryDB(os.path.join(tmp, "recall.db"), pool_size=1)
+        t0 = time.perf_counter()
+        _populate(db, args.rows, args.users)
+        db.optimize()
+        print(f"populated {args.rows} rows / {args.users} users in {time.perf_counter() - t0:.1f}s")
+
+        rnd = random.Random(11)
+        pick = lambda: f"user{rnd.randrange(args.users)}"  # noqa: E731
+        msg = lambda: " ".join(rnd.choice(WORDS) for _ in range(8))  # noqa: E731
+
+        recent = _time(lambda: db.load_user_memory(pick(), 20), args.queries)
+        ranked = _time(lambda: db.search_user_memory(pick(), msg(), 20), args.queries)
+        mixed = _time(lambda: db.recall_user_memory(pick(), msg(), 20), args.queries)
+
+        index = RecallIndex(os.path.join(tmp, "RecallIndex"), save_interval_s=3600)
+        index.sync(db)
+        index.save()
+        index.close()
+        index = RecallIndex(os.path.join(tmp, "RecallIndex"), save_interval_s=3600)
+        index.top_k("user0", "warm up")
+        indexed = _time(lambda: index.facts(pick(), msg(), 20, kinds=("fact",)), args.queries)
+        index.close()
+        db.close()
+
+    print(f"recent  (covering index): {recent:8.1f} us/query")
+    print(f"ranked  (FTS5 probe):     {ranked:8.1f} us/query")
+    print(f"recall  (ranked + top-up):{mixed:8.1f} us/query")
+    print(f"ranked  (RecallIndex):    {indexed:8.1f} us/query")
+
+
+if __name__ == "__main__":
+    main()
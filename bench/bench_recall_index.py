@@ -0,0 +1,146 @@
+# bench/bench_recall_index.py
+#
+# Recall for prompt assembly over --users users with --facts facts each,
+# plus --turn-users conversations of --turns messages and 1000 knowledge rows:
+#   - MemoryDB.recall_user_memory (FTS5, MEMORY_RECALL_MODE=ranked) vs
+#     RecallIndex.top_k, first from the in-memory delta, then from the
+#     saved file after a cold (lazy) open
+#   - whether one old fact, planted before the user's other facts, makes
+#     it into the 20 rows the prompt gets (recent-20 vs index)
+#   - file size, and save time for the initial build and for a later
+#     save tick
+#
+#   python bench/bench_recall_index.py [--users 20000] [--facts 40] [--turn-users 1000] [--turns 100]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.memory_db import MemoryDB, SQL_INSERT  # noqa: E402
+from core.recall_index import RecallIndex  # noqa: E402
+
+TOPICAL = (
+    "walk beach work roster nights sister brother mum dad dentist thursday guitar school money "
+    "sleep coffee dog cat garden rain movie book friend party birthday holiday train car doctor "
+    "anxiety football netball cooking pasta curry bike gym yoga paint music piano exam job boss"
+).split()
+_SYL = ("ka", "lo", "mi", "ne", "su", "ta", "ri", "po", "de", "va", "zu", "sh", "or", "en")
+# Word frequencies in chat text fall off roughly as 1/rank (Zipf)
+WORDS = TOPICAL + sorted({a + b + c for a in _SYL for b in _SYL for c in _SYL})[:3000]
+CUM = list(accumulate(1.0 / (r + 1) ** 1.05 for r in range(len(WORDS))))
+
+
+def _text(rnd, n):
+    return " ".join(rnd.choices(WORDS, cum_weights=CUM, k=n))
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] * 1e6
+
+
+def _time_queries(fn, queries):
+    lat = []
+    for user, text in queries:
+        t0 = time.perf_counter()
+        fn(user, text)
+        lat.append(time.perf_counter() - t0)
+    return lat
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=20000)
+    ap.add_argument("--facts", type=int, default=40)
+    ap.add_argument("--turn-users", type=int, default=1000)
+    ap.add_argument("--turns", type=int, default=100)
+    ap.add_argument("--queries", type=int, default=2000)
+    args = ap.parse_args()
+    rnd = random.Random(5)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = MemoryDB(os.path.join(tmp, "memory.db"))
+        index = RecallIndex(os.path.join(tmp, "RecallIndex"), save_interval_s=3600)
+
+        t0 = time.perf_counter()
+        rows = []
+        for u in range(args.users):
+            # The planted fact is the user's oldest: invisible to "newest 20"
+            rows.append((str(u), "allergy", "penicillin allergy, told the doctor in 2019"))
+            rows += [(str(u), f"note_{i}", _text(rnd, 6)) for i in range(args.facts - 1)]
+        with db.connection() as conn:
+            conn.executemany(SQL_INSERT, rows)
+            conn.execute("INSERT INTO knowledge_memory (topic, content) VALUES ('sleep', 'Keep a regular wake time')")
+            conn.executemany(
+                "INSERT INTO knowledge_memory (topic, content) VALUES (?, ?)",
+                [(rnd.choice(WORDS), _text(rnd, 20)) for _ in range(999)],
+            )
+            conn.commit()
+        print(f"seeded {len(rows)} facts in {time.perf_counter() - t0:.1f}s")
+
+        t0 = time.perf_counter()
+        index.sync(db=db)
+        for u in range(args.turn_users):
+            for _ in range(args.turns // 2):
+                index.add_turn(str(u), "companion", _text(rnd, 12), _text(rnd, 20))
+        build_s = time.perf_counter() - t0
+        docs = index.stats()["delta_docs"]
+        print(f"indexed {docs} documents in {build_s:.1f}s ({docs / build_s:.0f} docs/s)")
+
+        queries = [(str(rnd.randrange(args.users)), _text(rnd, 8)) for _ in range(args.queries)]
+
+        fts = _time_queries(lambda u, t: db.recall_user_memory(u, t, limit=20), queries)
+        hot = _time_queries(lambda u, t: index.top_k(u, t, 20), queries)
+
+        t0 = time.perf_counter()
+        index.save()
+        save_s = time.perf_counter() - t0
+        size = os.path.getsize(index.path)
+        index.close()
+
+        cold = RecallIndex(os.path.join(tmp, "RecallIndex"), save_interval_s=3600)
+        t0 = time.perf_counter()
+        cold.top_k("0", "first query")
+        open_ms = (time.perf_counter() - t0) * 1000
+        mapped = _time_queries(lambda u, t: cold.top_k(u, t, 20), queries)
+        turn_q = [(str(rnd.randrange(args.turn_users)), _text(rnd, 8)) for _ in range(args.queries)]
+        turns = _time_queries(lambda u, t: cold.top_k(u, t, 5, kinds=("turn",)), turn_q)
+
+        print(f"\ntop-20 recall for a message, {args.queries} queries")
+        for name, lat in (
+            ("FTS5 ranked (MemoryDB)", fts),
+            ("RecallIndex, in memory", hot),
+            ("RecallIndex, mmapped file", mapped),
+            ("  turns only, top 5", turns),
+        ):
+            print(f"  {name:<27} p50 {_pct(lat, 0.5):7.1f} us   p99 {_pct(lat, 0.99):7.1f} us")
+
+        sample = [str(rnd.randrange(args.users)) for _ in range(500)]
+        msg = "should I mention my allergy to the doctor?"
+        recent = sum(any(k == "allergy" for k, _ in db.load_user_memory(u, 20)) for u in sample) / len(sample)
+        hit = sum(any(k == "allergy" for k, _ in cold.facts(u, msg, 20)) for u in sample) / len(sample)
+        print(f"\n'{msg}': oldest fact in the prompt's 20 rows: recent-20 {recent:.0%}, index {hit:.0%}")
+        # A save tick after 1000 more writes, half of them replacing a fact
+        for i in range(1000):
+            key = f"note_{rnd.randrange(args.facts - 1)}" if i % 2 else f"extra_{i}"
+            cold.add_fact(str(rnd.randrange(args.users)), key, _text(rnd, 6))
+        t0 = time.perf_counter()
+        cold.save()
+        incr_s = time.perf_counter() - t0
+
+        raw = sum(len(k) + len(v) for _, k, v in rows)
+        print(f"recall.bin {size / 1e6:.1f} MB (fact text alone {raw / 1e6:.1f} MB); "
+              f"cold open + first query {open_ms:.2f} ms")
+        print(f"save: initial build {save_s:.1f}s, after 1000 more writes {incr_s:.2f}s")
+        cold.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# bench/bench_router.py
+#
+# 1. OpenAIProvider against bench/fake_openai.py (100ms per call), 50
+#    concurrent asks: the old sync client inside the coroutine (before) vs
+#    AsyncOpenAI on the shared pool (after).
+# 2. ProviderRouter over two simulated backends with a heavy tail (8% of
+#    calls take 0.5-1.5s): tail latency without vs with hedging.
+# 3. Latency-aware routing: equal weights, one backend 10x slower.
+#
+#   python bench/bench_router.py [--requests 1000] [--concurrency 20]
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_openai import FakeState, serve  # noqa: E402
+from providers.base import BaseProvider  # noqa: E402
+
+PORT = 8098
+
+
+class LegacyOpenAIProvider(BaseProvider):
+    # providers/openai_provider.py before: sync client inside async def
+
+    def __init__(self, base_url):
+        from openai import OpenAI
+        self.client = OpenAI(api_key="sk-fake", base_url=base_url)
+
+    async def ask(self, message: str) -> str:
+        response = self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": message}]
+        )
+        return response.choices[0].message.content
+
+
+class SimulatedProvider(BaseProvider):
+    def __init__(self, name, base_s, tail_rate=0.0, tail_s=(0.5, 1.5)):
+        self.name = name
+        self.base_s = base_s
+        self.tail_rate = tail_rate
+        self.tail_s = tail_s
+
+    async def ask(self, message: str) -> str:
+        if random.random() < self.tail_rate:
+            await asyncio.sleep(random.uniform(*self.tail_s))
+        else:
+            await asyncio.sleep(self.base_s * random.uniform(0.8, 1.2))
+        return "ok"
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] * 1000
+
+
+async def _drive(provider, requests, concurrency):
+    lat = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            await provider.ask("hi")
+            lat.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return time.perf_counter() - start, lat
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=20)
+    args = ap.parse_args()
+
+    from core import http_pool
+    from providers.openai_provider import OpenAIProvider
+    from providers.router import ProviderRouter
+
+    base_url = f"http://127.0.0.1:{PORT}/v1"
+    server = serve(PORT, FakeState(latency_s=0.1), background=True)
+    try:
+        print("50 concurrent asks, 100ms upstream")
+        for name, provider in (
+            ("sync client (before)", LegacyOpenAIProvider(base_url)),
+            ("AsyncOpenAI (after)", OpenAIProvider(api_key="sk-fake", base_url=base_url)),
+        ):
+            elapsed, lat = await _drive(provider, 50, 50)
+            print(f"  {name:<22} wall {elapsed * 1000:7.0f}ms   p50 {_pct(lat, 0.5):7.1f}ms")
+    finally:
+        await http_pool.aclose()
+        server.shutdown()
+
+    print(f"\n{args.requests} asks, concurrency {args.concurrency}, two backends: 30ms, 8% at 0.5-1.5s")
+    for hedge in (False, True):
+        router = ProviderRouter(
+            [(SimulatedProvider("a", 0.03, 0.08), 1), (SimulatedProvider("b", 0.03, 0.08), 1)],
+            hedge=hedge, hedge_delay_s=0.1, min_samples=20,
+        )
+        _, lat = await _drive(router, args.requests, args.concurrency)
+        extra = sum(b.hedges for b in router.backends)
+        print(f"  hedge={hedge!s:<5} p50 {_pct(lat, 0.5):6.1f}ms   p95 {_pct(lat, 0.95):6.1f}ms   "
+              f"p99 {_pct(lat, 0.99):6.1f}ms   extra calls {extra / args.requests:.1%}")
+
+    print("\nequal weights, fast = 20ms, slow = 200ms")
+    router = ProviderRouter(
+        [(SimulatedProvider("fast", 0.02), 1), (SimulatedProvider("slow", 0.2), 1)], hedge=False,
+    )
+    _, lat = await _drive(router, args.requests, args.concurrency)
+    share = {b.name: b.calls / args.requests for b in router.backends}
+    print(f"  traffic fast {share['fast']:.1%} / slow {share['slow']:.1%}   p50 {_pct(lat, 0.5):6.1f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+# bench/bench_summarizer.py
+#
+# Prompt size over a long conversation: keeping the whole history
+# (SHINE_MEMORY_TURNS raised to cover it) vs a 6-turn window plus the
+# rolling summary from core/summarizer.py (extractive, no model calls).
+# Also the request-path cost (get + schedule) and the background fold time.
+#
+#   python bench/bench_summarizer.py [--turns 200]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.memory import MemoryStore  # noqa: E402
+from core.prompt import PromptAssembler  # noqa: E402
+from core.summarizer import RollingSummarizer  # noqa: E402
+
+SYSTEM = "You are Shine, a warm and steady companion."
+TOPICS = (
+    "My sister Lyndal is visiting next week and I am a bit nervous about it.",
+    "Work was long today. The new roster has me on nights again.",
+    "I went for a walk on the beach this morning. It helped with the anxiety.",
+    "Can you remind me that the dentist is on Thursday at 3pm?",
+    "I have been thinking about learning guitar again, like I did at school.",
+    "Slept badly. Kept waking up at 3am thinking about money.",
+)
+
+
+def _prompt_tokens(pa, messages):
+    return sum(pa.message_tokens(m) for m in messages)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=200)
+    args = ap.parse_args()
+    rnd = random.Random(3)
+    # Large budget so neither variant is cut by the assembler itself
+    pa = PromptAssembler(budget_tokens=10 ** 7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        full = MemoryStore(os.path.join(tmp, "full"), max_turns=args.turns)
+        windowed = MemoryStore(os.path.join(tmp, "windowed"), max_turns=6)
+        summarizer = RollingSummarizer(windowed, min_new=4, max_chars=1200)
+
+        sizes_full, sizes_sum, path_us = [], [], []
+        for i in range(args.turns):
+            msg = rnd.choice(TOPICS)
+            reply = "That sounds like a lot. I'm here with you. " * rnd.randint(1, 4)
+
+            sizes_full.append(_prompt_tokens(pa, pa.build(SYSTEM, full.load_messages("companion", "doug"), msg)))
+
+            t0 = time.perf_counter()
+            summary = summarizer.get("companion", "doug")
+            block = f"Summary of the earlier conversation:\n{summary}" if summary else None
+            messages = pa.build(SYSTEM, windowed.load_messages("companion", "doug"), msg, memory_block=block)
+            path_us.append(time.perf_counter() - t0)
+            sizes_sum.append(_prompt_tokens(pa, messages))
+
+            full.append_turn("companion", msg, reply, "doug")
+            windowed.append_turn("companion", msg, reply, "doug")
+            t0 = time.perf_counter()
+            summarizer.schedule("companion", "doug")
+            path_us[-1] += time.perf_counter() - t0
+            summarizer.flush()
+
+        t0 = time.perf_counter()
+        for _ in range(200):
+            windowed.append_turn("companion", "filler message to evict.", "ok", "doug")
+        summarizer.schedule("companion", "doug")
+        summarizer.flush()
+        fold_ms = (time.perf_counter() - t0) * 1000
+
+        print(f"{args.turns}-turn conversation, prompt tokens per request (approx. when tiktoken is missing)")
+        for name, sizes in (("full history", sizes_full), ("6 turns + summary", sizes_sum)):
+            print(f"  {name:<18} turn 10 {sizes[9]:6d}   turn 50 {sizes[49]:6d}   turn {args.turns} {sizes[-1]:6d}   "
+                  f"mean {sum(sizes) / len(sizes):8.0f}")
+        path_us.sort()
+        print(f"request path (load window + summary get + schedule): p50 {path_us[len(path_us) // 2] * 1e6:.0f} us")
+        print(f"200 appended turns + one background fold: {fold_ms:.1f} ms; {summarizer.stats()}")
+        summarizer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# bench/bench_user_store.py
+#
+# User lookup / signup at scale: the old identity/users.py JSON list (full
+# file read + linear scan per login, full rewrite per signup) vs the SQLite
+# user store, plus the one-shot migration and a concurrent-signup check.
+# bcrypt is left out -- it costs the same either way.
+#
+#   python bench/bench_user_store.py [--users 1000000] [--lookups 20000]
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from identity.user_store import UserStore  # noqa: E402
+
+FAKE_HASH = "$2b$12$" + "x" * 53
+
+
+def _legacy_load(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _legacy_find(path, username):
+    for u in _legacy_load(path)["users"]:
+        if u["username"] == username:
+            return u
+    return None
+
+
+def _legacy_create(path, username):
+    data = _legacy_load(path)
+    for u in data["users"]:
+        if u["username"] == username:
+            return False
+    data["users"].append({"username": username, "password": FAKE_HASH})
+    with open(path, "w") as f:
+        json.dump(data, f)
+    return True
+
+
+def _signup_race(create, threads: int, per_thread: int) -> int:
+    def worker(t: int) -> None:
+        for i in range(per_thread):
+            try:
+                create(f"race-{t}-{i}")
+            except ValueError:
+                pass  # read another thread's half-written file
+
+    ts = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return threads * per_thread
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1_000_000)
+    ap.add_argument("--lookups", type=int, default=20000)
+    ap.add_argument("--legacy-ops", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "users.json")
+        names = [f"user{i}" for i in range(args.users)]
+        with open(legacy, "w") as f:
+            json.dump({"users": [{"username": n, "password": FAKE_HASH} for n in names]}, f)
+        print(f"{args.users:,} users, legacy file {os.path.getsize(legacy) / 1e6:.0f} MB")
+
+        # ----- before -----
+        t0 = time.perf_counter()
+        for _ in range(args.legacy_ops):
+            _legacy_find(legacy, random.choice(names))
+        legacy_login = (time.perf_counter() - t0) / args.legacy_ops
+
+        t0 = time.perf_counter()
+        for i in range(args.legacy_ops):
+            _legacy_create(legacy, f"new-legacy-{i}")
+        legacy_signup = (time.perf_counter() - t0) / args.legacy_ops
+
+        # ----- migration -----
+        store = UserStore(os.path.join(tmp, "users.db"), cache_entries=0)
+        t0 = time.perf_counter()
+        imported = store.import_json(legacy, hash_password=lambda p: FAKE_HASH)
+        migrate_s = time.perf_counter() - t0
+        again = store.import_json(legacy, hash_password=lambda p: FAKE_HASH)
+
+        # ----- after -----
+        sample = random.sample(names, min(args.lookups, len(names)))
+        t0 = time.perf_counter()
+        for n in sample:
+            assert store.get(n) is not None
+        store_login = (time.perf_counter() - t0) / len(sample)
+
+        t0 = time.perf_counter()
+        for i in range(1000):
+            store.add(f"new-store-{i}", FAKE_HASH)
+        store_signup = (time.perf_counter() - t0) / 1000
+
+        print(f"migration     {imported:,} users in {migrate_s:.1f}s (second run imported {again})")
+        print(f"login lookup  before {legacy_login * 1e3:9.1f} ms   after {store_login * 1e6:6.1f} us")
+        print(f"signup        before {legacy_signup * 1e3:9.1f} ms   after {store_signup * 1e6:6.1f} us")
+
+        # ----- concurrent signups (small file so the legacy path finishes) -----
+        small = os.path.join(tmp, "small.json")
+        with open(small, "w") as f:
+            json.dump({"users": []}, f)
+        tried = _signup_race(lambda n: _legacy_create(small, n), threads=8, per_thread=50)
+        try:
+            kept = len(_legacy_load(small)["users"])
+        except ValueError:
+            kept = "file corrupted"
+        race_store = UserStore(os.path.join(tmp, "race.db"))
+        _signup_race(lambda n: race_store.add(n, FAKE_HASH), threads=8, per_thread=50)
+        print(f"concurrent    {tried} signups: legacy kept {kept}, store kept {race_store.count()}")
+
+
+if __name__ == "__main__":
+    main()
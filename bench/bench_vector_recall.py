@@ -0,0 +1,162 @@
+# bench/bench_vector_recall.py
+#
+# Embedding recall over user facts (core/vector_recall.py):
+#   - embedding throughput, one call per fact vs batches of SHINE_VECTOR_BATCH
+#   - one heavy user with --big facts: exact float32 scan vs the int8 flat
+#     scan vs int8 IVF, latency and recall@10 against the float32 result,
+#     and bytes per fact
+#   - --users users with --facts facts each, built with sync() from
+#     memory.db: build time, cold open + first query, warm queries
+#   - whether one old fact, planted before the user's other facts, makes
+#     it into the 20 rows the prompt gets (recent-20 vs vector)
+#   - the cost of a write: one new fact for a light and for the heavy user
+#
+#   python bench/bench_vector_recall.py [--users 2000] [--facts 40] [--big 50000]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from itertools import accumulate
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.memory_db import MemoryDB, SQL_INSERT  # noqa: E402
+from core.vector_recall import VectorRecall, _UserIndex, fact_text  # noqa: E402
+
+TOPICAL = (
+    "walk beach work roster nights sister brother mum dad dentist thursday guitar school money "
+    "sleep coffee dog cat garden rain movie book friend party birthday holiday train car doctor "
+    "anxiety football netball cooking pasta curry bike gym yoga paint music piano exam job boss"
+).split()
+_SYL = ("ka", "lo", "mi", "ne", "su", "ta", "ri", "po", "de", "va", "zu", "sh", "or", "en")
+# Word frequencies in chat text fall off roughly as 1/rank (Zipf)
+WORDS = TOPICAL + sorted({a + b + c for a in _SYL for b in _SYL for c in _SYL})[:3000]
+CUM = list(accumulate(1.0 / (r + 1) ** 1.05 for r in range(len(WORDS))))
+
+
+def _text(rnd, n):
+    return " ".join(rnd.choices(WORDS, cum_weights=CUM, k=n))
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] * 1e6
+
+
+def _timed(fn, items):
+    lat, out = [], []
+    for item in items:
+        t0 = time.perf_counter()
+        out.append(fn(item))
+        lat.append(time.perf_counter() - t0)
+    return lat, out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--facts", type=int, default=40)
+    ap.add_argument("--big", type=int, default=50000)
+    ap.add_argument("--queries", type=int, default=500)
+    args = ap.parse_args()
+    rnd = random.Random(5)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorRecall(os.path.join(tmp, "vectors"), flush_ms=3600 * 1000)
+        emb = index.embedder
+
+        texts = [fact_text(f"note_{i}", _text(rnd, 6)) for i in range(5000)]
+        t0 = time.perf_counter()
+        for t in texts[:1000]:
+            emb.embed([t])
+        single = 1000 / (time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for i in range(0, len(texts), index.batch):
+            emb.embed(texts[i:i + index.batch])
+        batched = len(texts) / (time.perf_counter() - t0)
+        print(f"{emb.name}: {single:,.0f} facts/s one at a time, {batched:,.0f} facts/s in batches of {index.batch}")
+
+        # ----- one heavy user -----
+        big = [(f"note_{i}", _text(rnd, 6)) for i in range(args.big)]
+        full = np.concatenate([emb.embed([fact_text(k, v) for k, v in big[i:i + 1024]]) for i in range(0, len(big), 1024)])
+        for k, v in big:
+            index.add("heavy", k, v)
+        t0 = time.perf_counter()
+        index.flush()
+        big_build = time.perf_counter() - t0
+        ivf = _UserIndex(index.path_for("heavy"))
+        flat_dir = os.path.join(tmp, "flat")
+        flat_index = VectorRecall(flat_dir, embedder=emb, ivf_min=args.big + 1, flush_ms=3600 * 1000)
+        for k, v in big:
+            flat_index.add("heavy", k, v)
+        flat_index.flush()
+        flat = _UserIndex(flat_index.path_for("heavy"))
+        flat_index.close()
+
+        qs = emb.embed([_text(rnd, 8) for _ in range(args.queries)])
+        keys = [k for k, _ in big]
+
+        def exact(q):
+            s = full @ q
+            return [keys[i] for i in np.argpartition(-s, 10)[:10]]
+
+        lat_exact, truth = _timed(exact, qs)
+        print(f"\none user, {args.big} facts, top-10 of {args.queries} queries (IVF: {ivf.nlist} lists, nprobe {index.nprobe})")
+        print(f"  {'float32 exact scan':<22} p50 {_pct(lat_exact, 0.5):8.1f} us   p99 {_pct(lat_exact, 0.99):8.1f} us"
+              f"   recall@10 100.0%   {full.nbytes / args.big:5.0f} B/fact")
+        for name, mapped in (("int8 flat scan", flat), ("int8 IVF", ivf)):
+            lat, got = _timed(lambda q: [mapped.row(i)[0] for i, _ in mapped.search(q, 10, index.nprobe)], qs)
+            recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(truth, got)])
+            per = (mapped.vectors.nbytes + mapped.scales.nbytes) / args.big
+            print(f"  {name:<22} p50 {_pct(lat, 0.5):8.1f} us   p99 {_pct(lat, 0.99):8.1f} us"
+                  f"   recall@10 {recall:6.1%}   {per:5.0f} B/fact")
+        print(f"  built in {big_build:.2f}s, file {os.path.getsize(index.path_for('heavy')) / 1e6:.1f} MB")
+
+        # ----- many light users, built from memory.db -----
+        db = MemoryDB(os.path.join(tmp, "memory.db"))
+        rows = []
+        for u in range(args.users):
+            # The planted fact is the user's oldest: invisible to "newest 20"
+            rows.append((str(u), "allergy", "penicillin allergy, told the doctor in 2019"))
+            rows += [(str(u), f"note_{i}", _text(rnd, 6)) for i in range(args.facts - 1)]
+        with db.connection() as conn:
+            conn.executemany(SQL_INSERT, rows)
+            conn.commit()
+        t0 = time.perf_counter()
+        index.sync(db)
+        sync_s = time.perf_counter() - t0
+        print(f"\nsync: {len(rows)} facts for {args.users} users in {sync_s:.1f}s ({len(rows) / sync_s:,.0f} facts/s)")
+
+        cold = VectorRecall(os.path.join(tmp, "vectors"), flush_ms=3600 * 1000)
+        users = [str(rnd.randrange(args.users)) for _ in range(args.queries)]
+        lat_cold, _ = _timed(lambda u: cold.top_k(u, _text(rnd, 8), 20), users)
+        lat_warm, _ = _timed(lambda u: cold.top_k(u, _text(rnd, 8), 20), users)
+        print(f"  top-20, first query of a user (open + map)   p50 {_pct(lat_cold, 0.5):7.1f} us   p99 {_pct(lat_cold, 0.99):7.1f} us")
+        print(f"  top-20, mapped user                          p50 {_pct(lat_warm, 0.5):7.1f} us   p99 {_pct(lat_warm, 0.99):7.1f} us")
+
+        msg = "should I mention my allergy to the doctor?"
+        sample = users[:200]
+        recent = sum(any(k == "allergy" for k, _ in db.load_user_memory(u, 20)) for u in sample) / len(sample)
+        hit = sum(any(k == "allergy" for k, _, _ in cold.top_k(u, msg, 20)) for u in sample) / len(sample)
+        print(f"\n'{msg}': oldest fact in the prompt's 20 rows: recent-20 {recent:.0%}, vector {hit:.0%}")
+
+        for name, user in (("light user", users[0]), ("heavy user", "heavy")):
+            lat = []
+            for i in range(20):
+                cold.add(user, f"extra_{i}", _text(rnd, 6))
+                t0 = time.perf_counter()
+                cold.flush()
+                lat.append(time.perf_counter() - t0)
+            print(f"write one fact, {name:<10} p50 {_pct(lat, 0.5) / 1000:7.2f} ms")
+        cold.close()
+        index.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# bench/fake_openai.py
+#
+# Local stand-in for the OpenAI Chat Completions API with failure injection.
+# Point an engine at it with OPENAI_BASE_URL=http://127.0.0.1:8099/v1
+#
+#   python bench/fake_openai.py [--port 8099] [--latency 0.05] [--fail-rate 0.2]
+#                               [--fail-status 503] [--retry-after 1]
+#
+# A scripted sequence of outcomes can be pushed at runtime, consumed one per
+# request before the random --fail-rate kicks in:
+#
+#   POST /_fake/script  {"script": [503, 429, 200], "retry_after": 1}
+#   GET  /_fake/stats
+#
+# serve(..., certfile=...) speaks HTTPS with that PEM (cert + key), for
+# measuring TLS handshakes.
+
+import argparse
+import json
+import random
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+class FakeState:
+    def __init__(
+        self,
+        latency_s: float = 0.0,
+        fail_rate: float = 0.0,
+        fail_status: int = 503,
+        retry_after: Optional[float] = None,
+        reply: str = "I hear you.",
+    ) -> None:
+        self.latency_s = latency_s
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.reply = reply
+        self.script: List[int] = []
+        self.requests = 0
+        self.connections = 0
+        self.by_status: Dict[int, int] = {}
+        self.lock = threading.Lock()
+
+    def next_status(self) -> int:
+        with self.lock:
+            self.requests += 1
+            if self.script:
+                status = self.script.pop(0)
+            elif self.fail_rate and random.random() < self.fail_rate:
+                status = self.fail_status
+            else:
+                status = 200
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+            return status
+
+
+def _usage(text: str) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": 10,
+        "completion_tokens": len(text.split()),
+        "total_tokens": 10 + len(text.split()),
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def _completion(model: str, text: str) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-fake-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": _usage(text),
+    }
+
+
+def make_handler(state: FakeState):
+    class FakeOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def setup(self):
+            with state.lock:
+                state.connections += 1
+            super().setup()
+
+        def _json(self, status: int, obj: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            body = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> Dict[str, Any]:
+            n = int(self.headers.get("Content-Length", 0) or 0)
+            try:
+                return json.loads(self.rfile.read(n) or b"{}")
+            except Exception:
+                return {}
+
+        def do_GET(self):
+            if self.path == "/_fake/stats":
+                with state.lock:
+                    self._json(200, {"requests": state.requests, "connections": state.connections, "by_status": state.by_status})
+                return
+            self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            data = self._body()
+
+            if self.path == "/_fake/script":
+                with state.lock:
+                    state.script = [int(x) for x in data.get("script", [])]
+                    if "retry_after" in data:
+                        state.retry_after = data["retry_after"]
+                self._json(200, {"ok": True})
+                return
+
+            if not self.path.endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+
+            if state.latency_s:
+                time.sleep(state.latency_s)
+
+            status = state.next_status()
+            if status != 200:
+                headers = {}
+                if state.retry_after is not None:
+                    headers["Retry-After"] = str(state.retry_after)
+                self._json(status, {"error": {"message": f"injected {status}", "type": "fake"}}, headers)
+                return
+
+            model = data.get("model", "fake")
+            if not data.get("stream"):
+                self._json(200, _completion(model, state.reply))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for word in state.reply.split(" "):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            if (data.get("stream_options") or {}).get("include_usage"):
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [], "usage": _usage(state.reply)}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return FakeOpenAIHandler
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(
+    port: int = 8099,
+    state: Optional[FakeState] = None,
+    background: bool = False,
+    certfile: Optional[str] = None,
+) -> ThreadingHTTPServer:
+    """
+    Start the fake server. With background=True it runs on a daemon thread and
+    the server is returned (call .shutdown() when done).
+    """
+    state = state or FakeState()
+    server = FakeServer(("127.0.0.1", port), make_handler(state))
+    if certfile:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(certfile)
+        server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    server.state = state  # type: ignore[attr-defined]
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--latency", type=float, default=0.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--fail-status", type=int, default=503)
+    ap.add_argument("--retry-after", type=float, default=None)
+    args = ap.parse_args()
+
+    print(f"Fake OpenAI listening on http://127.0.0.1:{args.port}/v1")
+    serve(args.port, FakeState(args.latency, args.fail_rate, args.fail_status, args.retry_after))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,123 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import QueueHandler, QueueListener
 import json
+import logging
+import os
+import queue
+import sys
+import threading
+
+from providers.canned import reply_for
 
 PORT = 8050
 
+# Requests larger than this are refused with 413 before the body is read
+MAX_BODY_BYTES = int(os.getenv("BRAIN_MAX_BODY_BYTES", "65536"))
+# Idle keep-alive connections are closed after this many seconds
+IDLE_TIMEOUT_S = float(os.getenv("BRAIN_IDLE_TIMEOUT_S", "15"))
+# BRAIN_ACCESS_LOG=0 turns the per-request log line off
+ACCESS_LOG = os.getenv("BRAIN_ACCESS_LOG", "1") != "0"
+
+# Access log lines go through a queue; a listener thread does the actual
+# (buffered) stdout writes, so a slow terminal never holds up a request.
+log = logging.getLogger("brain")
+log.setLevel(logging.INFO)
+log.propagate = False
+_log_queue = queue.SimpleQueue()
+log.addHandler(QueueHandler(_log_queue))
+_stdout = logging.StreamHandler(sys.stdout)
+_stdout.setFormatter(logging.Formatter("%(message)s"))
+_listener = QueueListener(_log_queue, _stdout)
+_listener_started = False
+
+
 class SafeSpaceHandler(BaseHTTPRequestHandler):
 
+    # HTTP/1.1: connections stay open between requests (keep-alive)
+    protocol_version = "HTTP/1.1"
+    timeout = IDLE_TIMEOUT_S
+
     def log_message(self, format, *args):
-        print("Connection:", format % args)
+        if ACCESS_LOG:
+            log.info("Connection: %s", format % args)
+
+    def _send_json(self, status, obj, close=False):
+        response = json.dumps(obj).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Access-Control-Allow-Origin","*")
+        self.send_header("Content-Length",str(len(response)))
+        if close:
+            self.send_header("Connection","close")
+        self.end_headers()
+
+        self.wfile.write(response)
 
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Headers", "Content-Type")
         self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def do_POST(self):
 
-        content_length = int(self.headers.get('Content-Length', 0))
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            content_length = -1
+
+        if content_length < 0 or content_length > MAX_BODY_BYTES:
+            # The body is never read, so the connection can't be reused
+            if content_length < 0:
+                self._send_json(400, {"error": "invalid Content-Length"}, close=True)
+            else:
+                self._send_json(413, {"error": f"request body over {MAX_BODY_BYTES} bytes"}, close=True)
+            return
+
         body = self.rfile.read(content_length)
 
         try:
             data = json.loads(body.decode())
-            msg = data.get("message","").lower()
-
-            if "name" in msg:
-                reply = "Your name is Doug. I am here."
-            else:
-                reply = "I hear you Doug."
+            reply = reply_for(data.get("message",""))
 
         except Exception as e:
             reply = "Brain connected."
 
-        response = json.dumps({"reply": reply}).encode()
+        self._send_json(200, {"reply": reply})
 
-        self.send_response(200)
-        self.send_header("Content-Type","application/json")
-        self.send_header("Access-Control-Allow-Origin","*")
-        self.send_header("Content-Length",str(len(response)))
-        self.end_headers()
 
-        self.wfile.write(response)
+class BrainServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(port=PORT, background=False):
+    """
+    Start the brain on 127.0.0.1:port. With background=True it runs on a
+    daemon thread and the server is returned (call .shutdown() when done).
+    """
+    global _listener_started
+
+    server = BrainServer(("127.0.0.1", port), SafeSpaceHandler)
+    if not _listener_started:
+        _listener.start()
+        _listener_started = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    try:
+        server.serve_forever()
+    finally:
+        _listener.stop()
+        _listener_started = False
+    return server
+
 
-print("SafeSpace Brain Active")
-print("Listening on port", PORT)
+if __name__ == "__main__":
+    print("SafeSpace Brain Active")
+    print("Listening on port", PORT)
 
-HTTPServer(("127.0.0.1",PORT), SafeSpaceHandler).serve_forever()
+    serve(PORT)
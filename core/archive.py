@@ -0,0 +1,392 @@
+# core/archive.py
+#
+# Columnar, memory-mapped segments for conversation history that has left
+# the MemoryStore window. One segment holds lines [start, stop) of one
+# memory_<mode>.jsonl and sits next to it as memory_<mode>.<start>-<stop>.seg.
+#
+# Layout (little-endian, every column 8-byte aligned):
+#
+#   header   64 bytes  magic "SHSEG001", version, flags, count, start_line,
+#                      heap_len, meta_len
+#   meta     JSON      {"source", "mode", ...}
+#   ts       int64[count]       unix seconds
+#   role     uint8[count]       0 user, 1 assistant, 2 system, 3 other
+#   offsets  uint64[count + 1]  row i's text is heap[offsets[i]:offsets[i+1]]
+#   heap     utf-8 bytes
+#
+#   python -m core.archive compact DATA_DIR [--keep 12] [--min-lines 1000]
+#   python -m core.archive convert FILE.jsonl OUT.seg
+#   python -m core.archive show FILE.seg [--page 0] [--find TEXT]
+
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b"SHSEG001"
+VERSION = 1
+FLAG_TS_SORTED = 1
+_HEADER = struct.Struct("<8sIIQQQI20x")  # 64 bytes
+
+ROLES = ("user", "assistant", "system", "other")
+_ROLE_CODE = {name: i for i, name in enumerate(ROLES)}
+
+_SEGMENT_NAME = re.compile(r"^(memory_.+)\.(\d+)-(\d+)\.seg$")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def _pad(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+def write_segment(
+    path: str,
+    rows: Iterable[Tuple[int, str, str]],
+    start_line: int = 0,
+    meta: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Write (ts, role, content) rows as a segment, atomically (tmp + rename).
+    Returns the row count.
+    """
+    ts = array("q")
+    roles = bytearray()
+    offsets = array("Q", [0])
+    heap = bytearray()
+    for t, role, content in rows:
+        ts.append(int(t or 0))
+        roles.append(_ROLE_CODE.get(role, 3))
+        heap += content.encode("utf-8")
+        offsets.append(len(heap))
+    if sys.byteorder != "little":
+        ts.byteswap()
+        offsets.byteswap()
+
+    count = len(roles)
+    flags = FLAG_TS_SORTED if all(ts[i] <= ts[i + 1] for i in range(count - 1)) else 0
+    meta_raw = json.dumps(meta or {}, ensure_ascii=False).encode("utf-8")
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, flags, count, start_line, len(heap), len(meta_raw)))
+        for block in (meta_raw, ts.tobytes(), bytes(roles), offsets.tobytes()):
+            f.write(block)
+            f.write(b"\0" * _pad(len(block)))
+        f.write(heap)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+class Segment:
+    """
+    Read-only view of a segment file. Columns are memoryviews straight over
+    the mmap, so opening costs one header parse and slicing a column or a
+    string copies nothing; text is only decoded for the rows asked for.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path}: not a segment")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.flags, self.count, self.start_line, heap_len, meta_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path}: not a segment")
+
+        pos = _HEADER.size
+        self.meta = json.loads(self._mm[pos:pos + meta_len] or b"{}")
+        pos += meta_len + _pad(meta_len)
+        buf = memoryview(self._mm)
+        n = self.count
+        self.ts = buf[pos:pos + 8 * n].cast("q")
+        pos += 8 * n
+        self._roles_start = pos
+        self.roles = buf[pos:pos + n]
+        pos += n + _pad(n)
+        self.offsets = buf[pos:pos + 8 * (n + 1)].cast("Q")
+        pos += 8 * (n + 1)
+        self._heap_start = pos
+        self.heap = buf[pos:pos + heap_len]
+        self._views = [self.ts, self.roles, self.offsets, self.heap, buf]
+
+    @property
+    def stop_line(self) -> int:
+        return self.start_line + self.count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def raw(self, i: int) -> memoryview:
+        # Zero-copy utf-8 bytes of row i
+        return self.heap[self.offsets[i]:self.offsets[i + 1]]
+
+    def text(self, i: int) -> str:
+        return str(self.raw(i), "utf-8")
+
+    def role(self, i: int) -> str:
+        return ROLES[self.roles[i]]
+
+    def row(self, i: int) -> Dict[str, Any]:
+        return {"line": self.start_line + i, "ts": self.ts[i], "role": ROLES[self.roles[i]], "content": self.text(i)}
+
+    def page(self, start: int = 0, n: int = 100) -> List[Dict[str, Any]]:
+        return [self.row(i) for i in range(max(0, start), min(self.count, start + n))]
+
+    def ts_range(self, since: Optional[int] = None, until: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Row range [lo, hi) with since <= ts < until; a binary search when
+        the timestamps are in order, which they are for append-only logs.
+        """
+        if not self.flags & FLAG_TS_SORTED:
+            rows = [i for i in range(self.count) if (since is None or self.ts[i] >= since) and (until is None or self.ts[i] < until)]
+            return (rows[0], rows[-1] + 1) if rows else (0, 0)
+        lo = bisect_left(self.ts, since) if since is not None else 0
+        hi = bisect_left(self.ts, until) if until is not None else self.count
+        return lo, max(lo, hi)
+
+    def rows_with_role(self, role: str, lo: int = 0, hi: Optional[int] = None) -> Iterator[int]:
+        # memoryview has no find(), so scan the role column through the mmap
+        code = bytes([_ROLE_CODE[role]])
+        hi = self.count if hi is None else hi
+        start = self._roles_start
+        pos = self._mm.find(code, start + lo, start + hi)
+        while pos != -1:
+            yield pos - start
+            pos = self._mm.find(code, pos + 1, start + hi)
+
+    def find(
+        self,
+        needle: str,
+        role: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Rows whose text contains needle (case-sensitive), optionally
+        limited to a role and a ts window. The heap is searched with
+        mmap.find and hits are mapped back to rows through the offset
+        table, so nothing is decoded.
+        """
+        lo, hi = self.ts_range(since, until)
+        if lo >= hi:
+            return []
+        code = _ROLE_CODE[role] if role is not None else None
+        pat = needle.encode("utf-8")
+        end = self._heap_start + self.offsets[hi]
+        pos = self._mm.find(pat, self._heap_start + self.offsets[lo], end)
+        out: List[int] = []
+        while pos != -1:
+            i = bisect_right(self.offsets, pos - self._heap_start, lo, hi + 1) - 1
+            row_end = self._heap_start + self.offsets[i + 1]
+            if pos + len(pat) > row_end:
+                # runs into the next row's text: not a match
+                pos = self._mm.find(pat, pos + 1, end)
+                continue
+            if code is None or self.roles[i] == code:
+                out.append(i)
+                if limit is not None and len(out) >= limit:
+                    break
+            # next row: one hit per row
+            pos = self._mm.find(pat, row_end, end)
+        return out
+
+    def close(self) -> None:
+        # Slices handed out by raw() must be released first
+        for v in getattr(self, "_views", []):
+            v.release()
+        self._views = []
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self) -> "Segment":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class Archive:
+    """
+    The segments of one conversation file, in line order, read as one
+    sequence: page() and find() work on global line numbers.
+    """
+
+    def __init__(self, jsonl_path: str) -> None:
+        self.segments = [Segment(p) for p in segment_paths(jsonl_path)]
+
+    def __len__(self) -> int:
+        return sum(s.count for s in self.segments)
+
+    def page(self, start: int = 0, n: int = 100) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for s in self.segments:
+            if len(out) >= n:
+                break
+            if s.stop_line <= start:
+                continue
+            first = max(0, start - s.start_line)
+            out.extend(s.page(first, n - len(out)))
+        return out
+
+    def find(self, needle: str, limit: Optional[int] = None, **kw: Any) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for s in self.segments:
+            left = None if limit is None else limit - len(out)
+            if left == 0:
+                break
+            out.extend(s.row(i) for i in s.find(needle, limit=left, **kw))
+        return out
+
+    def close(self) -> None:
+        for s in self.segments:
+            s.close()
+        self.segments = []
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+# -------------------------
+# compaction
+# -------------------------
+
+def segment_paths(jsonl_path: str) -> List[str]:
+    # memory_<mode>.<start>-<stop>.seg next to memory_<mode>.jsonl, by start
+    folder = os.path.dirname(jsonl_path) or "."
+    stem = os.path.basename(jsonl_path)[:-len(".jsonl")]
+    found = []
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    for name in names:
+        m = _SEGMENT_NAME.match(name)
+        if m and m.group(1) == stem:
+            found.append((int(m.group(2)), os.path.join(folder, name)))
+    return [p for _, p in sorted(found)]
+
+
+def _archived_upto(jsonl_path: str) -> int:
+    paths = segment_paths(jsonl_path)
+    if not paths:
+        return 0
+    return int(_SEGMENT_NAME.match(os.path.basename(paths[-1])).group(3))
+
+
+def _read_lines(path: str, start: int, stop: int) -> Iterator[Tuple[int, str, str]]:
+    with open(path, "rb") as f:
+        for n, ln in enumerate(f):
+            if n >= stop:
+                break
+            if n < start:
+                continue
+            try:
+                obj = json.loads(ln)
+            except ValueError:
+                yield 0, "other", ln.decode("utf-8", "replace").rstrip("\n")
+                continue
+            content = obj.get("content")
+            yield obj.get("ts") or 0, obj.get("role") or "other", content if isinstance(content, str) else json.dumps(content)
+
+
+def _line_count(path: str) -> int:
+    n = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            n += block.count(b"\n")
+    return n
+
+
+def compact_file(jsonl_path: str, keep: int, min_lines: int) -> Optional[str]:
+    """
+    Archive the closed part of one history file: lines after the last
+    segment up to the newest `keep` lines (still in the window, still being
+    written). Skipped when fewer than min_lines would go in. The JSONL is
+    left alone -- MemoryStore's offset index and the summarizer's cursor
+    count its lines.
+    """
+    start = _archived_upto(jsonl_path)
+    stop = _line_count(jsonl_path) - keep
+    if stop - start < max(1, min_lines):
+        return None
+    stem = jsonl_path[:-len(".jsonl")]
+    out = f"{stem}.{start}-{stop}.seg"
+    meta = {"source": os.path.basename(jsonl_path), "mode": os.path.basename(stem)[len("memory_"):]}
+    write_segment(out, _read_lines(jsonl_path, start, stop), start_line=start, meta=meta)
+    return out
+
+
+def compact(data_dir: str, keep: Optional[int] = None, min_lines: Optional[int] = None) -> List[str]:
+    """
+    compact_file() for every memory_*.jsonl under data_dir, shared files
+    and per-user shards alike. Returns the segments written.
+    """
+    keep = keep if keep is not None else _env_int("SHINE_ARCHIVE_KEEP_LINES", 2 * _env_int("SHINE_MEMORY_TURNS", 6))
+    min_lines = min_lines if min_lines is not None else _env_int("SHINE_ARCHIVE_MIN_LINES", 1000)
+    written = []
+    for root, _, names in os.walk(data_dir):
+        for name in names:
+            if name.startswith("memory_") and name.endswith(".jsonl"):
+                out = compact_file(os.path.join(root, name), keep, min_lines)
+                if out:
+                    written.append(out)
+    return written
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Columnar archive segments for memory_*.jsonl")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("compact")
+    c.add_argument("data_dir")
+    c.add_argument("--keep", type=int, default=None)
+    c.add_argument("--min-lines", type=int, default=None)
+    v = sub.add_parser("convert")
+    v.add_argument("jsonl")
+    v.add_argument("out")
+    s = sub.add_parser("show")
+    s.add_argument("segment")
+    s.add_argument("--page", type=int, default=0)
+    s.add_argument("--size", type=int, default=20)
+    s.add_argument("--find", default=None)
+    args = ap.parse_args()
+
+    if args.cmd == "compact":
+        for out in compact(args.data_dir, args.keep, args.min_lines):
+            print(out)
+    elif args.cmd == "convert":
+        n = write_segment(args.out, _read_lines(args.jsonl, 0, sys.maxsize), meta={"source": os.path.basename(args.jsonl)})
+        print(f"{n} rows -> {args.out}")
+    else:
+        with Segment(args.segment) as seg:
+            rows = [seg.row(i) for i in seg.find(args.find, limit=args.size)] if args.find else seg.page(args.page * args.size, args.size)
+            print(json.dumps({"rows": len(seg), "start_line": seg.start_line, "meta": seg.meta}))
+            for r in rows:
+                print(json.dumps(r, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# core/command_log.py
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from core.writer import ASYNC, GroupCommitWriter, durability_from_env
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+_LINE = re.compile(r"^\[([^\]]+)\] (.*)$")
+
+
+class CommandLog:
+    """
+    Line log of bridge commands ("[iso-timestamp] command").
+
+    - append() only touches memory: the entry goes into a ring buffer of the
+      last tail_size commands and onto a GroupCommitWriter, whose thread
+      writes batches through one long-lived file handle (async by default,
+      BRIDGE_LOG_DURABILITY=sync|batched|async)
+    - tail() is served from the ring buffer, which is seeded from the end of
+      the existing file at startup
+    - when the file passes max_bytes it is rotated: path -> path.1 -> ... ->
+      path.<backups>, oldest dropped
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        tail_size: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        backups: Optional[int] = None,
+        durability: Optional[str] = None,
+    ) -> None:
+        self.path = path or os.getenv("BRIDGE_LOG_PATH", "bridge.log")
+        self.tail_size = max(1, tail_size or _env_int("BRIDGE_LOG_TAIL", 200))
+        self.max_bytes = max_bytes or _env_int("BRIDGE_LOG_MAX_BYTES", 5 * 1024 * 1024)
+        self.backups = max(0, backups if backups is not None else _env_int("BRIDGE_LOG_BACKUPS", 3))
+
+        self._recent: "deque[Dict[str, str]]" = deque(maxlen=self.tail_size)
+        self._lock = threading.Lock()
+        # Guards _file / _size / rotation. In sync mode request threads
+        # commit their own batches, so commits and rotations can overlap.
+        self._file_lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self.rotations = 0
+
+        self._seed()
+
+        self._writer = GroupCommitWriter(
+            self._commit_batch,
+            mode=durability or durability_from_env("BRIDGE_LOG_DURABILITY", ASYNC),
+            max_batch=_env_int("BRIDGE_LOG_BATCH", 256),
+            interval_s=_env_int("BRIDGE_LOG_FLUSH_MS", 200) / 1000.0,
+            name="bridge-log-writer",
+        )
+
+    def _seed(self) -> None:
+        # Last ~64 KiB of the current file, read once at startup
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(0, size - 65536))
+                chunk = f.read()
+        except OSError:
+            return
+        lines = chunk.decode("utf-8", "replace").splitlines()
+        if size > 65536 and lines:
+            lines = lines[1:]  # probably cut mid-line
+        for line in lines:
+            m = _LINE.match(line)
+            if m:
+                self._recent.append({"ts": m.group(1), "command": m.group(2)})
+
+    def append(self, command: str) -> Dict[str, str]:
+        # One command per line, whatever the client sent
+        command = command.replace("\r", " ").replace("\n", " ")
+        entry = {"ts": datetime.now().isoformat(), "command": command}
+        with self._lock:
+            self._recent.append(entry)
+        self._writer.submit(f"[{entry['ts']}] {command}\n")
+        return entry
+
+    def tail(self, n: int = 50) -> List[Dict[str, str]]:
+        with self._lock:
+            if n <= 0:
+                return []
+            return list(self._recent)[-n:]
+
+    # ----- writer thread (or the caller's thread in sync mode) -----
+
+    def _open(self) -> None:
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def _rotate(self) -> None:
+        # Caller holds _file_lock
+        self._file.close()
+        self._file = None
+        if self.backups:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+
+    def _commit_batch(self, lines: List[str]) -> None:
+        data = "".join(lines)
+        with self._file_lock:
+            if self._file is None:
+                self._open()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data.encode("utf-8"))
+            if self._size >= self.max_bytes:
+                self._rotate()
+
+    # ----- lifecycle -----
+
+    def flush(self, timeout_s: Optional[float] = None) -> bool:
+        return self._writer.flush(timeout_s)
+
+    def close(self) -> None:
+        self._writer.close()
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._writer.stats()
+        stats.update({"path": self.path, "recent": len(self._recent), "rotations": self.rotations})
+        return stats
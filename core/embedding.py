@@ -0,0 +1,172 @@
+# core/embedding.py
+import math
+import os
+import re
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.memory_db import _STOPWORDS, _WORD
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+# Local, model-free text embedding: hashed character trigrams plus word
+# unigrams, signed and L2-normalised. Good enough to tell that
+# "are you there?" and "you there" are the same check-in; no network, no model
+# download.
+
+DIM = 256
+
+_NON_WORD = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    text = _NON_WORD.sub(" ", (text or "").lower())
+    return _SPACE.sub(" ", text).strip()
+
+
+def _features(text: str) -> List[str]:
+    feats = text.split()
+    padded = f" {text} "
+    feats.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return feats
+
+
+def embed(text: str, dim: int = DIM) -> List[float]:
+    vec = [0.0] * dim
+    for feat in _features(normalize(text)):
+        h = zlib.crc32(feat.encode("utf-8"))
+        vec[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec))
+    if norm:
+        vec = [v / norm for v in vec]
+    return vec
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    # Inputs from embed() are already unit length
+    return sum(x * y for x, y in zip(a, b))
+
+
+# Batched numpy form for vector recall (core/vector_recall.py): same idea
+# (hashed words and trigrams, signed, L2-normalised) over memory_db's word
+# rules, plus word bigrams, many texts per call.
+
+_SEEDS = (0, 0x9E3779B1)
+
+
+class HashingEmbedder:
+    """
+    Local, model-free text embedding: words, word bigrams and character
+    trigrams each hashed into two of `dim` signed buckets (log-scaled
+    sums), L2 normalized. No weights to download, deterministic across processes.
+
+    It matches on shared words and word pieces ("allergic" ~ "allergy",
+    "visiting" ~ "visit"), not on meaning; set SHINE_EMBED_MODEL to a local
+    sentence-transformers model directory for that.
+    """
+
+    def __init__(self, dim: Optional[int] = None, cache_words: Optional[int] = None) -> None:
+        self.dim = max(16, dim or _env_int("SHINE_EMBED_DIM", DIM))
+        self.name = f"hash-{self.dim}"
+        self.cache_words = max(0, cache_words if cache_words is not None else _env_int("SHINE_EMBED_CACHE_WORDS", 100000))
+        self._words: Dict[str, Tuple[List[int], List[float]]] = {}
+
+    def _hashed(self, feat: str, weight: float, cols: List[int], vals: List[float]) -> None:
+        raw = feat.encode("utf-8")
+        # Two buckets per feature: one collision only shares half a feature
+        for seed in _SEEDS:
+            h = zlib.crc32(raw, seed)
+            cols.append(h % self.dim)
+            vals.append(weight if h & 0x80000000 else -weight)
+
+    def _word(self, word: str) -> Tuple[List[int], List[float]]:
+        # The word itself plus its trigrams; chat text repeats words, so cache them
+        hit = self._words.get(word)
+        if hit is not None:
+            return hit
+        cols: List[int] = []
+        vals: List[float] = []
+        self._hashed(word, 1.0, cols, vals)
+        padded = f"<{word}>"
+        grams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+        # A word's trigrams together weigh as much as the word, however long it is
+        for g in grams:
+            self._hashed("#" + g, len(grams) ** -0.5, cols, vals)
+        if len(self._words) >= self.cache_words:
+            self._words.clear()
+        if self.cache_words:
+            self._words[word] = (cols, vals)
+        return cols, vals
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        float32 [len(texts), dim], rows L2-normalized (all-zero for texts with
+        no words). One numpy pass per batch.
+        """
+        flat: List[int] = []
+        vals: List[float] = []
+        dim = self.dim
+        for r, text in enumerate(texts):
+            words = [w for w in _WORD.findall((text or "").replace("_", " ").lower()) if w not in _STOPWORDS]
+            cols: List[int] = []
+            for w in words:
+                c, v = self._word(w)
+                cols += c
+                vals += v
+            for a, b in zip(words, words[1:]):
+                self._hashed(a + " " + b, 0.5, cols, vals)
+            base = r * dim
+            flat += [base + c for c in cols]
+        out = np.bincount(flat, weights=vals, minlength=len(texts) * dim).astype(np.float32)
+        out = out.reshape(len(texts), dim)
+        out = np.sign(out) * np.log1p(np.abs(out))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+class SentenceEmbedder:
+    """
+    A sentence-transformers model loaded from a local directory (no
+    downloads); rows L2-normalized like HashingEmbedder's.
+    """
+
+    def __init__(self, model: Any, path: str) -> None:
+        self.model = model
+        self.dim = int(model.get_sentence_embedding_dimension())
+        self.name = f"st-{os.path.basename(os.path.normpath(path))}-{self.dim}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vecs = self.model.encode(list(texts), batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vecs, dtype=np.float32).reshape(len(texts), self.dim)
+
+
+@lru_cache(maxsize=4)
+def get_embedder(model_path: Optional[str] = None) -> Any:
+    """
+    SentenceEmbedder for SHINE_EMBED_MODEL (a local model directory) when
+    sentence-transformers is installed and the model loads; HashingEmbedder
+    otherwise.
+    """
+    path = (model_path or os.getenv("SHINE_EMBED_MODEL", "")).strip()
+    if path:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            print("==== embeddings: sentence-transformers is not installed, using the hashing embedder")
+            return HashingEmbedder()
+        try:
+            return SentenceEmbedder(SentenceTransformer(path, device="cpu", local_files_only=True), path)
+        except Exception as e:
+            print(f"==== embeddings: could not load {path}, using the hashing embedder: {e}")
+    return HashingEmbedder()
@@ -1,12 +1,19 @@
 # core/engine.py
+import asyncio
 import os
+import random
 import time
 import traceback
+from email.utils import parsedate_to_datetime
 from typing import Any, Dict, List, Optional
 
 import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from core import http_pool
+from core.prompt import cache_stats
+from core.resilience import ProviderUnavailable, guard, guard_async
+from core.tracing import span
 
 
 def _env_int(name: str, default: int) -> int:
@@ -23,11 +30,56 @@ def _env_float(name: str, default: float) -> float:
         return default
 
 
+# Upstream statuses worth another attempt; anything else (400, 401, 403, 404,
+# 422, ...) will fail the same way again.
+RETRYABLE_STATUS = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
+class ProviderHTTPError(RuntimeError):
+    def __init__(self, status_code: int, detail: str = "") -> None:
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+        self.retryable = status_code in RETRYABLE_STATUS
+
+
+def _retry_after_s(headers: Any) -> Optional[float]:
+    """
+    Seconds the upstream asked us to wait (retry-after-ms, or Retry-After as
+    delta-seconds or an HTTP date). None when absent or unparseable.
+    """
+    if headers is None:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return max(0.0, float(ms) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def _backoff_s(attempt: int, base_s: float, cap_s: float) -> float:
+    # Full jitter: uniform over [0, min(cap, base * 2^(attempt-1))]
+    return random.uniform(0.0, min(cap_s, base_s * (2 ** (attempt - 1))))
+
+
 class CoreEngine:
     """
     Shine Companion CoreEngine
     - Calls OpenAI Chat Completions (openai==2.x)
     - Retries transient failures (including 502/5xx, timeouts, connection errors)
+    - Every attempt and sleep fits inside one total deadline (OPENAI_DEADLINE_S);
+      the SDK's own retries are off, so OPENAI_MAX_RETRIES is the only budget
     """
 
     def __init__(self) -> None:
@@ -46,39 +98,46 @@ class CoreEngine:
         # Timeouts / retries
         self.timeout_s = _env_float("OPENAI_TIMEOUT_S", 30.0)
         self.max_retries = _env_int("OPENAI_MAX_RETRIES", 6)
+        self.deadline_s = _env_float("OPENAI_DEADLINE_S", 45.0)
 
-        # Create an httpx client with sane timeouts (Railway-friendly)
-        timeout = httpx.Timeout(
-            connect=self.timeout_s,
-            read=self.timeout_s,
-            write=self.timeout_s,
-            pool=self.timeout_s,
+        # OpenAI client on the process-wide connection pool (core/http_pool.py),
+        # with this engine's timeouts (Railway-friendly). max_retries=0: the
+        # loop below retries, the SDK would multiply the attempts.
+        self.client = http_pool.openai_client(
+            self.api_key, self.base_url, timeout=httpx.Timeout(self.timeout_s), max_retries=0
         )
-        self._http = httpx.Client(timeout=timeout, follow_redirects=True)
-
-        # Create OpenAI client
-        if self.base_url:
-            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, http_client=self._http)
-        else:
-            self.client = OpenAI(api_key=self.api_key, http_client=self._http)
 
     def generate_from_messages(self, messages: List[Dict[str, Any]], temperature: float = 0.2) -> str:
         """
         messages example:
           [{"role":"system","content":"..."},{"role":"user","content":"Hello"}]
         Returns assistant text.
-        Raises RuntimeError on permanent failure (after retries).
+        Raises RuntimeError on permanent failure (after retries), and
+        ProviderUnavailable without calling upstream when the model's circuit
+        is open or too many calls are already in flight.
         """
+        with span("provider", model=self.model), guard(self.model):
+            return self._generate(messages, temperature)
 
+    def _generate(self, messages: List[Dict[str, Any]], temperature: float) -> str:
+        deadline = time.monotonic() + self.deadline_s
         last_err: Optional[BaseException] = None
+        attempt = 0
 
         for attempt in range(1, self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
-                resp = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature,
-                )
+                with span("provider_attempt", attempt=attempt) as attrs:
+                    resp = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        timeout=min(self.timeout_s, remaining),
+                    )
+                    attrs["status"] = 200
+                cache_stats.record(getattr(resp, "usage", None))
                 # OpenAI SDK returns choices[0].message.content
                 return (resp.choices[0].message.content or "").strip()
 
@@ -94,12 +153,27 @@ class CoreEngine:
                 traceback.print_exc()
                 print("============================")
 
-                # Exponential backoff with small cap
-                # (handles transient 5xx / 502 / timeouts / connection errors)
-                sleep_s = min(2 ** (attempt - 1), 10)
+                # SDK status errors carry status_code; a 400/401/404 will not
+                # get better on retry. Timeouts / connection errors have none.
+                status = getattr(e, "status_code", None)
+                if status is not None and status not in RETRYABLE_STATUS:
+                    raise ProviderHTTPError(status, str(e)) from e
+
+                if attempt == self.max_retries:
+                    break
+
+                # Honour Retry-After, else full-jitter exponential backoff
+                response = getattr(e, "response", None)
+                sleep_s = _retry_after_s(getattr(response, "headers", None))
+                if sleep_s is None:
+                    sleep_s = _backoff_s(attempt, 1.0, 10.0)
+                sleep_s = min(sleep_s, 10.0)
+                if time.monotonic() + sleep_s >= deadline:
+                    # Waiting would blow the budget; fail now rather than late.
+                    break
                 time.sleep(sleep_s)
 
-        raise RuntimeError(f"OpenAI request failed after {self.max_retries} retries: {last_err}")
+        raise RuntimeError(f"OpenAI request failed after {attempt} attempts: {last_err}")
 
     def safe_generate(self, messages: List[Dict[str, Any]], temperature: float = 0.2) -> Dict[str, Any]:
         """
@@ -108,5 +182,117 @@ class CoreEngine:
         try:
             text = self.generate_from_messages(messages, temperature=temperature)
             return {"ok": True, "text": text}
+        except ProviderUnavailable as e:
+            return {"ok": False, "error": "provider_unavailable", "detail": str(e), "retry_after_s": e.retry_after_s}
+        except Exception as e:
+            return {"ok": False, "error": "provider_error", "detail": str(e)}
+
+
+class AsyncCoreEngine:
+    """
+    Async counterpart of CoreEngine on httpx.AsyncClient.
+    - Retries only RETRYABLE_STATUS responses, timeouts and connection errors
+    - Honours Retry-After / retry-after-ms, otherwise full-jitter backoff
+    - Every attempt and sleep fits inside one total deadline (OPENAI_DEADLINE_S)
+    """
+
+    def __init__(self) -> None:
+        load_dotenv()
+
+        self.api_key = (os.getenv("OPENAI_API_KEY") or "").strip()
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment.")
+
+        self.model = (os.getenv("SHINE_MODEL") or "gpt-4o-mini").strip()
+        self.base_url = (os.getenv("OPENAI_BASE_URL") or "").strip() or None
+
+        self.timeout_s = _env_float("OPENAI_TIMEOUT_S", 30.0)
+        self.max_retries = _env_int("OPENAI_MAX_RETRIES", 6)
+        self.deadline_s = _env_float("OPENAI_DEADLINE_S", 45.0)
+        self.backoff_base_s = _env_float("OPENAI_BACKOFF_BASE_S", 0.5)
+        self.backoff_cap_s = _env_float("OPENAI_BACKOFF_CAP_S", 10.0)
+
+        # Shared pool (core/http_pool.py); URL and auth go on each request
+        self._http = http_pool.get_async_client()
+        self._url = (self.base_url or "https://api.openai.com/v1").rstrip("/") + "/chat/completions"
+        self._headers = {"Authorization": f"Bearer {self.api_key}"}
+
+    async def generate_from_messages(self, messages: List[Dict[str, Any]], temperature: float = 0.2) -> str:
+        """
+        Same contract as CoreEngine.generate_from_messages.
+        Raises ProviderHTTPError at once for non-retryable statuses,
+        RuntimeError when retries or the deadline run out, and
+        ProviderUnavailable when the circuit is open or the queue is full.
+        """
+        with span("provider", model=self.model):
+            async with guard_async(self.model):
+                return await self._generate(messages, temperature)
+
+    async def _generate(self, messages: List[Dict[str, Any]], temperature: float) -> str:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_s
+        last_err: Optional[BaseException] = None
+        payload = {"model": self.model, "messages": messages, "temperature": temperature}
+        attempt = 0
+
+        for attempt in range(1, self.max_retries + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+
+            retry_after: Optional[float] = None
+            try:
+                with span("provider_attempt", attempt=attempt) as attrs:
+                    resp = await self._http.post(
+                        self._url,
+                        json=payload,
+                        headers=self._headers,
+                        timeout=min(self.timeout_s, remaining),
+                    )
+                    attrs["status"] = resp.status_code
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                last_err = e
+            else:
+                if resp.status_code == 200:
+                    data = resp.json()
+                    cache_stats.record(data.get("usage"))
+                    return (data["choices"][0]["message"].get("content") or "").strip()
+
+                last_err = ProviderHTTPError(resp.status_code, resp.text[:300])
+                if resp.status_code not in RETRYABLE_STATUS:
+                    raise last_err
+                retry_after = _retry_after_s(resp.headers)
+
+            print(f"==== OPENAI CALL FAILED ({attempt}/{self.max_retries}, model={self.model}): {last_err}")
+
+            if attempt == self.max_retries:
+                break
+            delay = retry_after if retry_after is not None else _backoff_s(
+                attempt, self.backoff_base_s, self.backoff_cap_s
+            )
+            # A long Retry-After is capped like the sync engine's, so it
+            # becomes a later retry rather than an immediate give-up
+            delay = min(delay, self.backoff_cap_s)
+            if loop.time() + delay >= deadline:
+                # Waiting would blow the budget; fail now rather than late.
+                break
+            await asyncio.sleep(delay)
+
+        raise RuntimeError(f"OpenAI request failed after {attempt} attempts: {last_err}")
+
+    async def safe_generate(self, messages: List[Dict[str, Any]], temperature: float = 0.2) -> Dict[str, Any]:
+        """
+        Wrapper that never throws: returns {ok, text} or {ok:false, error, detail}
+        """
+        try:
+            text = await self.generate_from_messages(messages, temperature=temperature)
+            return {"ok": True, "text": text}
+        except ProviderUnavailable as e:
+            return {"ok": False, "error": "provider_unavailable", "detail": str(e), "retry_after_s": e.retry_after_s}
         except Exception as e:
-            return {"ok": False, "error": "provider_error", "detail": str(e)}
\ No newline at end of file
+            return {"ok": False, "error": "provider_error", "detail": str(e)}
+
+    async def aclose(self) -> None:
+        # The engine only borrows the shared pool; whoever runs the event
+        # loop closes it (server.py on shutdown, via http_pool.aclose()).
+        pass
\ No newline at end of file
@@ -0,0 +1,383 @@
+# core/http_pool.py
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import anyio
+import httpcore
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+MAX_CONNECTIONS = _env_int("HTTP_MAX_CONNECTIONS", 64)
+MAX_KEEPALIVE = _env_int("HTTP_MAX_KEEPALIVE", 32)
+KEEPALIVE_EXPIRY_S = _env_float("HTTP_KEEPALIVE_EXPIRY_S", 60.0)
+DNS_TTL_S = _env_float("HTTP_DNS_TTL_S", 300.0)
+TIMEOUT_S = _env_float("OPENAI_TIMEOUT_S", 30.0)
+
+
+def _http2_wanted() -> bool:
+    if os.getenv("HTTP2", "1") == "0":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("==== HTTP2: h2 not installed, using HTTP/1.1 (pip install h2) ====")
+        return False
+    return True
+
+
+def _is_ip(host: str) -> bool:
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except OSError:
+            pass
+    return False
+
+
+class DNSCache:
+    """
+    host:port -> every address getaddrinfo returned, in its order, kept for
+    ttl_s. Only consulted when the pool opens a new connection, which tries
+    the addresses in turn (so a dead first address still falls back to the
+    next one, IPv6 to IPv4 and back); TLS still uses the hostname for SNI
+    and certificate checks. An address that refused a connect moves to the
+    back of the list; when all of them fail the entry is dropped.
+    """
+
+    def __init__(self, ttl_s: float = DNS_TTL_S) -> None:
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, host: str, port: int) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return list(entry[1])
+            self.misses += 1
+            return None
+
+    def put(self, host: str, port: int, infos: List[Any]) -> List[str]:
+        addresses: List[str] = []
+        for info in infos:
+            address = info[4][0]
+            if address not in addresses:
+                addresses.append(address)
+        with self._lock:
+            self._entries[(host, port)] = (time.monotonic() + self.ttl_s, addresses)
+        return list(addresses)
+
+    def demote(self, host: str, port: int, address: str) -> None:
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry is not None and address in entry[1]:
+                rest = [a for a in entry[1] if a != address]
+                self._entries[(host, port)] = (entry[0], rest + [address])
+
+    def forget(self, host: str, port: int) -> None:
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        if _is_ip(host):
+            return [host]
+        addresses = self.get(host, port)
+        if addresses is None:
+            addresses = self.put(host, port, socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        return addresses
+
+    async def aresolve(self, host: str, port: int) -> List[str]:
+        if _is_ip(host):
+            return [host]
+        addresses = self.get(host, port)
+        if addresses is None:
+            addresses = self.put(host, port, await anyio.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        return addresses
+
+
+dns_cache = DNSCache()
+
+
+class _CachedDNSBackend(httpcore.NetworkBackend):
+    def __init__(self, inner: httpcore.NetworkBackend) -> None:
+        self.inner = inner
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        last_err: Optional[Exception] = None
+        for address in dns_cache.resolve(host, port):
+            try:
+                return self.inner.connect_tcp(address, port, timeout, local_address, socket_options)
+            except Exception as e:
+                dns_cache.demote(host, port, address)
+                last_err = e
+        dns_cache.forget(host, port)
+        raise last_err
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return self.inner.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds):
+        self.inner.sleep(seconds)
+
+
+class _AsyncCachedDNSBackend(httpcore.AsyncNetworkBackend):
+    def __init__(self, inner: httpcore.AsyncNetworkBackend) -> None:
+        self.inner = inner
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        last_err: Optional[Exception] = None
+        for address in await dns_cache.aresolve(host, port):
+            try:
+                return await self.inner.connect_tcp(address, port, timeout, local_address, socket_options)
+            except Exception as e:
+                dns_cache.demote(host, port, address)
+                last_err = e
+        dns_cache.forget(host, port)
+        raise last_err
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self.inner.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds):
+        await self.inner.sleep(seconds)
+
+
+class _PoolStats:
+    """
+    Counters for one transport plus a snapshot of its httpcore pool. A
+    request counts as saturated when it arrives with every connection
+    busy (none idle, no free HTTP/2 stream) and the pool already at
+    max_connections -- it will wait for a slot, up to the pool timeout.
+    """
+
+    def __init__(self, name: str, limits: httpx.Limits, http2: bool) -> None:
+        self.name = name
+        self.limits = limits
+        self.http2 = http2
+        self.pool: Any = None
+        self.requests = 0
+        self.saturated = 0
+
+    def on_request(self) -> None:
+        self.requests += 1
+        conns = self.pool.connections if self.pool is not None else []
+        if len(conns) >= (self.limits.max_connections or 0) > 0 and not any(c.is_available() for c in conns):
+            self.saturated += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        conns = list(self.pool.connections) if self.pool is not None else []
+        idle = sum(1 for c in conns if c.is_idle())
+        waiting = sum(1 for r in list(getattr(self.pool, "_requests", [])) if r.is_queued())
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive": self.limits.max_keepalive_connections,
+            "keepalive_expiry_s": self.limits.keepalive_expiry,
+            "connections": len(conns),
+            "active": len(conns) - idle,
+            "idle": idle,
+            "waiting": waiting,
+            "requests": self.requests,
+            "saturated": self.saturated,
+        }
+
+
+def _with_dns_cache(transport: Any, backend_cls: Any) -> Any:
+    # httpx does not take a network backend, so swap it on the pool it built.
+    # transport._pool / pool._network_backend (and pool._requests in the
+    # gauges) are private: requirements.txt pins the httpx and httpcore
+    # versions this was tested with; re-test before moving the pins.
+    pool = getattr(transport, "_pool", None)
+    if pool is not None and hasattr(pool, "_network_backend"):
+        pool._network_backend = backend_cls(pool._network_backend)
+    else:
+        print(
+            f"==== HTTP POOL: httpx {httpx.__version__} / httpcore {httpcore.__version__} internals "
+            "not as expected; DNS cache and pool gauges are off ===="
+        )
+    return pool
+
+
+class _Transport(httpx.HTTPTransport):
+    def __init__(self, stats: _PoolStats, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        stats.pool = _with_dns_cache(self, _CachedDNSBackend)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.on_request()
+        return super().handle_request(request)
+
+
+class _AsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: _PoolStats, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        stats.pool = _with_dns_cache(self, _AsyncCachedDNSBackend)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.on_request()
+        return await super().handle_async_request(request)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=min(MAX_KEEPALIVE, MAX_CONNECTIONS),
+        keepalive_expiry=KEEPALIVE_EXPIRY_S,
+    )
+
+
+_lock = threading.Lock()
+_sync_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_stats: Dict[str, _PoolStats] = {}
+_openai: Dict[Tuple[str, str, str], Any] = {}
+
+
+def get_sync_client() -> httpx.Client:
+    """
+    The process-wide httpx.Client. Every blocking OpenAI call goes through
+    it, so connections (and their TLS sessions) are reused across callers.
+    """
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                http2 = _http2_wanted()
+                stats = _PoolStats("sync", _limits(), http2)
+                transport = _Transport(stats, http2=http2, limits=stats.limits)
+                _stats["sync"] = stats
+                _sync_client = httpx.Client(
+                    transport=transport,
+                    timeout=httpx.Timeout(TIMEOUT_S),
+                    follow_redirects=True,
+                )
+    return _sync_client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    The process-wide httpx.AsyncClient. Its connections belong to the event
+    loop that opened them, so use it from one loop (the server's). The app
+    owns it: only the app's shutdown calls aclose(), never a borrower.
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                http2 = _http2_wanted()
+                stats = _PoolStats("async", _limits(), http2)
+                transport = _AsyncTransport(stats, http2=http2, limits=stats.limits)
+                _stats["async"] = stats
+                _async_client = httpx.AsyncClient(
+                    transport=transport,
+                    timeout=httpx.Timeout(TIMEOUT_S),
+                    follow_redirects=True,
+                )
+    return _async_client
+
+
+def openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None, **kwargs: Any) -> OpenAI:
+    """
+    OpenAI SDK client on the shared sync pool. Clients without extra
+    options are cached per (api_key, base_url).
+    """
+    api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+    key = ("sync", api_key or "", base_url or "")
+    if kwargs:
+        return OpenAI(api_key=api_key, base_url=base_url, http_client=get_sync_client(), **kwargs)
+    client = _openai.get(key)
+    if client is None:
+        client = _openai[key] = OpenAI(api_key=api_key, base_url=base_url, http_client=get_sync_client())
+    return client
+
+
+def async_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None, **kwargs: Any) -> AsyncOpenAI:
+    """
+    AsyncOpenAI SDK client on the shared async pool, cached the same way.
+    """
+    api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+    key = ("async", api_key or "", base_url or "")
+    if kwargs:
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=get_async_client(), **kwargs)
+    client = _openai.get(key)
+    if client is None:
+        client = _openai[key] = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=get_async_client())
+    return client
+
+
+def stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = {name: s.snapshot() for name, s in list(_stats.items())}
+    out["dns_cache"] = {"hits": dns_cache.hits, "misses": dns_cache.misses, "ttl_s": dns_cache.ttl_s}
+    return out
+
+
+def metrics_text() -> str:
+    """
+    Pool gauges and counters in the Prometheus text format, appended to
+    /metrics by the server.
+    """
+    snaps = {name: s.snapshot() for name, s in list(_stats.items())}
+    lines = ["# TYPE shine_http_pool_connections gauge"]
+    for name, snap in snaps.items():
+        for state in ("active", "idle"):
+            lines.append(f'shine_http_pool_connections{{client="{name}",state="{state}"}} {snap[state]}')
+    for metric, field, kind in (
+        ("shine_http_pool_max_connections", "max_connections", "gauge"),
+        ("shine_http_pool_waiting", "waiting", "gauge"),
+        ("shine_http_requests_total", "requests", "counter"),
+        ("shine_http_pool_saturated_total", "saturated", "counter"),
+    ):
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, snap in snaps.items():
+            lines.append(f'{metric}{{client="{name}"}} {snap[field]}')
+    lines.append("# TYPE shine_dns_cache_lookups_total counter")
+    lines.append(f'shine_dns_cache_lookups_total{{result="hit"}} {dns_cache.hits}')
+    lines.append(f'shine_dns_cache_lookups_total{{result="miss"}} {dns_cache.misses}')
+    return "\n".join(lines) + "\n"
+
+
+def close() -> None:
+    global _sync_client
+    with _lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+        _stats.pop("sync", None)
+        for key in [k for k in _openai if k[0] == "sync"]:
+            del _openai[key]
+
+
+async def aclose() -> None:
+    global _async_client
+    client = _async_client
+    with _lock:
+        _async_client = None
+        _stats.pop("async", None)
+        for key in [k for k in _openai if k[0] == "async"]:
+            del _openai[key]
+    if client is not None:
+        await client.aclose()
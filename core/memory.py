@@ -1,33 +1,442 @@
 import os
+import re
 import json
 import time
-from typing import List, Dict
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List, Dict, Optional, Tuple
+
+from core.archive import Archive, segment_paths
+from core.writer import GroupCommitWriter, durability_from_env
+
+# Sidecar index next to each memory_<mode>.jsonl: one little-endian uint64
+# per line holding the byte offset just past that line's newline. The line
+# count is the index size / 8, and line i spans [end[i-1], end[i]).
+_IDX = struct.Struct("<Q")
+_TAIL_BLOCK = 8192
+
+# Rough per-message overhead (dict + two str objects) for cache accounting
+_MSG_OVERHEAD = 200
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+class _WindowCache:
+    """
+    Byte-bounded LRU of decoded history windows, keyed by file path. Each
+    entry remembers the file size it reflects, so a file changed behind our
+    back (another process, a manual edit) is detected with one stat.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    @staticmethod
+    def _cost(msgs: List[Dict[str, str]]) -> int:
+        return sum(len(m["content"]) + _MSG_OVERHEAD for m in msgs)
+
+    def get(self, path: str, size: int) -> Optional[List[Dict[str, str]]]:
+        entry = self._entries.get(path)
+        if entry is None or entry["size"] != size:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(path)
+        self.hits += 1
+        return entry["msgs"]
+
+    def put(self, path: str, size: int, msgs: List[Dict[str, str]]) -> None:
+        self.drop(path)
+        cost = self._cost(msgs)
+        if cost > self.max_bytes:
+            return
+        self._entries[path] = {"size": size, "msgs": msgs, "bytes": cost}
+        self.bytes += cost
+        while self.bytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self.bytes -= old["bytes"]
+            self.evictions += 1
+
+    def extend(self, path: str, old_size: int, new_size: int, new_msgs: List[Dict[str, str]], keep: int) -> None:
+        # Write-through: only valid if the entry was current before the write.
+        entry = self._entries.get(path)
+        if entry is None:
+            return
+        if entry["size"] != old_size:
+            self.drop(path)
+            return
+        self.put(path, new_size, (entry["msgs"] + new_msgs)[-keep:])
+
+    def drop(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.bytes -= entry["bytes"]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class _Handle:
+    __slots__ = ("path", "data", "idx", "end", "idx_end", "indexed", "pins")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = None
+        self.idx = None
+        self.end = 0
+        self.idx_end = 0
+        self.indexed = False
+        self.pins = 0
+
+    def open(self, index_path: str):
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        # Unbuffered: every write() is one append the readers can see
+        self.data = open(self.path, "ab", buffering=0)
+        self.end = self.data.tell()
+        self.open_index(index_path)
+
+    def open_index(self, index_path: str):
+        if self.idx is not None:
+            self.idx.close()
+        self.idx = open(index_path, "ab", buffering=0)
+        self.idx_end = self.idx.tell()
+
+    def close(self):
+        for f in (self.data, self.idx):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self.data = self.idx = None
+
+
+class _AppendHandles:
+    """
+    LRU of open append handles (data file + index) keyed by path, at most
+    max_open of them. A handle is pinned while a commit uses it and never
+    closed under it; the cache may run over max_open while everything
+    older is pinned.
+    """
+
+    def __init__(self, max_open: int):
+        self.max_open = max(1, max_open)
+        self.opens = 0
+        self.hits = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Handle]" = OrderedDict()
+
+    def acquire(self, path: str) -> _Handle:
+        with self._lock:
+            h = self._entries.get(path)
+            if h is not None:
+                self._entries.move_to_end(path)
+                self.hits += 1
+            else:
+                h = self._entries[path] = _Handle(path)
+                self.opens += 1
+            h.pins += 1
+            if len(self._entries) > self.max_open:
+                for key in list(self._entries):
+                    if len(self._entries) <= self.max_open:
+                        break
+                    old = self._entries[key]
+                    if old.pins == 0:
+                        del self._entries[key]
+                        old.close()
+                        self.evictions += 1
+            return h
+
+    def release(self, h: _Handle):
+        with self._lock:
+            h.pins -= 1
+
+    def drop(self, path: str):
+        # Caller holds the path's shard lock, so nobody has it pinned
+        with self._lock:
+            h = self._entries.pop(path, None)
+        if h is not None:
+            h.close()
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for h in entries:
+            h.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "open": len(self._entries),
+                "max_open": self.max_open,
+                "opens": self.opens,
+                "hits": self.hits,
+                "evictions": self.evictions,
+            }
+
+
+_UNSAFE = re.compile(r"[^a-z0-9_-]")
+
+
+def split_mode(mode: str) -> Tuple[Optional[str], str]:
+    """
+    "Doug:companion" -> ("doug", "companion"); plain modes have no user.
+    The user:mode form predates the user argument and is still accepted.
+    """
+    safe = (mode or "companion").lower().strip()
+    user, sep, rest = safe.partition(":")
+    if sep and user.strip():
+        return user.strip(), rest.strip() or "companion"
+    return None, safe
+
+
+def user_key(user: str) -> str:
+    # Stable per-user id used for shard paths and index scopes
+    return hashlib.sha1(user.lower().strip().encode("utf-8")).hexdigest()
+
+
+def user_dir(data_dir: str, user: str) -> str:
+    # users/ab/cd/<sha1>: 65536 leaf buckets keep directories small at any scale
+    h = user_key(user)
+    return os.path.join(data_dir, "users", h[:2], h[2:4], h)
+
 
 class MemoryStore:
-    def __init__(self, data_dir: str, max_turns: int = 6):
+    """
+    Conversation history as JSONL, one file per (user, mode).
+
+    - with a user: <data_dir>/users/<h[:2]>/<h[2:4]>/<sha1(user)>/memory_<mode>.jsonl
+    - without one: the shared <data_dir>/memory_<mode>.jsonl (older callers)
+    - appends reuse open handles from an LRU (SHINE_MEMORY_OPEN_FILES, two
+      descriptors each) instead of opening the file every turn
+    - file I/O is serialized per shard by striped locks
+      (SHINE_MEMORY_LOCK_STRIPES), so different users write in parallel
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        max_turns: int = 6,
+        cache_bytes: Optional[int] = None,
+        durability: Optional[str] = None,
+        max_open: Optional[int] = None,
+    ):
         self.data_dir = data_dir
         self.max_turns = max_turns  # turns = user+assistant pairs
+        # Guards the window cache only; file I/O holds a shard lock
+        self._lock = threading.Lock()
+        if cache_bytes is None:
+            cache_bytes = _env_int("SHINE_HISTORY_CACHE_BYTES", 8 * 1024 * 1024)
+        self._cache = _WindowCache(cache_bytes)
+        self._stripes = [threading.Lock() for _ in range(max(1, _env_int("SHINE_MEMORY_LOCK_STRIPES", 64)))]
+        self._handles = _AppendHandles(max_open or _env_int("SHINE_MEMORY_OPEN_FILES", 128))
+        # Bumped by clear() per history file, under its shard lock
+        self._generations: Dict[str, int] = {}
         os.makedirs(self.data_dir, exist_ok=True)
 
-    def _path(self, mode: str) -> str:
-        safe = (mode or "companion").lower().strip()
-        return os.path.join(self.data_dir, f"memory_{safe}.jsonl")
+        # sync (default) | batched | async -- see core/writer.py
+        self._writer = GroupCommitWriter(
+            self._commit_batch,
+            mode=durability or durability_from_env("SHINE_MEMORY_DURABILITY"),
+            max_batch=_env_int("SHINE_MEMORY_BATCH", 256),
+            interval_s=_env_int("SHINE_MEMORY_FLUSH_MS", 20) / 1000.0,
+            name="memory-writer",
+        )
+
+    def _settle(self, folder: str):
+        # Read-your-writes: appends still queued for this folder (one user's
+        # shard, or the shared data_dir) land first; other users' do not.
+        self._writer.flush(key=os.path.normpath(folder))
+
+    @property
+    def _max_entries(self) -> int:
+        # Each "turn" is typically 2 entries (user + assistant)
+        return max(2 * self.max_turns, 2)
+
+    def _path(self, mode: str, user: Optional[str] = None) -> str:
+        if user is None:
+            user, safe = split_mode(mode)
+        else:
+            safe = (mode or "companion").lower().strip()
+        if not user:
+            return os.path.join(self.data_dir, f"memory_{safe}.jsonl")
+        safe = _UNSAFE.sub("_", safe) or "companion"
+        return os.path.join(user_dir(self.data_dir, user), f"memory_{safe}.jsonl")
+
+    def _shard_lock(self, path: str) -> threading.Lock:
+        return self._stripes[hash(path) % len(self._stripes)]
+
+    @staticmethod
+    def _index_path(path: str) -> str:
+        return path[:-len(".jsonl")] + ".idx"
+
+    def summary_path(self, mode: str, user: Optional[str] = None) -> str:
+        # Rolling summary of turns that left the window (core/summarizer.py)
+        return self._path(mode, user)[:-len(".jsonl")] + ".summary.json"
+
+    def generation(self, mode: str, user: Optional[str] = None) -> int:
+        # Changes whenever the conversation is cleared
+        return self._generations.get(self._path(mode, user), 0)
 
-    def load_messages(self, mode: str) -> List[Dict[str, str]]:
-        path = self._path(mode)
-        if not os.path.exists(path):
+    def replace_sidecar(self, mode: str, user: Optional[str], generation: int, tmp: str, dest: str) -> bool:
+        """
+        os.replace(tmp, dest) unless the conversation was cleared since
+        generation was read; then tmp is removed. Held under the shard lock,
+        so a clear cannot slip in between the check and the rename.
+        """
+        path = self._path(mode, user)
+        with self._shard_lock(path):
+            if self._generations.get(path, 0) == generation:
+                os.replace(tmp, dest)
+                return True
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+
+    # -------------------------
+    # offset index
+    # -------------------------
+
+    def _index_tail(self, path: str, size: int, n: int) -> Optional[Tuple[int, List[int]]]:
+        """
+        (line_count, last n end-offsets) from the sidecar index, or None if
+        the index is missing or does not describe the file as it is now.
+        """
+        idx = self._index_path(path)
+        try:
+            with open(idx, "rb") as f:
+                isize = f.seek(0, os.SEEK_END)
+                if isize % _IDX.size:
+                    return None
+                count = isize // _IDX.size
+                if count == 0:
+                    return (0, []) if size == 0 else None
+                take = min(count, n)
+                f.seek((count - take) * _IDX.size)
+                raw = f.read(take * _IDX.size)
+        except OSError:
+            return None
+
+        ends = [e for (e,) in _IDX.iter_unpack(raw)]
+        if ends[-1] != size:
+            return None
+        return count, ends
+
+    def _rebuild_index(self, path: str) -> int:
+        """
+        One pass over the file to (re)write its index; used for files that
+        pre-date the index or were modified outside append(). Returns the
+        line count.
+        """
+        ends: List[int] = []
+        pos = 0
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    block = f.read(1 << 20)
+                    if not block:
+                        break
+                    i = block.find(b"\n")
+                    while i != -1:
+                        ends.append(pos + i + 1)
+                        i = block.find(b"\n", i + 1)
+                    pos += len(block)
+        except OSError:
+            return 0
+        if not ends or ends[-1] != pos:
+            if pos:
+                ends.append(pos)  # trailing line without a newline
+
+        tmp = self._index_path(path) + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(b"".join(_IDX.pack(e) for e in ends))
+            os.replace(tmp, self._index_path(path))
+        except OSError:
+            pass
+        return len(ends)
+
+    @staticmethod
+    def _tail_bytes(path: str, size: int, n: int) -> bytes:
+        """
+        Fallback when there is no usable index: read backward from EOF in
+        blocks until n complete lines are covered.
+        """
+        with open(path, "rb") as f:
+            pos = size
+            buf = b""
+            # n lines need n + 1 newlines when the file ends with one
+            while pos > 0 and buf.count(b"\n") <= n:
+                step = min(_TAIL_BLOCK, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+        if pos > 0:
+            # drop the partial first line
+            buf = buf[buf.find(b"\n") + 1:]
+        return buf
+
+    # -------------------------
+    # public API
+    # -------------------------
+
+    def load_messages(self, mode: str, user: Optional[str] = None) -> List[Dict[str, str]]:
+        path = self._path(mode, user)
+        max_entries = self._max_entries
+        self._settle(os.path.dirname(path))
+
+        try:
+            size = os.path.getsize(path)
+        except OSError:
             return []
 
-        lines = []
+        with self._lock:
+            cached = self._cache.get(path, size)
+        if cached is not None:
+            return [dict(m) for m in cached]
+
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                lines = f.readlines()
+            tail = self._index_tail(path, size, max_entries + 1)
+            if tail is not None:
+                count, ends = tail
+                start = ends[0] if count > max_entries else 0
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    data = f.read(size - start)
+            else:
+                data = self._tail_bytes(path, size, max_entries)
         except:
             return []
 
-        # Each "turn" is typically 2 entries (user + assistant)
-        max_entries = max(2 * self.max_turns, 2)
-        lines = lines[-max_entries:]
+        lines = data.decode("utf-8", errors="replace").splitlines()[-max_entries:]
 
         msgs: List[Dict[str, str]] = []
         for ln in lines:
@@ -42,53 +451,232 @@ class MemoryStore:
                     msgs.append({"role": role, "content": content})
             except:
                 continue
-        return msgs
 
-    def append(self, mode: str, role: str, content: str):
-        if role not in ("user", "assistant"):
-            return
-        if not isinstance(content, str) or not content.strip():
-            return
-
-        path = self._path(mode)
-        rec = {"ts": int(time.time()), "role": role, "content": content}
+        with self._lock:
+            self._cache.put(path, size, msgs)
+        return [dict(m) for m in msgs]
 
+    def evicted(self, mode: str, user: Optional[str] = None, since: int = 0) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Messages on lines [since, first line of the current window), i.e.
+        the ones load_messages() no longer returns, plus the line number to
+        pass as since next time.
+        """
+        path = self._path(mode, user)
+        self._settle(os.path.dirname(path))
         try:
-            with open(path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            size = os.path.getsize(path)
+            tail = self._index_tail(path, size, 1)
+            count = tail[0] if tail is not None else self._rebuild_index(path)
+            upto = max(since, count - self._max_entries)
+            if upto <= since:
+                return [], since
+            with open(self._index_path(path), "rb") as f:
+                f.seek((since - 1) * _IDX.size if since else 0)
+                start = _IDX.unpack(f.read(_IDX.size))[0] if since else 0
+                f.seek((upto - 1) * _IDX.size)
+                stop = _IDX.unpack(f.read(_IDX.size))[0]
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = f.read(stop - start)
         except:
-            pass
+            return [], since
 
-    def clear(self, mode: str):
-        if mode == "all":
-            # clear all known files in data_dir matching memory_*.jsonl
+        msgs: List[Dict[str, str]] = []
+        for ln in data.decode("utf-8", errors="replace").splitlines():
             try:
-                for name in os.listdir(self.data_dir):
-                    if name.startswith("memory_") and name.endswith(".jsonl"):
-                        try:
-                            os.remove(os.path.join(self.data_dir, name))
-                        except:
-                            pass
+                obj = json.loads(ln)
             except:
-                pass
+                continue
+            if obj.get("role") in ("user", "assistant") and isinstance(obj.get("content"), str):
+                msgs.append({"role": obj["role"], "content": obj["content"]})
+        return msgs, upto
+
+    def archive(self, mode: str, user: Optional[str] = None) -> Archive:
+        """
+        Read-only view over the columnar segments compacted from this
+        history file (core/archive.py); close it when done.
+        """
+        return Archive(self._path(mode, user))
+
+    def append(self, mode: str, role: str, content: str, user: Optional[str] = None):
+        self._append_many(mode, [(role, content)], user)
+
+    def append_turn(self, mode: str, user_content: str, assistant_content: str, user: Optional[str] = None):
+        """
+        Persist a user + assistant pair with a single write to each file.
+        """
+        self._append_many(mode, [("user", user_content), ("assistant", assistant_content)], user)
+
+    def _append_many(self, mode: str, items: List[Tuple[str, str]], user: Optional[str] = None):
+        msgs = [
+            {"role": role, "content": content}
+            for role, content in items
+            if role in ("user", "assistant") and isinstance(content, str) and content.strip()
+        ]
+        if not msgs:
             return
 
-        path = self._path(mode)
+        path = self._path(mode, user)
+        self._writer.submit((path, msgs), key=os.path.normpath(os.path.dirname(path)))
+
+    def _commit_batch(self, batch: List[Tuple[str, List[Dict[str, str]]]]):
+        # Group commit: one write per file for the whole batch, in order.
+        by_path: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+        for path, msgs in batch:
+            by_path.setdefault(path, []).extend(msgs)
+        # One bad file must not cost the other files their write; the first
+        # error still reaches the writer, which counts it (stats())
+        first: Optional[BaseException] = None
+        for path, msgs in by_path.items():
+            try:
+                self._commit(path, msgs)
+            except Exception as e:
+                print(f"==== memory: append to {path} failed: {e}")
+                if first is None:
+                    first = e
+        if first is not None:
+            raise first
+
+    def _commit(self, path: str, msgs: List[Dict[str, str]]):
+        ts = int(time.time())
+        lines = [
+            (json.dumps({"ts": ts, "role": m["role"], "content": m["content"]}, ensure_ascii=False) + "\n").encode("utf-8")
+            for m in msgs
+        ]
+        data = b"".join(lines)
+
         try:
-            if os.path.exists(path):
-                os.remove(path)
+            with self._shard_lock(path):
+                h = self._handles.acquire(path)
+                try:
+                    index_path = self._index_path(path)
+                    if h.data is None:
+                        h.open(index_path)
+                        h.indexed = self._index_tail(path, h.end, 1) is not None
+                    elif (
+                        os.fstat(h.data.fileno()).st_size != h.end
+                        or os.fstat(h.idx.fileno()).st_size != h.idx_end
+                    ):
+                        # Written behind our back (another process): re-index
+                        h.indexed = False
+                    before = os.fstat(h.data.fileno()).st_size if not h.indexed else h.end
+
+                    h.data.write(data)
+                    end = h.data.tell()
+
+                    if h.indexed:
+                        ends = []
+                        pos = before
+                        for ln in lines:
+                            pos += len(ln)
+                            ends.append(_IDX.pack(pos))
+                        h.idx.write(b"".join(ends))
+                        h.idx_end += _IDX.size * len(ends)
+                    else:
+                        self._rebuild_index(path)
+                        # The rebuild replaced the index file; follow it
+                        h.open_index(index_path)
+                        h.indexed = True
+                    h.end = end
+                finally:
+                    self._handles.release(h)
+
+            with self._lock:
+                self._cache.extend(path, before, end, msgs, self._max_entries)
+        except Exception:
+            # The file or its index may be half-written: drop the handle and
+            # the cached window so the next access re-reads and re-indexes
+            with self._shard_lock(path):
+                self._handles.drop(path)
+            with self._lock:
+                self._cache.drop(path)
+            raise
+
+    def flush(self):
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+        self._handles.close_all()
+
+    def writer_stats(self) -> Dict[str, Any]:
+        return self._writer.stats()
+
+    def cache_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return self._cache.stats()
+
+    def handle_stats(self) -> Dict[str, int]:
+        return self._handles.stats()
+
+    def _remove(self, path: str):
+        with self._shard_lock(path):
+            self._generations[path] = self._generations.get(path, 0) + 1
+            self._handles.drop(path)
+            archived = segment_paths(path)
+            for p in [path, self._index_path(path), path[:-len(".jsonl")] + ".summary.json"] + archived:
+                try:
+                    if os.path.exists(p):
+                        os.remove(p)
+                except:
+                    pass
+
+    def clear(self, mode: str, user: Optional[str] = None):
+        """
+        Forget one history file, or with mode="all" every mode of that user
+        (or every shared memory_*.jsonl when there is no user).
+        """
+        if user is None:
+            user, mode = split_mode(mode)
+        folder = user_dir(self.data_dir, user) if user else self.data_dir
+        self._settle(folder)
+
+        if mode != "all":
+            path = self._path(mode, user)
+            with self._lock:
+                self._cache.drop(path)
+            self._remove(path)
+            return
+
+        try:
+            names = os.listdir(folder)
         except:
-            pass
+            return
+        for name in names:
+            if name.startswith("memory_") and name.endswith(".jsonl"):
+                path = os.path.join(folder, name)
+                with self._lock:
+                    self._cache.drop(path)
+                self._remove(path)
+            elif name.startswith("memory_") and name.endswith((".idx", ".summary.json", ".seg")):
+                # index, summary or archive segment left without its file
+                if not os.path.exists(os.path.join(folder, name.split(".", 1)[0] + ".jsonl")):
+                    try:
+                        os.remove(os.path.join(folder, name))
+                    except:
+                        pass
 
-    def status(self) -> Dict[str, int]:
+    def status(self, user: Optional[str] = None) -> Dict[str, int]:
+        """
+        Line count per mode: the shared files, or one user's shard.
+        """
+        folder = user_dir(self.data_dir, user) if user else self.data_dir
+        self._settle(folder)
         out = {}
         try:
-            for name in os.listdir(self.data_dir):
+            for name in os.listdir(folder):
                 if name.startswith("memory_") and name.endswith(".jsonl"):
                     mode = name[len("memory_"):-len(".jsonl")]
+                    path = os.path.join(folder, name)
                     try:
-                        with open(os.path.join(self.data_dir, name), "r", encoding="utf-8") as f:
-                            out[mode] = sum(1 for _ in f)
+                        tail = self._index_tail(path, os.path.getsize(path), 1)
+                        if tail is not None:
+                            out[mode] = tail[0]
+                        else:
+                            with self._shard_lock(path):
+                                self._handles.drop(path)
+                                out[mode] = self._rebuild_index(path)
                     except:
                         out[mode] = 0
         except:
@@ -0,0 +1,391 @@
+# core/memory_db.py
+import os
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from core.writer import GroupCommitWriter, durability_from_env
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+_SYNC_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+# Statement text is kept constant so sqlite3's per-connection statement cache
+# reuses the prepared statement instead of re-parsing SQL on every call.
+SQL_LOAD_RECENT = (
+    "SELECT key, value FROM user_memory WHERE user_id=? ORDER BY created DESC, id DESC LIMIT ?"
+)
+SQL_LOAD_ALL = "SELECT key, value FROM user_memory WHERE user_id=?"
+# A newer fact for the same key replaces the old row instead of adding another.
+SQL_INSERT = (
+    "INSERT INTO user_memory (user_id, key, value) VALUES (?, ?, ?) "
+    "ON CONFLICT(user_id, key) DO UPDATE SET value=excluded.value, created=CURRENT_TIMESTAMP"
+)
+SQL_INSERT_SESSION = "INSERT INTO session_memory (user_id, message, response) VALUES (?, ?, ?)"
+# The user's rows come from the covering index; FTS5 is then probed by rowid for
+# each of them, so cost follows the user's fact count, not the table size.
+# (bm25() is deliberately not used: it computes IDF by walking every matching
+# posting list in the table on each query.)
+SQL_SEARCH = (
+    "SELECT m.key, m.value FROM user_memory m WHERE m.user_id = ? AND EXISTS ("
+    "SELECT 1 FROM user_memory_fts WHERE user_memory_fts MATCH ? AND rowid = m.id)"
+)
+
+SCHEMA = (
+    # USER MEMORY (long term)
+    """
+    CREATE TABLE IF NOT EXISTS user_memory (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        key TEXT,
+        value TEXT,
+        created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # SESSION MEMORY
+    """
+    CREATE TABLE IF NOT EXISTS session_memory (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        message TEXT,
+        response TEXT,
+        created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # KNOWLEDGE MEMORY
+    """
+    CREATE TABLE IF NOT EXISTS knowledge_memory (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT,
+        content TEXT,
+        created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+)
+
+
+def _migrate_v1(conn: sqlite3.Connection) -> None:
+    # Keep only the newest row per (user_id, key), then enforce it.
+    conn.execute(
+        """
+        DELETE FROM user_memory WHERE id NOT IN (
+            SELECT MAX(id) FROM user_memory GROUP BY user_id, key
+        )
+        """
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_user_memory_user_key ON user_memory(user_id, key)"
+    )
+    # Covering index for the recency query: the rows come straight out of the
+    # index in order, with no table lookups and no sort step.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS ix_user_memory_user_created "
+        "ON user_memory(user_id, created, id, key, value)"
+    )
+
+
+def _migrate_v2(conn: sqlite3.Connection) -> None:
+    # External-content FTS5 index over key/value, kept in sync by triggers.
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS user_memory_fts USING fts5(
+            key, value, content='user_memory', content_rowid='id'
+        )
+        """
+    )
+    conn.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS user_memory_fts_ai AFTER INSERT ON user_memory BEGIN
+            INSERT INTO user_memory_fts(rowid, key, value)
+            VALUES (new.id, new.key, new.value);
+        END;
+        CREATE TRIGGER IF NOT EXISTS user_memory_fts_ad AFTER DELETE ON user_memory BEGIN
+            INSERT INTO user_memory_fts(user_memory_fts, rowid, key, value)
+            VALUES ('delete', old.id, old.key, old.value);
+        END;
+        CREATE TRIGGER IF NOT EXISTS user_memory_fts_au AFTER UPDATE ON user_memory BEGIN
+            INSERT INTO user_memory_fts(user_memory_fts, rowid, key, value)
+            VALUES ('delete', old.id, old.key, old.value);
+            INSERT INTO user_memory_fts(rowid, key, value)
+            VALUES (new.id, new.key, new.value);
+        END;
+        """
+    )
+    conn.execute("INSERT INTO user_memory_fts(user_memory_fts) VALUES ('rebuild')")
+
+
+# Applied in order; PRAGMA user_version records how far a database has got.
+def _migrate_v3(conn: sqlite3.Connection) -> None:
+    # Lets the recall indexes page through facts by (created, id) instead of
+    # scanning and sorting the whole table for every page.
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_user_memory_created ON user_memory(created, id)")
+
+
+MIGRATIONS = (_migrate_v1, _migrate_v2, _migrate_v3)
+
+_STOPWORDS = frozenset(
+    "a an and are as at be but by do for from have how i if in is it me my "
+    "of on or so that the this to was what when where who why with you your".split()
+)
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def match_query(text: str, max_terms: int = 8) -> str:
+    """
+    Turn a free-text chat message into an FTS5 OR-query of its distinct terms.
+    Returns "" when nothing searchable is left.
+    """
+    terms: List[str] = []
+    for w in _WORD.findall((text or "").lower()):
+        if len(w) < 2 or w in _STOPWORDS or w in terms:
+            continue
+        terms.append(w)
+        if len(terms) >= max_terms:
+            break
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+class MemoryDB:
+    """
+    Shared SQLite access layer for user / session / knowledge memory.
+    - Bounded pool of long-lived connections (no connect per request)
+    - WAL journaling so readers never block the writer
+    - Configurable synchronous mode (MEMORY_DB_SYNCHRONOUS, default NORMAL)
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        synchronous: Optional[str] = None,
+        timeout_s: float = 5.0,
+        durability: Optional[str] = None,
+    ) -> None:
+        self.path = path or os.getenv("MEMORY_DB_PATH", "memory.db")
+        self.pool_size = max(1, pool_size or _env_int("MEMORY_DB_POOL_SIZE", 4))
+
+        sync = (synchronous or os.getenv("MEMORY_DB_SYNCHRONOUS") or "NORMAL").strip().upper()
+        self.synchronous = sync if sync in _SYNC_MODES else "NORMAL"
+        self.timeout_s = timeout_s
+
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=self.pool_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.fts_enabled = False
+
+        self.init_schema()
+
+        # sync (default) | batched | async -- see core/writer.py
+        self._writer = GroupCommitWriter(
+            self._commit_batch,
+            mode=durability or durability_from_env("MEMORY_DB_DURABILITY"),
+            max_batch=_env_int("MEMORY_DB_BATCH", 256),
+            interval_s=_env_int("MEMORY_DB_FLUSH_MS", 20) / 1000.0,
+            name="memory-db-writer",
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout_s,
+            check_same_thread=False,
+            cached_statements=64,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a pooled connection. Opens a new one only while the pool is
+        below pool_size; otherwise blocks until another caller returns one.
+        """
+        if self._closed:
+            raise RuntimeError("MemoryDB is closed")
+
+        conn: Optional[sqlite3.Connection] = None
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.pool_size:
+                    self._created += 1
+                    try:
+                        conn = self._connect()
+                    except Exception:
+                        self._created -= 1
+                        raise
+            if conn is None:
+                conn = self._pool.get(timeout=self.timeout_s)
+
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._pool.put(conn)
+
+    def init_schema(self) -> None:
+        with self.connection() as conn:
+            for stmt in SCHEMA:
+                conn.execute(stmt)
+            conn.commit()
+
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for target, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+                try:
+                    migrate(conn)
+                except sqlite3.OperationalError as e:
+                    # Most likely an SQLite build without FTS5: stay on the
+                    # previous version and serve recency-only recall.
+                    conn.rollback()
+                    print(f"memory_db: migration v{target} skipped: {e}")
+                    break
+                conn.execute(f"PRAGMA user_version={target}")
+                conn.commit()
+
+            self.fts_enabled = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name='user_memory_fts'"
+            ).fetchone() is not None
+
+    def _commit_batch(self, batch: List[Tuple[str, Tuple[Any, ...]]]) -> None:
+        # Group commit: every queued write in one transaction / one fsync.
+        with self.connection() as conn:
+            for sql, params in batch:
+                conn.execute(sql, params)
+            conn.commit()
+
+    def _settle(self, user_id: str) -> None:
+        # Read-your-writes: a fact this user saved a moment ago must be
+        # visible. Only their queued facts are waited for.
+        self._writer.flush(key=user_id)
+
+    # -------------------------
+    # user_memory
+    # -------------------------
+
+    def load_user_memory(self, user_id: str, limit: int = 20) -> List[Tuple[str, str]]:
+        self._settle(user_id)
+        with self.connection() as conn:
+            return conn.execute(SQL_LOAD_RECENT, (user_id, limit)).fetchall()
+
+    def all_user_memory(self, user_id: str) -> List[Tuple[str, str]]:
+        self._settle(user_id)
+        with self.connection() as conn:
+            return conn.execute(SQL_LOAD_ALL, (user_id,)).fetchall()
+
+    def search_user_memory(self, user_id: str, text: str, limit: int = 20) -> List[Tuple[str, str]]:
+        """
+        The user's facts that share a term with text, most overlapping first
+        (a term found in the key counts double). Empty when FTS5 is unavailable
+        or the text has no searchable terms.
+
+        Each of the user's rows is probed against every term's posting list,
+        and those lists grow with the whole table: ~4 ms a query at 3M rows
+        in bench/bench_recall.py. server.py's ranked mode therefore goes
+        through core/recall_index.py, whose postings are per user.
+        """
+        query = match_query(text)
+        if not self.fts_enabled or not query:
+            return []
+        self._settle(user_id)
+        with self.connection() as conn:
+            try:
+                rows = conn.execute(SQL_SEARCH, (user_id, query)).fetchall()
+            except sqlite3.OperationalError:
+                return []
+
+        terms = set(_WORD.findall(text.lower()))
+
+        def score(row: Tuple[str, str]) -> int:
+            k, v = row
+            return 2 * len(terms.intersection(_WORD.findall(k.lower()))) + len(
+                terms.intersection(_WORD.findall(v.lower()))
+            )
+
+        rows.sort(key=score, reverse=True)
+        return rows[:limit]
+
+    def recall_user_memory(self, user_id: str, text: str, limit: int = 20) -> List[Tuple[str, str]]:
+        """
+        Relevance-ranked facts first, topped up with the most recent ones.
+        """
+        rows = self.search_user_memory(user_id, text, limit)
+        if len(rows) < limit:
+            seen = {k for k, _ in rows}
+            for k, v in self.load_user_memory(user_id, limit):
+                if k not in seen:
+                    rows.append((k, v))
+                    if len(rows) >= limit:
+                        break
+        return rows
+
+    def save_user_memory(self, user_id: str, key: str, value: str) -> None:
+        self._writer.submit((SQL_INSERT, (user_id, key, value)), key=user_id)
+
+    # -------------------------
+    # session_memory
+    # -------------------------
+
+    def save_session_turn(self, user_id: str, message: str, response: str) -> None:
+        # Never read back on the request path, so no reader waits for it
+        self._writer.submit((SQL_INSERT_SESSION, (user_id, message, response)))
+
+    def optimize(self) -> None:
+        """
+        Merge FTS5 segments and refresh planner stats. Worth running after bulk
+        loads or from a periodic maintenance job.
+        """
+        with self.connection() as conn:
+            if self.fts_enabled:
+                conn.execute("INSERT INTO user_memory_fts(user_memory_fts) VALUES ('optimize')")
+            conn.execute("PRAGMA optimize")
+            conn.commit()
+
+    def flush(self) -> None:
+        self._writer.flush()
+
+    def writer_stats(self) -> Dict[str, Any]:
+        return self._writer.stats()
+
+    def close(self) -> None:
+        self._writer.close()
+        self._closed = True
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_instances: Dict[str, MemoryDB] = {}
+_instances_lock = threading.Lock()
+
+
+def get_db(path: Optional[str] = None) -> MemoryDB:
+    """
+    Process-wide MemoryDB per database path, so every entry point shares one pool.
+    """
+    path = path or os.getenv("MEMORY_DB_PATH", "memory.db")
+    with _instances_lock:
+        db = _instances.get(path)
+        if db is None:
+            db = MemoryDB(path=path)
+            _instances[path] = db
+        return db
@@ -0,0 +1,220 @@
+# core/prompt.py
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+# Chat format overhead per message (role + separators) and for priming the reply
+_PER_MESSAGE = 4
+_REPLY_PRIMING = 3
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str) -> Any:
+    """
+    Local tiktoken encoding for model, loaded once per process. None when
+    tiktoken is not installed (or its BPE file cannot be loaded), in which
+    case counts fall back to a bytes/4 estimate.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        print("==== TOKENS: tiktoken not installed, budgeting with a bytes/4 estimate (pip install tiktoken) ====")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"==== TOKENS: no tiktoken encoding ({e}), budgeting with a bytes/4 estimate ====")
+            return None
+    except Exception as e:
+        # The BPE file is downloaded on first use; TIKTOKEN_CACHE_DIR keeps it
+        print(f"==== TOKENS: no tiktoken encoding ({e}), budgeting with a bytes/4 estimate ====")
+        return None
+
+
+def _get(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+class PromptCacheStats:
+    """
+    Accumulates provider usage to report how much of each prompt was served
+    from the upstream prompt cache (usage.prompt_tokens_details.cached_tokens).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, usage: Any) -> None:
+        if usage is None:
+            return
+        prompt_tokens = _get(usage, "prompt_tokens") or 0
+        cached = _get(_get(usage, "prompt_tokens_details"), "cached_tokens") or 0
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_fraction": (self.cached_tokens / self.prompt_tokens) if self.prompt_tokens else 0.0,
+            }
+
+
+# Process-wide, fed by every provider call site
+cache_stats = PromptCacheStats()
+
+
+class PromptAssembler:
+    """
+    Builds the chat message list inside a token budget, laid out so the
+    prompt prefix is as stable as possible for upstream prompt caching:
+
+        [system: static identity text]    identical for every user
+        [system: memory block]            changes only when facts change
+        [history ...]                     append-only between turns
+        [system: context block]           depends on the new message
+        [user: new message]
+
+    - system prompt, memory block, context block and the new user message
+      are always sent
+    - memory facts are kept in the order given until facts_budget is used
+    - history is kept newest-first until the overall budget is used, then
+      restored to chronological order
+    Token counts are memoized per string, so re-assembling the same history
+    on the next turn is a dictionary lookup per message.
+    """
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        budget_tokens: Optional[int] = None,
+        facts_budget_tokens: Optional[int] = None,
+        cache_size: int = 8192,
+    ) -> None:
+        self.model = model or (os.getenv("SHINE_MODEL") or "gpt-4o-mini").strip()
+        self.budget_tokens = budget_tokens or _env_int("SHINE_PROMPT_TOKEN_BUDGET", 6000)
+        self.facts_budget_tokens = facts_budget_tokens or _env_int("SHINE_FACTS_TOKEN_BUDGET", 800)
+        self.cache_size = max(1, cache_size)
+
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, text: str) -> int:
+        with self._lock:
+            n = self._counts.get(text)
+            if n is not None:
+                self._counts.move_to_end(text)
+                self.hits += 1
+                return n
+            self.misses += 1
+
+        enc = _encoding(self.model)
+        if enc is not None:
+            n = len(enc.encode(text, disallowed_special=()))
+        else:
+            n = (len(text.encode("utf-8")) + 3) // 4
+
+        with self._lock:
+            self._counts[text] = n
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return n
+
+    def message_tokens(self, msg: Dict[str, str]) -> int:
+        return self.count(msg.get("content") or "") + _PER_MESSAGE
+
+    def fit_facts(self, facts: List[str]) -> List[str]:
+        kept: List[str] = []
+        used = 0
+        for fact in facts:
+            n = self.count(fact) + 1  # newline
+            if used + n > self.facts_budget_tokens:
+                break
+            kept.append(fact)
+            used += n
+        return kept
+
+    def memory_block(self, facts: List[str], header: str = "Known user facts:") -> str:
+        """
+        Facts (given most relevant / most recent first) that fit the facts
+        budget, rendered oldest-first. For a user whose facts all fit, a
+        newly learned fact extends the end of the block and the lines before
+        it stay cacheable. Once the caller's limit or the budget cuts facts
+        off, the oldest line drops off the front and the whole block
+        changes. A block chosen per message (relevance-ranked facts) changes
+        on every request: pass it to build() as context_block, not
+        memory_block.
+        """
+        kept = self.fit_facts(facts)
+        if not kept:
+            return ""
+        kept.reverse()
+        return header + "\n" + "\n".join(kept)
+
+    def build(
+        self,
+        system_prompt: str,
+        history: List[Dict[str, str]],
+        user_message: str,
+        memory_block: Optional[str] = None,
+        context_block: Optional[str] = None,
+    ) -> List[Dict[str, str]]:
+        fixed = [{"role": "system", "content": system_prompt}]
+        if memory_block:
+            fixed.append({"role": "system", "content": memory_block})
+        # Anything chosen per message goes after the history, so it never
+        # changes the cached prefix
+        tail = [{"role": "system", "content": context_block}] if context_block else []
+        tail.append({"role": "user", "content": user_message})
+
+        remaining = self.budget_tokens - _REPLY_PRIMING
+        for msg in fixed + tail:
+            remaining -= self.message_tokens(msg)
+
+        kept: List[Dict[str, str]] = []
+        for msg in reversed(history):
+            n = self.message_tokens(msg)
+            if n > remaining:
+                break
+            kept.append(msg)
+            remaining -= n
+        kept.reverse()
+
+        return fixed + kept + tail
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tokenizer": "tiktoken" if _encoding(self.model) is not None else "estimate",
+                "budget_tokens": self.budget_tokens,
+                "facts_budget_tokens": self.facts_budget_tokens,
+                "cached_counts": len(self._counts),
+                "hits": self.hits,
+                "misses": self.misses,
+                "upstream_cache": cache_stats.snapshot(),
+            }
@@ -0,0 +1,1009 @@
+# core/recall_index.py
+#
+# Inverted index over everything recall can draw on: user_memory facts,
+# knowledge_memory rows and the conversation JSONL files. Live writes go
+# into an in-memory delta; a background thread merges it into one binary
+# file, RecallIndex/recall.bin, which is memory-mapped on first use
+# (startup only parses the header and the meta block).
+#
+# Layout of recall.bin (little-endian, every column 8-byte aligned):
+#
+#   header        64 bytes  magic "SHRIX001", version, meta_len, docs, terms,
+#                           doc_heap_len, post_heap_len
+#   meta          JSON      source cursors, fact key / topic counts
+#   kinds         uint8[docs]        0 fact, 1 knowledge, 2 turn
+#   doc_offsets   uint64[docs + 1]   doc i is "scope\x1fref\x1ftext" in doc_heap
+#   keys          uint64[terms]      term keys, sorted
+#   post_offsets  uint64[terms + 1]  postings of term j in post_heap
+#   counts        uint32[terms]      document frequency
+#   lasts         uint32[terms]      highest doc id in the postings
+#   heaps         doc_heap, post_heap
+#
+# A term key is a 64-bit hash of (scope, term), where the scope is the
+# first 16 hex digits of the sha1 core/memory.py shards users by ("*" for
+# knowledge, "" for the shared history): fixed width, so lookups bisect
+# the mapped column directly, and a query only walks the asking user's
+# lists plus the knowledge ones. The empty term lists every document of a
+# scope; its count is the N in that scope's IDF. Postings are ascending
+# doc ids stored as varint-encoded gaps.
+#
+#   python -m core.recall_index build [--db memory.db] [--data DATA_DIR]
+#   python -m core.recall_index query USER TEXT [-k 5]
+
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.memory import user_key
+from core.memory_db import _STOPWORDS, _WORD
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECALL_INDEX_DIR = os.getenv("RECALL_INDEX_DIR", os.path.join(_ROOT, "RecallIndex"))
+# Rows read from memory.db per query while catching up
+SYNC_CHUNK = _env_int("RECALL_SYNC_CHUNK", 5000)
+
+MAGIC = b"SHRIX001"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIQQQQ16x")  # 64 bytes
+
+FACT, KNOWLEDGE, TURN = 0, 1, 2
+KINDS = ("fact", "knowledge", "turn")
+
+SHARED = ""  # the shared, user-less conversation files
+GLOBAL = "*"  # knowledge_memory, visible to every user
+_SEP = "\x1f"
+
+# Keyset pages over ix_user_memory_created (memory_db migration v3): the rest
+# of the cursor's second, then later seconds. Two exact index ranges; a
+# (created, id) > (?, ?) row value would rescan a busy second on every page.
+SQL_SYNC_FACTS = (
+    "SELECT * FROM (SELECT user_id, key, value, created, id FROM user_memory "
+    "WHERE created = ? AND id > ? ORDER BY id LIMIT ?) "
+    "UNION ALL SELECT * FROM (SELECT user_id, key, value, created, id FROM user_memory "
+    "WHERE created > ? ORDER BY created, id LIMIT ?) LIMIT ?"
+)
+SQL_SYNC_KNOWLEDGE = "SELECT id, topic, content FROM knowledge_memory WHERE id > ? ORDER BY id LIMIT ?"
+
+
+def _pad(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+def scope_of(user: Optional[Any]) -> str:
+    # 64 bits of the user's sha1: it is repeated in every term key
+    return user_key(str(user))[:16] if user is not None and str(user).strip() else SHARED
+
+
+def term_key(scope: str, term: str) -> int:
+    digest = hashlib.blake2b((scope + _SEP + term).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def terms(text: str, max_terms: Optional[int] = None) -> List[str]:
+    # Distinct words, same rules as memory_db.match_query; "favourite_food" -> two terms
+    out: List[str] = []
+    seen = set()
+    for w in _WORD.findall((text or "").replace("_", " ").lower()):
+        if len(w) < 2 or len(w) > 64 or w in _STOPWORDS or w in seen:
+            continue
+        seen.add(w)
+        out.append(w)
+        if max_terms is not None and len(out) >= max_terms:
+            break
+    return out
+
+
+def fact_pages(db: Any, since: str, chunk: int = SYNC_CHUNK) -> Iterator[List[Tuple[Any, ...]]]:
+    """
+    (user_id, key, value, created, id) rows created at or after since, in
+    (created, id) order, chunk rows per query. Each page borrows its own
+    connection, so a long catch-up never holds one or loads the table.
+    """
+    created, row_id = since, 0
+    while True:
+        with db.connection() as conn:
+            rows = conn.execute(SQL_SYNC_FACTS, (created, row_id, chunk, created, chunk, chunk)).fetchall()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk:
+            return
+        created, row_id = rows[-1][3], rows[-1][4]
+
+
+def encode_postings(ids: Iterable[int], last: int = 0, out: Optional[bytearray] = None) -> bytearray:
+    """
+    Append ascending ids to out as varint gaps from last (the previous id
+    already in out, 0 for an empty list).
+    """
+    out = bytearray() if out is None else out
+    for i in ids:
+        d = i - last
+        last = i
+        while d >= 0x80:
+            out.append((d & 0x7F) | 0x80)
+            d >>= 7
+        out.append(d)
+    return out
+
+
+def decode_postings(buf: Any) -> List[int]:
+    if not isinstance(buf, (bytes, bytearray)):
+        buf = bytes(buf)
+    if max(buf, default=0) < 0x80:
+        # Every gap fits in one byte (dense lists): a running sum in C
+        return list(accumulate(buf))
+    ids: List[int] = []
+    cur = d = shift = 0
+    for b in buf:
+        d |= (b & 0x7F) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            cur += d
+            ids.append(cur)
+            d = shift = 0
+    return ids
+
+
+def ref_key(kind: int, scope: str, ref: str) -> int:
+    # Exact lookup of a fact / knowledge row by its key; never a query term
+    return term_key(scope, f"\x1e{kind}:{ref}")
+
+
+def doc_keys(kind: int, scope: str, ref: str, text: str) -> List[int]:
+    # Term keys a document is listed under; a fact's key is searchable too
+    if kind == TURN:
+        return [term_key(scope, t) for t in [""] + terms(text)]
+    return [ref_key(kind, scope, ref)] + [term_key(scope, t) for t in [""] + terms(ref + " " + text)]
+
+
+def _rebase(buf: bytes, last: int) -> bytes:
+    # buf holds gaps from 0; re-encode its first id as a gap from last
+    n = 0
+    while buf[n] & 0x80:
+        n += 1
+    first = decode_postings(buf[:n + 1])[0]
+    return bytes(encode_postings((first,), last)) + bytes(buf[n + 1:])
+
+
+class _Base:
+    """
+    The persisted index, read in place from the mmap. Empty when the file
+    is missing or unreadable.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.docs = 0
+        self.terms = 0
+        self.meta: Dict[str, Any] = {}
+        self._mm: Optional[mmap.mmap] = None
+        self._views: List[memoryview] = []
+        self.kinds = self.doc_heap = self.post_heap = memoryview(b"")
+        self.doc_offsets = self.post_offsets = memoryview(bytes(8)).cast("Q")
+        self.keys = memoryview(b"").cast("Q")
+        self.counts = self.lasts = memoryview(b"").cast("I")
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < _HEADER.size:
+                    return
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            return
+
+        magic, version, meta_len, docs, nterms, doc_len, post_len = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            print(f"==== recall index: {path} is not a v{VERSION} index, starting empty")
+            mm.close()
+            return
+
+        view = memoryview(mm)
+        off = _HEADER.size
+
+        def take(n: int, fmt: Optional[str] = None) -> memoryview:
+            nonlocal off
+            v = view[off:off + n]
+            off += n + _pad(n)
+            v = v.cast(fmt) if fmt else v
+            self._views.append(v)
+            return v
+
+        self.meta = json.loads(bytes(view[off:off + meta_len]))
+        off += meta_len + _pad(meta_len)
+        self.kinds = take(docs)
+        self.doc_offsets = take(8 * (docs + 1), "Q")
+        self.keys = take(8 * nterms, "Q")
+        self.post_offsets = take(8 * (nterms + 1), "Q")
+        self.counts = take(4 * nterms, "I")
+        self.lasts = take(4 * nterms, "I")
+        self.doc_heap = take(doc_len)
+        self.post_heap = take(post_len)
+        self._views.append(view)
+        self._mm = mm
+        self.docs = docs
+        self.terms = nterms
+
+    def find(self, key: int) -> int:
+        # Row of key in the sorted key column, -1 when absent
+        j = bisect_left(self.keys, key)
+        return j if j < self.terms and self.keys[j] == key else -1
+
+    def postings(self, j: int) -> memoryview:
+        return self.post_heap[self.post_offsets[j]:self.post_offsets[j + 1]]
+
+    def raw_doc(self, i: int) -> bytes:
+        return self.doc_heap[self.doc_offsets[i]:self.doc_offsets[i + 1]].tobytes()
+
+    def doc(self, i: int) -> Optional[Tuple[int, str, str, str]]:
+        raw = self.raw_doc(i)
+        if not raw:
+            return None  # dropped when the index was last saved
+        scope, ref, text = raw.decode("utf-8").split(_SEP, 2)
+        return self.kinds[i], scope, ref, text
+
+    def close(self) -> None:
+        for v in reversed(self._views):
+            v.release()
+        self._views = []
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self.docs = self.terms = 0
+
+
+class _Delta:
+    """
+    Documents added since the base was written. Ids continue from `first`;
+    postings per term key are [count, last id, varint gaps].
+    """
+
+    def __init__(self, first: int) -> None:
+        self.first = first
+        self.docs: List[Tuple[int, str, str, str]] = []
+        self.postings: Dict[int, list] = {}
+
+    @property
+    def end(self) -> int:
+        return self.first + len(self.docs)
+
+    def add(self, kind: int, scope: str, ref: str, text: str) -> int:
+        doc_id = self.end
+        self.docs.append((kind, scope, ref, text))
+        for key in doc_keys(kind, scope, ref, text):
+            p = self.postings.get(key)
+            if p is None:
+                self.postings[key] = [1, doc_id, encode_postings((doc_id,))]
+            else:
+                encode_postings((doc_id,), p[1], p[2])
+                p[0] += 1
+                p[1] = doc_id
+        return doc_id
+
+    def extend(self, later: "_Delta") -> None:
+        # Put a newer delta's documents after ours (a failed save undoing its freeze)
+        for doc in later.docs:
+            self.add(*doc)
+
+
+class RecallIndex:
+    """
+    Incremental inverted index for prompt recall.
+
+    - add_fact() / add_turns() index a write as it happens; sync() catches
+      up from the sources (user_memory by `created`, knowledge_memory by id,
+      each JSONL by line count) for anything written elsewhere
+    - top_k() scores the user's documents plus shared knowledge by summed
+      IDF of the query terms, newest first on ties; a fact replaced by a
+      newer value and history removed with forget() are never returned
+    - the base file is mapped lazily on first use; every
+      SHINE_RECALL_SAVE_S a background thread writes base + delta to a new
+      file (dropping stale documents) and swaps it in, and refreshes
+      RecallMap.json (fact keys) and Topics.json (knowledge topics)
+    - one process owns the directory (flock on RecallIndex/.lock); others
+      still index in memory but do not save
+    """
+
+    def __init__(self, directory: Optional[str] = None, save_interval_s: Optional[float] = None) -> None:
+        self.directory = directory or RECALL_INDEX_DIR
+        self.path = os.path.join(self.directory, "recall.bin")
+        self.save_interval_s = max(1.0, save_interval_s or _env_int("SHINE_RECALL_SAVE_S", 30))
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._base: Optional[_Base] = None
+        self._frozen: Optional[_Delta] = None  # being written by save()
+        self._delta: Optional[_Delta] = None
+        # Replaced facts / knowledge rows not yet dropped from the file
+        self._dropped: set = set()
+        # "scope:mode" -> turns of that conversation below this id were forgotten
+        self._forgotten: Dict[str, int] = {}
+        self._cursors: Dict[str, Any] = {}
+        # "scope:mode" -> lines indexed live before the file was first scanned
+        self._live: Dict[str, int] = {}
+        self._dirty = False
+        self._lock_file = None
+        self._owner: Optional[bool] = None
+
+        self._db = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.queries = 0
+        self.added = 0
+        self.saves = 0
+        self.save_ms = 0.0
+        self.errors = 0
+
+    # ----- loading -----
+
+    def _ensure(self) -> None:
+        # Caller holds self._lock
+        if self._base is not None:
+            return
+        self._base = _Base(self.path)
+        cursors = self._base.meta.get("cursors") or {}
+        self._cursors = {
+            "facts": cursors.get("facts", ""),
+            "knowledge": int(cursors.get("knowledge", 0)),
+            "files": dict(cursors.get("files") or {}),
+        }
+        self._live = dict(cursors.get("live") or {})
+        self._delta = _Delta(self._base.docs)
+        self._thread = threading.Thread(target=self._run, name="recall-index", daemon=True)
+        self._thread.start()
+
+    def _doc(self, doc_id: int) -> Optional[Tuple[int, str, str, str]]:
+        if doc_id < self._base.docs:
+            return self._base.doc(doc_id)
+        for d in (self._frozen, self._delta):
+            if d is not None and doc_id < d.end:
+                return d.docs[doc_id - d.first]
+        return None
+
+    def _df(self, key: int) -> Tuple[int, int]:
+        # (document frequency, row in the base or -1)
+        j = self._base.find(key)
+        df = self._base.counts[j] if j >= 0 else 0
+        for d in (self._frozen, self._delta):
+            p = d.postings.get(key) if d is not None else None
+            if p is not None:
+                df += p[0]
+        return df, j
+
+    def _postings(self, key: int, j: Optional[int] = None) -> List[int]:
+        if j is None:
+            j = self._base.find(key)
+        ids = decode_postings(self._base.postings(j)) if j >= 0 else []
+        for d in (self._frozen, self._delta):
+            p = d.postings.get(key) if d is not None else None
+            if p is not None:
+                ids.extend(decode_postings(p[2]))
+        return ids
+
+    def _stale(self, doc_id: int, kind: int, scope: str, ref: str) -> bool:
+        if kind == TURN:
+            return doc_id < max(
+                self._forgotten.get(scope + ":" + ref.split(":", 1)[0], 0),
+                self._forgotten.get(scope + ":*", 0),
+            )
+        return doc_id in self._dropped
+
+    def _newest(self, kind: int, scope: str, ref: str) -> Optional[int]:
+        # Doc id of the live version of a fact / knowledge row
+        for i in reversed(self._postings(ref_key(kind, scope, ref))):
+            if i not in self._dropped:
+                doc = self._doc(i)
+                if doc is not None and doc[1] == scope and doc[2] == ref:
+                    return i
+        return None
+
+    def _current(self, kind: int, scope: str, ref: str) -> Optional[str]:
+        doc_id = self._newest(kind, scope, ref)
+        return self._doc(doc_id)[3] if doc_id is not None else None
+
+    # ----- writes -----
+
+    def _add(self, kind: int, scope: str, ref: str, text: str) -> int:
+        if kind != TURN:
+            old = self._newest(kind, scope, ref)
+            if old is not None:
+                self._dropped.add(old)
+        doc_id = self._delta.add(kind, scope, ref, text.replace(_SEP, " "))
+        self.added += 1
+        self._dirty = True
+        return doc_id
+
+    def add_fact(self, user_id: Any, key: str, value: str) -> None:
+        with self._lock:
+            self._ensure()
+            self._add(FACT, scope_of(user_id), str(key), str(value))
+
+    def add_turns(self, user: Optional[str], mode: str, msgs: List[Dict[str, str]]) -> None:
+        """
+        Index messages just appended to the (user, mode) history, in order.
+        """
+        scope = scope_of(user)
+        source = f"{scope}:{mode}"
+        with self._lock:
+            self._ensure()
+            for m in msgs:
+                if m.get("role") in ("user", "assistant") and (m.get("content") or "").strip():
+                    self._add(TURN, scope, f"{mode}:{m['role']}", m["content"])
+            files = self._cursors["files"]
+            if source in files:
+                files[source] += len(msgs)
+            else:
+                # Not scanned yet: sync() skips these when it gets to the file
+                self._live[source] = self._live.get(source, 0) + len(msgs)
+            self._dirty = True
+
+    def add_turn(self, user: Optional[str], mode: str, user_content: str, assistant_content: str) -> None:
+        self.add_turns(user, mode, [
+            {"role": "user", "content": user_content},
+            {"role": "assistant", "content": assistant_content},
+        ])
+
+    def forget(self, user: Optional[str], mode: str = "all") -> None:
+        """
+        Drop indexed history of one conversation (or, with mode="all",
+        every mode of that user), e.g. after MemoryStore.clear().
+        """
+        scope = scope_of(user)
+        with self._lock:
+            self._ensure()
+            files = self._cursors["files"]
+            if mode == "all":
+                self._forgotten[f"{scope}:*"] = self._delta.end
+                sources = [s for s in set(files) | set(self._live) if s.startswith(scope + ":")]
+            else:
+                self._forgotten[f"{scope}:{mode}"] = self._delta.end
+                sources = [f"{scope}:{mode}"]
+            for source in sources:
+                files[source] = 0
+                self._live.pop(source, None)
+            self._dirty = True
+
+    # ----- queries -----
+
+    def top_k(
+        self,
+        user: Optional[Any],
+        text: str,
+        k: int = 5,
+        kinds: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        The k documents sharing the most (IDF-weighted) terms with text:
+        [{"kind", "ref", "text", "score"}], best first. For facts ref is the
+        key; for knowledge the row id; for turns "mode:role".
+        """
+        qterms = terms(text, max_terms=16)
+        wanted = {KINDS.index(name) for name in kinds} if kinds else None
+        if not qterms or k <= 0:
+            return []
+        scopes = [scope_of(user)]
+        if wanted is None or KNOWLEDGE in wanted:
+            scopes.append(GLOBAL)
+
+        with self._lock:
+            self._ensure()
+            self.queries += 1
+            scores: Dict[int, float] = {}
+            for scope in scopes:
+                n, _ = self._df(term_key(scope, ""))
+                if not n:
+                    continue
+                found = sorted((df, j, key) for df, j, key in (
+                    self._df(key) + (key,) for key in (term_key(scope, t) for t in qterms)
+                ) if df)
+                for rank, (df, j, key) in enumerate(found):
+                    # Rarest first; a term in more than 1/8 of the scope's
+                    # documents (IDF < log 9) only counts when nothing rarer matched
+                    if rank and 8 * df > n and n >= 64:
+                        break
+                    w = math.log(1.0 + n / df)
+                    for i in self._postings(key, j):
+                        scores[i] = scores.get(i, 0.0) + w
+
+            out: List[Dict[str, Any]] = []
+            seen = set()
+            # Ties go to the newer document
+            for score, doc_id in heapq.nlargest(4 * k + 8, zip(scores.values(), scores.keys())):
+                doc = self._doc(doc_id)
+                if doc is None:
+                    continue
+                kind, scope, ref, body = doc
+                # (a 64-bit key collision could list someone else's document)
+                if scope not in scopes or (wanted is not None and kind not in wanted):
+                    continue
+                if self._stale(doc_id, kind, scope, ref):
+                    continue
+                if kind != TURN:
+                    if (kind, ref) in seen:
+                        continue
+                    seen.add((kind, ref))
+                out.append({"kind": KINDS[kind], "ref": ref, "text": body, "score": round(score, 4)})
+                if len(out) >= k:
+                    break
+            return out
+
+    def facts(
+        self, user_id: Any, text: str, k: int = 20, kinds: Iterable[str] = ("fact", "knowledge")
+    ) -> List[Tuple[str, str]]:
+        # (key, value) rows shaped like MemoryDB.recall_user_memory; knowledge as (topic, content)
+        rows = []
+        for hit in self.top_k(user_id, text, k, kinds=kinds):
+            if hit["kind"] == "fact":
+                rows.append((hit["ref"], hit["text"]))
+            else:
+                topic, _, content = hit["text"].partition(": ")
+                rows.append((topic, content))
+        return rows
+
+    # ----- catch-up from the sources -----
+
+    def attach(self, db: Any = None) -> None:
+        # knowledge_memory has no write path in this repo: poll it on each save tick
+        self._db = db
+
+    def sync(self, db: Any = None, data_dir: Optional[str] = None) -> int:
+        """
+        Index whatever the sources hold beyond the saved cursors. Returns the
+        number of documents added.
+        """
+        added = 0
+        with self._lock:
+            self._ensure()
+        if db is not None:
+            added += self._sync_db(db)
+        if data_dir is not None:
+            added += self._sync_files(data_dir)
+        return added
+
+    def _sync_db(self, db: Any, facts: bool = True) -> int:
+        db.flush()
+        added = 0
+        pages = fact_pages(db, self._cursors["facts"]) if facts else ()
+        for rows in pages:
+            with self._lock:
+                for user_id, key, value, created, _ in rows:
+                    scope = scope_of(user_id)
+                    # Same second as the cursor: may already be indexed
+                    if self._current(FACT, scope, str(key)) == str(value):
+                        continue
+                    self._add(FACT, scope, str(key), str(value))
+                    self._cursors["facts"] = str(created or "")
+                    added += 1
+                if added:
+                    self._dirty = True
+        while True:
+            with db.connection() as conn:
+                knowledge = conn.execute(SQL_SYNC_KNOWLEDGE, (self._cursors["knowledge"], SYNC_CHUNK)).fetchall()
+            with self._lock:
+                for row_id, topic, content in knowledge:
+                    self._add(KNOWLEDGE, GLOBAL, str(row_id), f"{topic or ''}: {content or ''}")
+                    self._cursors["knowledge"] = row_id
+                    added += 1
+                if knowledge:
+                    self._dirty = True
+            if len(knowledge) < SYNC_CHUNK:
+                break
+        return added
+
+    def _sync_files(self, data_dir: str) -> int:
+        return sum(self._sync_file(path, scope) for path, scope in _history_files(data_dir))
+
+    def _sync_file(self, path: str, scope: str) -> int:
+        mode = os.path.basename(path)[len("memory_"):-len(".jsonl")]
+        source = f"{scope}:{mode}"
+        with self._lock:
+            done = self._cursors["files"].get(source, 0)
+            live = 0 if source in self._cursors["files"] else self._live.get(source, 0)
+        batch: List[Tuple[str, str]] = []
+        n = 0
+        try:
+            with open(path, "rb") as f:
+                for n, ln in enumerate(f, start=1):
+                    if n <= done:
+                        continue
+                    try:
+                        obj = json.loads(ln)
+                    except ValueError:
+                        continue
+                    content = obj.get("content")
+                    if obj.get("role") in ("user", "assistant") and isinstance(content, str) and content.strip():
+                        batch.append((n, obj["role"], content))
+        except OSError:
+            return 0
+
+        with self._lock:
+            if self._cursors["files"].get(source, 0) != done:
+                return 0  # appended to while we read; the live path has it
+            if n < done:
+                # Shorter than what was indexed: cleared or rewritten, start over
+                self._forgotten[source] = self._delta.end
+                self._cursors["files"][source] = 0
+                self._dirty = True
+            else:
+                # The last `live` lines were indexed by add_turns() already
+                batch = [b for b in batch if b[0] <= n - live]
+                for _, role, content in batch:
+                    self._add(TURN, scope, f"{mode}:{role}", content)
+                self._live.pop(source, None)
+                self._cursors["files"][source] = n
+                self._dirty = True
+                return len(batch)
+        return self._sync_file(path, scope)
+
+    # ----- persistence -----
+
+    def _owns_directory(self) -> bool:
+        if self._owner is None:
+            os.makedirs(self.directory, exist_ok=True)
+            if fcntl is None:
+                self._owner = True
+            else:
+                self._lock_file = open(os.path.join(self.directory, ".lock"), "a")
+                try:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    self._owner = True
+                except OSError:
+                    print(f"==== recall index: {self.directory} is owned by another process, not saving")
+                    self._owner = False
+        return self._owner
+
+    def save(self) -> bool:
+        """
+        Write base + delta to a new recall.bin and switch to it. Returns
+        whether a file was written.
+        """
+        with self._save_lock:
+            with self._lock:
+                self._ensure()
+                if not self._dirty or not self._owns_directory():
+                    return False
+                frozen = self._delta
+                self._frozen = frozen
+                self._delta = _Delta(frozen.end)
+                base = self._base
+                dropped = set(self._dropped)
+                forgotten = dict(self._forgotten)
+                meta = {
+                    "cursors": dict(json.loads(json.dumps(self._cursors)), live=dict(self._live)),
+                    "keys": base.meta.get("keys") or {},
+                    "topics": base.meta.get("topics") or {},
+                    "dropped": int(base.meta.get("dropped", 0)),
+                    "saved": int(time.time()),
+                }
+                self._dirty = False
+
+            t0 = time.perf_counter()
+            try:
+                _write_index(self.path, self.directory, base, frozen, dropped, forgotten, meta)
+            except Exception as e:
+                self.errors += 1
+                print(f"==== recall index: save failed: {e}")
+                with self._lock:
+                    frozen.extend(self._delta)
+                    self._delta = frozen
+                    self._frozen = None
+                    self._dirty = True
+                return False
+
+            with self._lock:
+                self._base = _Base(self.path)
+                self._frozen = None
+                # Only what the snapshot held is in the file now: drops and
+                # forgets made during the write still apply
+                self._dropped -= dropped
+                self._forgotten = {k: v for k, v in self._forgotten.items() if forgotten.get(k) != v}
+                self.saves += 1
+                self.save_ms = (time.perf_counter() - t0) * 1000
+            base.close()
+            return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.save_interval_s):
+            try:
+                if self._db is not None:
+                    self._sync_db(self._db, facts=False)
+                self.save()
+            except Exception as e:
+                self.errors += 1
+                print(f"==== recall index: background save failed: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.save()
+        with self._lock:
+            if self._base is not None:
+                self._base.close()
+                self._base = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+                self._owner = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = self._base is not None
+            return {
+                "loaded": loaded,
+                "base_docs": self._base.docs if loaded else 0,
+                "base_terms": self._base.terms if loaded else 0,
+                "delta_docs": len(self._delta.docs) if loaded else 0,
+                "delta_terms": len(self._delta.postings) if loaded else 0,
+                "queries": self.queries,
+                "added": self.added,
+                "saves": self.saves,
+                "last_save_ms": round(self.save_ms, 1),
+                "errors": self.errors,
+            }
+
+
+def _scope_of_path(data_dir: str, path: str) -> str:
+    parent = os.path.dirname(path)
+    if os.path.abspath(parent) == os.path.abspath(data_dir):
+        return SHARED
+    return os.path.basename(parent)[:16]
+
+
+def _history_files(data_dir: str) -> Iterator[Tuple[str, str]]:
+    # (path, scope) of the shared memory_*.jsonl and every users/ab/cd/<sha1>/memory_*.jsonl
+    for root, dirs, files in os.walk(data_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.startswith("memory_") and name.endswith(".jsonl"):
+                path = os.path.join(root, name)
+                yield path, _scope_of_path(data_dir, path)
+
+
+def _write_index(
+    path: str,
+    directory: str,
+    base: _Base,
+    frozen: _Delta,
+    dropped: set,
+    forgotten: Dict[str, int],
+    meta: Dict[str, Any],
+) -> None:
+    """
+    Write base + frozen as a new file. Cost follows the size of the delta:
+    runs of base documents and terms are copied as whole slices, and only
+    the lists the delta or a dropped document touch are re-encoded.
+    """
+
+    def doc(i: int) -> Optional[Tuple[int, str, str, str]]:
+        return base.doc(i) if i < base.docs else frozen.docs[i - frozen.first]
+
+    def ids(key: int) -> List[int]:
+        j = base.find(key)
+        out = decode_postings(base.postings(j)) if j >= 0 else []
+        p = frozen.postings.get(key)
+        return out + decode_postings(p[2]) if p is not None else out
+
+    # Documents to drop: replaced facts / knowledge rows and forgotten turns
+    dead = {i for i in dropped if i < frozen.end and doc(i) is not None}
+    for source, below in forgotten.items():
+        scope, _, mode = source.partition(":")
+        for i in ids(term_key(scope, "")):
+            d = doc(i) if i < below else None
+            if d is not None and d[0] == TURN and d[1] == scope and (mode == "*" or d[2].startswith(mode + ":")):
+                dead.add(i)
+
+    keys_count = Counter(meta["keys"])
+    topics = Counter(meta["topics"])
+    dirty_keys = set()
+    for i in dead:
+        kind, scope, ref, text = doc(i)
+        dirty_keys.update(doc_keys(kind, scope, ref, text))
+        if i < base.docs:
+            # Already counted in the manifests
+            if kind == FACT:
+                keys_count[ref] -= 1
+            elif kind == KNOWLEDGE:
+                topics[text.partition(": ")[0]] -= 1
+
+    # Documents: the base heap minus dropped records, then the frozen ones
+    kinds = bytearray(base.kinds) + bytearray(d[0] for d in frozen.docs)
+    doc_offsets = array("Q")
+    doc_offsets.frombytes(base.doc_offsets.tobytes())
+    doc_heap: List[Any] = []
+    prev = shift = 0
+    dead_base = sorted(i for i in dead if i < base.docs)
+    for n, i in enumerate(dead_base):
+        a, b = base.doc_offsets[i], base.doc_offsets[i + 1]
+        doc_heap.append(base.doc_heap[prev:a])
+        prev = b
+        shift += b - a
+        stop = dead_base[n + 1] + 1 if n + 1 < len(dead_base) else base.docs + 1
+        for j in range(i + 1, stop):
+            doc_offsets[j] -= shift
+    doc_heap.append(base.doc_heap[prev:])
+    size = doc_offsets[-1]
+    for i, (kind, scope, ref, text) in enumerate(frozen.docs, start=frozen.first):
+        if i not in dead:
+            raw = (scope + _SEP + ref + _SEP + text).encode("utf-8")
+            doc_heap.append(raw)
+            size += len(raw)
+            if kind == FACT:
+                keys_count[ref] += 1
+            elif kind == KNOWLEDGE:
+                topics[text.partition(": ")[0]] += 1
+        doc_offsets.append(size)
+
+    # Terms: merge the sorted base column with the touched keys
+    out_keys, counts, lasts = array("Q"), array("I"), array("I")
+    post_offsets = array("Q", [0])
+    post_heap: List[Any] = []
+    size = 0
+    prev = 0
+
+    def copy(a: int, b: int) -> None:
+        nonlocal size
+        if a >= b:
+            return
+        out_keys.frombytes(base.keys[a:b].tobytes())
+        counts.frombytes(base.counts[a:b].tobytes())
+        lasts.frombytes(base.lasts[a:b].tobytes())
+        lo = base.post_offsets[a]
+        post_heap.append(base.post_heap[lo:base.post_offsets[b]])
+        delta = size - lo
+        post_offsets.extend(o + delta for o in base.post_offsets[a + 1:b + 1])
+        size = post_offsets[-1]
+
+    for key in sorted(dirty_keys.union(frozen.postings)):
+        j = bisect_left(base.keys, key)
+        copy(prev, j)
+        chunk, count, last = b"", 0, 0
+        if j < base.terms and base.keys[j] == key:
+            prev = j + 1
+            if key in dirty_keys:
+                listed = [i for i in decode_postings(base.postings(j)) if i not in dead]
+                chunk, count, last = bytes(encode_postings(listed)), len(listed), listed[-1] if listed else 0
+            else:
+                chunk, count, last = base.postings(j).tobytes(), base.counts[j], base.lasts[j]
+        else:
+            prev = j
+        p = frozen.postings.get(key)
+        if p is not None and key not in dirty_keys:
+            chunk = chunk + _rebase(p[2], last) if count else bytes(p[2])
+            count += p[0]
+            last = p[1]
+        elif p is not None:
+            fresh = [i for i in decode_postings(p[2]) if i not in dead]
+            if fresh:
+                chunk = bytes(encode_postings(fresh, last, bytearray(chunk)))
+                count += len(fresh)
+                last = fresh[-1]
+        if not count:
+            continue
+        out_keys.append(key)
+        counts.append(count)
+        lasts.append(last)
+        post_heap.append(chunk)
+        size += len(chunk)
+        post_offsets.append(size)
+    copy(prev, base.terms)
+
+    meta["dropped"] += len(dead)
+    meta["keys"] = {k: n for k, n in keys_count.items() if n > 0}
+    meta["topics"] = {t: n for t, n in topics.items() if n > 0}
+    meta_raw = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    doc_len = sum(len(piece) for piece in doc_heap)
+    tmp = path + ".tmp"
+    os.makedirs(directory, exist_ok=True)
+    with open(tmp, "wb") as f:
+
+        def put(*pieces: Any) -> None:
+            for piece in pieces:
+                f.write(piece)
+            f.write(b"\0" * _pad(sum(len(piece) for piece in pieces)))
+
+        f.write(_HEADER.pack(MAGIC, VERSION, len(meta_raw), len(kinds), len(out_keys), doc_len, size))
+        put(meta_raw)
+        put(kinds)
+        for column in (doc_offsets, out_keys, post_offsets, counts, lasts):
+            put(column.tobytes())
+        put(*doc_heap)
+        put(*post_heap)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+    _write_json(os.path.join(directory, "RecallMap.json"), {
+        "keys": [{"key": k, "facts": n} for k, n in Counter(meta["keys"]).most_common(1000)],
+        "docs": len(kinds) - meta["dropped"],
+        "terms": len(out_keys),
+        "updated": meta["saved"],
+    })
+    _write_json(os.path.join(directory, "Topics.json"), {
+        "topics": [{"topic": t, "entries": n} for t, n in Counter(meta["topics"]).most_common(1000)],
+    })
+
+
+def _write_json(path: str, obj: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+_instances: Dict[str, RecallIndex] = {}
+_instances_lock = threading.Lock()
+
+
+def get_index(directory: Optional[str] = None) -> RecallIndex:
+    """
+    Process-wide RecallIndex per directory. Nothing is read until the first
+    add or query.
+    """
+    directory = directory or RECALL_INDEX_DIR
+    with _instances_lock:
+        index = _instances.get(directory)
+        if index is None:
+            index = RecallIndex(directory)
+            _instances[directory] = index
+        return index
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m core.recall_index")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="index the sources beyond the saved cursors and save")
+    b.add_argument("--db", default=None)
+    b.add_argument("--data", default=os.path.join(_ROOT, "data"))
+    b.add_argument("--dir", default=None)
+    q = sub.add_parser("query", help="top-k documents for a user and a message")
+    q.add_argument("user")
+    q.add_argument("text")
+    q.add_argument("-k", type=int, default=5)
+    q.add_argument("--dir", default=None)
+    args = ap.parse_args()
+
+    index = RecallIndex(args.dir)
+    if args.cmd == "build":
+        from core.memory_db import MemoryDB
+
+        db = MemoryDB(args.db) if args.db else None
+        t0 = time.perf_counter()
+        added = index.sync(db=db, data_dir=args.data)
+        index.close()
+        print(f"indexed {added} new documents in {time.perf_counter() - t0:.2f}s; {index.stats()}")
+        if db is not None:
+            db.close()
+    else:
+        for hit in index.top_k(args.user, args.text, args.k):
+            print(f"{hit['score']:7.3f}  {hit['kind']:<9} {hit['ref']:<20} {hit['text'][:100]}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# core/resilience.py
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, Iterator, AsyncIterator, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+class ProviderUnavailable(RuntimeError):
+    """
+    Raised instead of calling the provider. Callers should answer 503 with
+    Retry-After: retry_after_s.
+    """
+
+    def __init__(self, message: str, retry_after_s: float) -> None:
+        super().__init__(message)
+        self.retry_after_s = max(1.0, retry_after_s)
+
+
+class CircuitOpenError(ProviderUnavailable):
+    pass
+
+
+class OverloadedError(ProviderUnavailable):
+    pass
+
+
+def is_upstream_failure(e: BaseException) -> bool:
+    """
+    Whether an exception says something about upstream health. Client-side
+    errors (400, 401, 404, ...) do not; 5xx, 408, 429, timeouts and
+    connection errors do.
+    """
+    retryable = getattr(e, "retryable", None)
+    if retryable is not None:
+        return bool(retryable)
+    status = getattr(e, "status_code", None)
+    if status is None:
+        status = getattr(e.__cause__, "status_code", None)
+    if status is None:
+        return True
+    return status >= 500 or status in (408, 429)
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    closed    -> calls flow; failure_threshold consecutive failures open it
+    open      -> calls fail fast until reset_timeout_s has passed
+    half_open -> up to half_open_max probe calls; a success closes the
+                 breaker, a failure re-opens it
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_s: float = 30.0, half_open_max: int = 1) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self.half_open_max = max(1, half_open_max)
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.rejected_total = 0
+        self.opened_total = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == OPEN:
+                waited = time.monotonic() - self.opened_at
+                if waited < self.reset_timeout_s:
+                    self.rejected_total += 1
+                    raise CircuitOpenError(
+                        f"Provider circuit for {self.name} is open",
+                        self.reset_timeout_s - waited,
+                    )
+                self.state = HALF_OPEN
+                self.probes = 0
+
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_max:
+                    self.rejected_total += 1
+                    raise CircuitOpenError(f"Provider circuit for {self.name} is probing", self.reset_timeout_s)
+                self.probes += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probes = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened_total += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probes = 0
+
+    def record_neutral(self) -> None:
+        # Call finished without telling us anything about upstream health
+        # (e.g. a 400); just give back a half-open probe slot.
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened_total": self.opened_total,
+                "rejected_total": self.rejected_total,
+            }
+
+
+class AdmissionController:
+    """
+    Caps in-flight provider calls at max_in_flight. Up to max_queue callers may
+    wait (at most queue_timeout_s) for a slot; anyone beyond that is shed at
+    once with OverloadedError. Slots are handed directly to the oldest waiter,
+    whether it is a thread or a coroutine.
+    """
+
+    def __init__(self, max_in_flight: int = 32, max_queue: int = 64, queue_timeout_s: float = 5.0) -> None:
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_s = queue_timeout_s
+
+        self.in_flight = 0
+        self.admitted_total = 0
+        self.shed_total = 0
+        self._waiters: Deque[Any] = deque()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_in_flight=_env_int("PROVIDER_MAX_IN_FLIGHT", 32),
+            max_queue=_env_int("PROVIDER_MAX_QUEUE", 64),
+            queue_timeout_s=_env_float("PROVIDER_QUEUE_TIMEOUT_S", 5.0),
+        )
+
+    def _try_enter(self, waiter: Any) -> bool:
+        # Caller holds the lock. True = slot taken now; False = queued.
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted_total += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.shed_total += 1
+            raise OverloadedError("Provider queue is full", self.queue_timeout_s)
+        self._waiters.append(waiter)
+        return False
+
+    def _shed_waiter(self, waiter: Any) -> bool:
+        # Caller holds the lock. True if the waiter timed out still queued.
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            return False  # a slot was handed over just as we gave up
+        self.shed_total += 1
+        return True
+
+    def acquire(self) -> None:
+        event = threading.Event()
+        with self._lock:
+            if self._try_enter(event):
+                return
+        if not event.wait(self.queue_timeout_s):
+            with self._lock:
+                if self._shed_waiter(event):
+                    raise OverloadedError("Timed out waiting for a provider slot", self.queue_timeout_s)
+
+    async def acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        waiter = (loop, fut)
+        with self._lock:
+            if self._try_enter(waiter):
+                return
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if self._shed_waiter(waiter):
+                    raise OverloadedError("Timed out waiting for a provider slot", self.queue_timeout_s)
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            if handed_over:
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self.in_flight = max(0, self.in_flight - 1)
+                return
+            # Hand the slot over; in_flight stays the same.
+            waiter = self._waiters.popleft()
+            self.admitted_total += 1
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, fut = waiter
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiters),
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "admitted_total": self.admitted_total,
+                "shed_total": self.shed_total,
+            }
+
+
+# -------------------------
+# process-wide registry
+# -------------------------
+
+admission = AdmissionController.from_env()
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(model: str) -> CircuitBreaker:
+    with _breakers_lock:
+        b = _breakers.get(model)
+        if b is None:
+            b = CircuitBreaker(
+                model,
+                failure_threshold=_env_int("BREAKER_FAILURE_THRESHOLD", 5),
+                reset_timeout_s=_env_float("BREAKER_RESET_TIMEOUT_S", 30.0),
+                half_open_max=_env_int("BREAKER_HALF_OPEN_MAX", 1),
+            )
+            _breakers[model] = b
+        return b
+
+
+def _record(breaker: CircuitBreaker, err: Optional[BaseException]) -> None:
+    if err is None:
+        breaker.record_success()
+    elif not isinstance(err, Exception) or isinstance(err, ProviderUnavailable):
+        # Cancellation / client disconnect, or shed by another guard
+        breaker.record_neutral()
+    elif is_upstream_failure(err):
+        breaker.record_failure()
+    else:
+        breaker.record_neutral()
+
+
+@contextmanager
+def guard(model: str) -> Iterator[None]:
+    """
+    Wrap one provider call: fail fast if the model's breaker is open, wait for
+    (or be shed from) an admission slot, and feed the outcome to the breaker.
+    """
+    breaker = breaker_for(model)
+    breaker.before_call()
+    try:
+        admission.acquire()
+    except ProviderUnavailable:
+        breaker.record_neutral()
+        raise
+    try:
+        yield
+    except BaseException as e:
+        _record(breaker, e)
+        raise
+    else:
+        _record(breaker, None)
+    finally:
+        admission.release()
+
+
+@asynccontextmanager
+async def guard_async(model: str) -> AsyncIterator[None]:
+    breaker = breaker_for(model)
+    breaker.before_call()
+    try:
+        await admission.acquire_async()
+    except ProviderUnavailable:
+        breaker.record_neutral()
+        raise
+    try:
+        yield
+    except BaseException as e:
+        _record(breaker, e)
+        raise
+    else:
+        _record(breaker, None)
+    finally:
+        admission.release()
+
+
+def metrics() -> Dict[str, Any]:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {
+        "breakers": {name: b.snapshot() for name, b in breakers.items()},
+        "admission": admission.snapshot(),
+    }
@@ -0,0 +1,203 @@
+# core/response_cache.py
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from core.embedding import cosine, embed, normalize
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+# After normalize(): "don't" is "don t", so the bare "t" counts too
+_NEGATION_WORDS = frozenset(
+    "no not never nothing nobody none nor t nt dont doesnt didnt cant cannot wont isnt arent "
+    "wasnt werent shouldnt wouldnt couldnt havent hasnt hadnt".split()
+)
+
+
+def _negations(norm: str) -> frozenset:
+    return frozenset(w for w in norm.split() if w in _NEGATION_WORDS)
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    Opt-in, in-process cache of replies to short repeated messages.
+
+    Key: (model, identity, normalized message, memory fingerprint)
+    - exact tier:    same normalized message (the only tier by default)
+    - semantic tier: opt-in (RESPONSE_CACHE_SEMANTIC=1), for check-ins of at
+                     most RESPONSE_CACHE_SEMANTIC_MAX_CHARS characters: local
+                     embedding with cosine >= similarity and the same
+                     negations, searched only among the newest entries
+                     sharing model / identity / fingerprint
+    Trigram similarity cannot tell "I feel like talking" from "I dont feel
+    like talking", which is why the semantic tier is off and short.
+    TTL plus LRU eviction. Only identities listed in RESPONSE_CACHE_IDENTITIES
+    (comma separated, empty = cache off) are cached, so e.g. safespace can be
+    left out.
+    """
+
+    def __init__(
+        self,
+        identities: Optional[str] = None,
+        ttl_s: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        similarity: Optional[float] = None,
+        max_chars: Optional[int] = None,
+        semantic: Optional[bool] = None,
+        semantic_max_chars: Optional[int] = None,
+        semantic_bucket: Optional[int] = None,
+    ) -> None:
+        raw = identities if identities is not None else os.getenv("RESPONSE_CACHE_IDENTITIES", "")
+        self.identities: Set[str] = {x.strip().lower() for x in raw.split(",") if x.strip()}
+        self.ttl_s = ttl_s if ttl_s is not None else _env_float("RESPONSE_CACHE_TTL_S", 600.0)
+        self.max_entries = max_entries or _env_int("RESPONSE_CACHE_MAX_ENTRIES", 2048)
+        self.similarity = similarity if similarity is not None else _env_float("RESPONSE_CACHE_SIMILARITY", 0.92)
+        self.max_chars = max_chars or _env_int("RESPONSE_CACHE_MAX_CHARS", 120)
+        if semantic is None:
+            semantic = os.getenv("RESPONSE_CACHE_SEMANTIC", "0").strip().lower() in ("1", "true", "yes", "on")
+        self.semantic = semantic
+        self.semantic_max_chars = semantic_max_chars or _env_int("RESPONSE_CACHE_SEMANTIC_MAX_CHARS", 30)
+        # Entries a semantic lookup compares against, newest first, per bucket
+        self.semantic_bucket = max(1, semantic_bucket or _env_int("RESPONSE_CACHE_SEMANTIC_BUCKET", 64))
+
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[tuple, "OrderedDict[tuple, None]"] = {}
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.saved_s = 0.0
+
+    def enabled_for(self, identity: str) -> bool:
+        return (identity or "").lower() in self.identities
+
+    def _eligible(self, identity: str, message: str) -> bool:
+        return self.enabled_for(identity) and 0 < len(message or "") <= self.max_chars
+
+    def _semantic_for(self, norm: str) -> bool:
+        return self.semantic and len(norm) <= self.semantic_max_chars
+
+    def _drop(self, key: tuple) -> None:
+        # Caller holds the lock.
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            bucket = self._buckets.get(entry["bucket"])
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self._buckets[entry["bucket"]]
+
+    def lookup(self, model: str, identity: str, message: str, memory_fp: str = "") -> Optional[str]:
+        if not self._eligible(identity, message):
+            return None
+
+        norm = normalize(message)
+        bucket = (model, identity.lower(), memory_fp)
+        key = bucket + (norm,)
+        now = time.monotonic()
+
+        with self._lock:
+            self.lookups += 1
+
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires"] > now:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.saved_s += entry["latency_s"]
+                return entry["reply"]
+            if entry is not None:
+                self._drop(key)
+
+            if not self._semantic_for(norm):
+                return None
+            # Vectors are never mutated, so they can be compared outside the lock
+            candidates = [
+                (k, self._entries[k]["vec"]) for k in self._buckets.get(bucket, ())
+                if self._entries[k]["expires"] > now
+            ]
+
+        if not candidates:
+            return None
+
+        vec = embed(norm)
+        negations = _negations(norm)
+        best_key, best_sim = None, self.similarity
+        for k, other in candidates:
+            if _negations(k[-1]) != negations:
+                continue
+            sim = cosine(vec, other)
+            if sim >= best_sim:
+                best_key, best_sim = k, sim
+        if best_key is None:
+            return None
+        with self._lock:
+            e = self._entries.get(best_key)
+            if e is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            self.saved_s += e["latency_s"]
+            return e["reply"]
+
+    def store(self, model: str, identity: str, message: str, memory_fp: str, reply: str, latency_s: float = 0.0) -> None:
+        if not reply or not self._eligible(identity, message):
+            return
+
+        norm = normalize(message)
+        bucket = (model, identity.lower(), memory_fp)
+        key = bucket + (norm,)
+        semantic = self._semantic_for(norm)
+        entry = {
+            "reply": reply,
+            "vec": embed(norm) if semantic else None,
+            "bucket": bucket,
+            "expires": time.monotonic() + self.ttl_s,
+            "latency_s": latency_s,
+        }
+
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = entry
+            if semantic:
+                members = self._buckets.setdefault(bucket, OrderedDict())
+                members[key] = None
+                while len(members) > self.semantic_bucket:
+                    members.popitem(last=False)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "identities": sorted(self.identities),
+                "semantic": self.semantic,
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "hit_rate": (hits / self.lookups) if self.lookups else 0.0,
+                "saved_latency_s": round(self.saved_s, 3),
+            }
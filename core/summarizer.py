@@ -0,0 +1,242 @@
+# core/summarizer.py
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.memory import MemoryStore
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+SummarizeFn = Callable[[str, List[Dict[str, str]], int], str]
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s")
+
+
+def extractive_summary(previous: str, msgs: List[Dict[str, str]], max_chars: int) -> str:
+    """
+    No-model fallback: the previous summary plus the first sentence of each
+    new user message not already in it, trimmed from the oldest end to
+    max_chars.
+    """
+    said = []
+    for m in msgs:
+        if m["role"] != "user":
+            continue
+        first = _SENTENCE.split(m["content"].strip(), 1)[0][:160].strip().rstrip(".") + "."
+        if len(first) > 1 and first not in previous and first not in said:
+            said.append(first)
+    text = " ".join(p for p in [previous.strip(), "User said: " + " ".join(said) if said else ""] if p)
+    if len(text) > max_chars:
+        text = text[-max_chars:]
+        text = text[text.find(" ") + 1:] if " " in text else text
+    return text
+
+
+SUMMARY_PROMPT = (
+    "You keep a running summary of a conversation between a user and their companion. "
+    "Merge the new messages into the current summary. Keep what the user shared about "
+    "themselves, their feelings, people in their life, plans, and anything they asked to "
+    "be remembered; drop small talk. Plain prose, third person, at most {max_words} words."
+)
+
+
+def summary_messages(previous: str, msgs: List[Dict[str, str]], max_chars: int) -> List[Dict[str, str]]:
+    """
+    Chat messages asking a model to fold msgs into previous (for
+    CoreEngine.generate_from_messages or any chat completion call).
+    """
+    lines = [f"{'User' if m['role'] == 'user' else 'Companion'}: {m['content']}" for m in msgs]
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT.format(max_words=max(20, max_chars // 6))},
+        {"role": "user", "content": f"Current summary:\n{previous or '(none yet)'}\n\nNew messages:\n" + "\n".join(lines)},
+    ]
+
+
+class RollingSummarizer:
+    """
+    Folds turns that fall out of a MemoryStore window into one summary per
+    conversation, cached as memory_<mode>.summary.json next to the JSONL:
+    {"summary", "covered" (lines folded so far), "updated"}.
+
+    - schedule() is all the request path does: it queues the conversation
+      for a background thread, once, however often it is called
+    - that thread reads only the lines evicted since the last fold
+      (MemoryStore.evicted) and merges them into the summary with
+      summarize_fn(previous, msgs, max_chars); extractive_summary when
+      there is none or it fails
+    - it waits for SHINE_SUMMARY_MIN_NEW evicted lines, so a fold covers
+      several turns; the summary stays under SHINE_SUMMARY_MAX_CHARS
+    - get() serves the summary from a small LRU, revalidated with one stat
+    - a fold that overlaps MemoryStore.clear() of its conversation is
+      discarded instead of writing the cleared turns back
+    - with summarize_fn every fold is one extra model call (about one per
+      min_new / 2 turns), sent through the same breaker as user traffic
+    """
+
+    def __init__(
+        self,
+        store: MemoryStore,
+        summarize_fn: Optional[SummarizeFn] = None,
+        min_new: Optional[int] = None,
+        max_chars: Optional[int] = None,
+        cache_entries: Optional[int] = None,
+    ) -> None:
+        self.store = store
+        self.summarize_fn = summarize_fn
+        self.min_new = max(1, min_new or _env_int("SHINE_SUMMARY_MIN_NEW", 4))
+        self.max_chars = max(200, max_chars or _env_int("SHINE_SUMMARY_MAX_CHARS", 1200))
+        self.cache_entries = max(1, cache_entries or _env_int("SHINE_SUMMARY_CACHE", 10000))
+
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._pending: set = set()
+        self._queue: "queue.Queue[Optional[Tuple[str, Optional[str]]]]" = queue.Queue()
+        self._idle = threading.Condition(self._lock)
+        self._busy = 0
+
+        self.folds = 0
+        self.folded_lines = 0
+        self.fallbacks = 0
+        self.errors = 0
+        self.discarded = 0
+
+        self._thread = threading.Thread(target=self._run, name="summarizer", daemon=True)
+        self._thread.start()
+
+    # ----- state file -----
+
+    def _read(self, path: str) -> Dict[str, Any]:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return {"summary": "", "covered": 0}
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is not None and entry[0] == mtime:
+                self._cache.move_to_end(path)
+                return entry[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {"summary": "", "covered": 0}
+        self._remember(path, mtime, state)
+        return state
+
+    def _remember(self, path: str, mtime: int, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[path] = (mtime, state)
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def _write(self, path: str, state: Dict[str, Any], key: Tuple[str, Optional[str]], generation: int) -> bool:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        # A clear during the fold wins: the summary of the cleared turns is dropped
+        if not self.store.replace_sidecar(key[0], key[1], generation, tmp, path):
+            with self._lock:
+                self._cache.pop(path, None)
+                self.discarded += 1
+            return False
+        self._remember(path, os.stat(path).st_mtime_ns, state)
+        return True
+
+    # ----- public API -----
+
+    def get(self, mode: str, user: Optional[str] = None) -> str:
+        return self._read(self.store.summary_path(mode, user)).get("summary", "")
+
+    def schedule(self, mode: str, user: Optional[str] = None) -> None:
+        key = (mode, user)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._queue.put(key)
+
+    def fold(self, mode: str, user: Optional[str] = None) -> bool:
+        """
+        Fold newly evicted lines into the summary now. Returns whether the
+        summary changed.
+        """
+        path = self.store.summary_path(mode, user)
+        generation = self.store.generation(mode, user)
+        state = self._read(path)
+        covered = int(state.get("covered", 0))
+        msgs, upto = self.store.evicted(mode, user, since=covered)
+        if upto - covered < self.min_new:
+            return False
+
+        previous = state.get("summary", "")
+        summary = None
+        if self.summarize_fn is not None:
+            try:
+                summary = (self.summarize_fn(previous, msgs, self.max_chars) or "").strip()[:self.max_chars]
+            except Exception as e:
+                print(f"==== summarizer: model summary failed, using extractive: {e}")
+        if not summary:
+            if self.summarize_fn is not None:
+                self.fallbacks += 1
+            summary = extractive_summary(previous, msgs, self.max_chars)
+
+        state = {"summary": summary, "covered": upto, "updated": int(time.time())}
+        if not self._write(path, state, (mode, user), generation):
+            return False
+        self.folds += 1
+        self.folded_lines += upto - covered
+        return True
+
+    def flush(self, timeout_s: Optional[float] = None) -> bool:
+        # Wait until every scheduled conversation has been folded
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and not self._busy, timeout=timeout_s)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "folds": self.folds,
+                "folded_lines": self.folded_lines,
+                "fallbacks": self.fallbacks,
+                "errors": self.errors,
+                "discarded": self.discarded,
+                "cached": len(self._cache),
+                "max_chars": self.max_chars,
+            }
+
+    # ----- worker -----
+
+    def _run(self) -> None:
+        while True:
+            key = self._queue.get()
+            if key is None:
+                return
+            with self._lock:
+                self._pending.discard(key)
+                self._busy += 1
+            try:
+                self.fold(*key)
+            except Exception as e:
+                self.errors += 1
+                print(f"==== summarizer: fold of {key} failed: {e}")
+            finally:
+                with self._idle:
+                    self._busy -= 1
+                    self._idle.notify_all()
@@ -0,0 +1,254 @@
+# core/tracing.py
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Histogram bucket upper bounds, seconds
+BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+class StageHistograms:
+    """
+    Prometheus-style latency histograms keyed by stage name
+    (cumulative buckets + sum + count, rendered in the text exposition format).
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            counts = self._counts.get(stage)
+            if counts is None:
+                counts = self._counts[stage] = [0] * (len(self.buckets) + 1)
+                self._sums[stage] = 0.0
+            counts[i] += 1
+            self._sums[stage] += seconds
+
+    def render(self, name: str, label: str = "stage") -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        with self._lock:
+            for stage in sorted(self._counts):
+                counts = self._counts[stage]
+                total = 0
+                for bound, n in zip(self.buckets, counts):
+                    total += n
+                    lines.append(f'{name}_bucket{{{label}="{stage}",le="{bound:g}"}} {total}')
+                total += counts[-1]
+                lines.append(f'{name}_bucket{{{label}="{stage}",le="+Inf"}} {total}')
+                lines.append(f'{name}_sum{{{label}="{stage}"}} {self._sums[stage]:.6f}')
+                lines.append(f'{name}_count{{{label}="{stage}"}} {total}')
+        return lines
+
+
+class Trace:
+    """
+    One request: an id plus the stage spans recorded while serving it,
+    each as {"stage", "start_ms" (from request start), "ms", ...attrs}.
+    """
+
+    __slots__ = ("id", "started", "attrs", "spans")
+
+    def __init__(self, **attrs: Any) -> None:
+        self.id = uuid.uuid4().hex[:8]
+        self.started = time.perf_counter()
+        self.attrs = attrs
+        self.spans: List[Dict[str, Any]] = []
+
+    def record(self, stage: str, start: float, seconds: float, attrs: Dict[str, Any]) -> None:
+        entry = {"stage": stage, "start_ms": round((start - self.started) * 1000, 3), "ms": round(seconds * 1000, 3)}
+        entry.update(attrs)
+        self.spans.append(entry)
+
+
+stages = StageHistograms()
+requests = StageHistograms()
+_status_counts: Dict[str, int] = {}
+_status_lock = threading.Lock()
+
+_current: ContextVar[Optional[Trace]] = ContextVar("shine_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time a stage. Always feeds the stage histogram; also lands in the
+    current request's trace when there is one. The yielded dict can be
+    filled in with attributes (status, attempt, ...) before the block ends.
+    Works in threads started with asyncio.to_thread / run_in_threadpool,
+    which copy the request's context.
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs.setdefault("error", type(e).__name__)
+        status = getattr(e, "status_code", None)
+        if status is not None:
+            attrs.setdefault("status", status)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stages.observe(stage, seconds)
+        trace = _current.get()
+        if trace is not None:
+            trace.record(stage, start, seconds, attrs)
+
+
+# ----- JSON lines log -----
+
+_log = logging.getLogger("shine.trace")
+_log.setLevel(logging.INFO)
+_log.propagate = False
+_listener: Optional[QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def _ensure_log() -> bool:
+    """
+    Start the trace log on first use: records go through a QueueHandler,
+    and a QueueListener thread writes them to TRACE_LOG_PATH
+    (default logs/trace.log, rotated at TRACE_LOG_MAX_BYTES). An empty
+    TRACE_LOG_PATH keeps only the histograms.
+    """
+    global _listener
+    if _listener is not None:
+        return True
+    path = os.getenv("TRACE_LOG_PATH", os.path.join("logs", "trace.log"))
+    if not path:
+        return False
+    with _listener_lock:
+        if _listener is None:
+            parent = os.path.dirname(path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=_env_int("TRACE_LOG_MAX_BYTES", 10 * 1024 * 1024),
+                backupCount=_env_int("TRACE_LOG_BACKUPS", 3),
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            q: SimpleQueue = SimpleQueue()
+            _log.addHandler(QueueHandler(q))
+            _listener = QueueListener(q, handler)
+            _listener.start()
+    return True
+
+
+def start_trace(**attrs: Any) -> Tuple[Trace, Any]:
+    trace = Trace(**attrs)
+    return trace, _current.set(trace)
+
+
+def finish_trace(trace: Trace, token: Any, status: int, route: str = "", **attrs: Any) -> None:
+    """
+    Close the trace: feed the per-route histogram and counter (route should
+    be a template such as "/chat", not a raw path, to keep label values
+    bounded) and queue the JSON line.
+    """
+    _current.reset(token)
+    seconds = time.perf_counter() - trace.started
+    route = route or "unmatched"
+    requests.observe(route, seconds)
+    with _status_lock:
+        key = f"{route}|{status}"
+        _status_counts[key] = _status_counts.get(key, 0) + 1
+
+    if not _ensure_log():
+        return
+    record = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "trace_id": trace.id,
+        "status": status,
+        "ms": round(seconds * 1000, 3),
+    }
+    record.update(trace.attrs)
+    record.update(attrs)
+    record["spans"] = trace.spans
+    _log.info(json.dumps(record, default=str))
+
+
+def flush_log() -> None:
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener.start()
+
+
+def metrics_text() -> str:
+    lines = stages.render("shine_stage_duration_seconds")
+    lines += requests.render("shine_request_duration_seconds", label="route")
+    lines.append("# TYPE shine_requests_total counter")
+    with _status_lock:
+        for key in sorted(_status_counts):
+            route, status = key.split("|", 1)
+            lines.append(f'shine_requests_total{{route="{route}",status="{status}"}} {_status_counts[key]}')
+    return "\n".join(lines) + "\n"
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware that opens a trace per HTTP request and logs it once the
+    app returns -- for Starlette that is after the body is sent and after
+    any background task (e.g. the memory write) has run. response_ms is the
+    time to the last body byte, which is what the client waited for.
+    Paths starting with any of skip_prefixes are not traced.
+    """
+
+    def __init__(self, app: Any, skip_prefixes: Tuple[str, ...] = ("/metrics",)) -> None:
+        self.app = app
+        self.skip_prefixes = skip_prefixes
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope.get("path", "").startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        trace, token = start_trace(
+            method=scope.get("method"),
+            path=scope.get("path"),
+            ip=client[0] if client else None,
+        )
+        state = {"status": 500, "response_ms": None}
+
+        async def traced_send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["response_ms"] = round((time.perf_counter() - trace.started) * 1000, 3)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            route = getattr(scope.get("route"), "path", "")
+            finish_trace(trace, token, state["status"], route=route, response_ms=state["response_ms"])
@@ -0,0 +1,583 @@
+# core/vector_recall.py
+#
+# Embedding recall over user_memory facts. Each user's facts are embedded
+# (core/embedding.py), quantized to int8 and kept in one file per user,
+# RecallIndex/vectors/<ab>/<sha1>.vec, memory-mapped on the user's first
+# query (opening parses the header and a small meta block).
+#
+# Layout of a .vec file (little-endian, every column 8-byte aligned):
+#
+#   header      64 bytes  magic "SHVEC001", version, dim, count, nlist,
+#                         trained, meta_len, heap_len
+#   meta        JSON      embedder name
+#   scales      float32[count]          row i ~ vectors[i] * scales[i]
+#   lists       uint32[nlist + 1]       IVF list j is rows lists[j]:lists[j + 1]
+#   centroids   float32[nlist * dim]
+#   vectors     int8[count * dim]
+#   offsets     uint64[count + 1]       row i is "key\x1fvalue" in heap
+#   heap
+#
+# Below SHINE_VECTOR_IVF_MIN facts a user has nlist 0 and a query scans
+# every row. Above it rows are grouped by k-means list and a query scans
+# the SHINE_VECTOR_NPROBE lists nearest to it; centroids are refit once
+# the user has twice the rows they were fit on ("trained").
+#
+#   python -m core.vector_recall build [--db memory.db]
+#   python -m core.vector_recall query USER TEXT [-k 5]
+
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+from core.embedding import get_embedder
+from core.memory import user_key
+from core.recall_index import RECALL_INDEX_DIR, fact_pages
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(RECALL_INDEX_DIR, "vectors"))
+
+MAGIC = b"SHVEC001"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIIIIIQ24x")  # 64 bytes
+_SEP = "\x1f"
+
+
+def _pad(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+def fact_text(key: str, value: str) -> str:
+    return f"{key}: {value}"
+
+
+def quantize(vecs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row int8: row ~ q * scale, with |q| <= 127. Returns
+    (int8 [n, dim], float32 [n]).
+    """
+    scales = np.abs(vecs).max(axis=1) / 127.0 if len(vecs) else np.zeros(0, dtype=np.float32)
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    q = np.rint(vecs / scales[:, None]).clip(-127, 127).astype(np.int8)
+    return q, scales
+
+
+def kmeans(x: np.ndarray, nlist: int, iters: int = 8, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means (rows are unit length, so nearest = largest dot
+    product), fit on at most 64 rows per list. float32 [nlist, dim].
+    """
+    rnd = np.random.default_rng(seed)
+    sample = x if len(x) <= nlist * 64 else x[rnd.choice(len(x), nlist * 64, replace=False)]
+    centroids = sample[rnd.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        onehot = np.zeros((len(sample), nlist), dtype=np.float32)
+        onehot[np.arange(len(sample)), assign] = 1.0
+        sums = onehot.T @ sample
+        norms = np.linalg.norm(sums, axis=1)
+        # An empty list keeps its old centroid
+        live = norms > 0
+        centroids[live] = sums[live] / norms[live, None]
+    return centroids
+
+
+def _scores(vectors: np.ndarray, scales: np.ndarray, q: np.ndarray) -> np.ndarray:
+    # int8 rows widened 512 at a time: the float32 copy stays in cache
+    if len(vectors) <= 512:
+        return (vectors.astype(np.float32) @ q) * scales
+    return np.concatenate([
+        (vectors[i:i + 512].astype(np.float32) @ q) * scales[i:i + 512] for i in range(0, len(vectors), 512)
+    ])
+
+
+class _UserIndex:
+    """
+    One mapped .vec file. Every column is a zero-copy numpy view of the
+    mapping; the mapping goes away with the last reference to it.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, dim, count, nlist, trained, meta_len, heap_len = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a vector index file")
+        self.dim, self.count, self.nlist, self.trained = dim, count, nlist, trained
+        off = _HEADER.size
+        self.meta = json.loads(bytes(mm[off:off + meta_len]).decode("utf-8"))
+        off += meta_len + _pad(meta_len)
+
+        def column(dtype: Any, n: int) -> np.ndarray:
+            nonlocal off
+            arr = np.frombuffer(mm, dtype=dtype, count=n, offset=off)
+            off += arr.nbytes + _pad(arr.nbytes)
+            return arr
+
+        self.scales = column(np.float32, count)
+        self.lists = column(np.uint32, nlist + 1)
+        self.centroids = column(np.float32, nlist * dim).reshape(nlist, dim)
+        self.vectors = column(np.int8, count * dim).reshape(count, dim)
+        self.offsets = column(np.uint64, count + 1)
+        self._heap = off
+        self._mm = mm
+
+    def row(self, i: int) -> Tuple[str, str]:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        key, _, value = bytes(self._mm[self._heap + start:self._heap + end]).decode("utf-8").partition(_SEP)
+        return key, value
+
+    def rows(self) -> List[Tuple[str, str]]:
+        return [self.row(i) for i in range(self.count)]
+
+    def assignments(self) -> np.ndarray:
+        # List of each row, from the list boundaries
+        return np.repeat(np.arange(self.nlist), np.diff(self.lists.astype(np.int64)))
+
+    def search(self, q: np.ndarray, k: int, nprobe: int) -> List[Tuple[int, float]]:
+        if self.nlist:
+            probe = np.argsort(-(self.centroids @ q))[:nprobe]
+            spans = [(int(self.lists[j]), int(self.lists[j + 1])) for j in probe]
+            ids = np.concatenate([np.arange(a, b) for a, b in spans])
+            scores = np.concatenate([_scores(self.vectors[a:b], self.scales[a:b], q) for a, b in spans])
+        else:
+            ids = np.arange(self.count)
+            scores = _scores(self.vectors, self.scales, q)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+
+def _write_user(
+    path: str,
+    embedder: str,
+    vectors: np.ndarray,
+    scales: np.ndarray,
+    lists: np.ndarray,
+    centroids: np.ndarray,
+    trained: int,
+    rows: List[Tuple[str, str]],
+) -> None:
+    count, dim = vectors.shape
+    meta = json.dumps({"embedder": embedder}).encode("utf-8")
+    texts = [(k + _SEP + v).encode("utf-8") for k, v in rows]
+    offsets = np.zeros(count + 1, dtype=np.uint64)
+    np.cumsum([len(t) for t in texts], out=offsets[1:])
+    heap_len = int(offsets[-1])
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Per process: another worker may be writing its own copy
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, dim, count, len(lists) - 1, trained, len(meta), heap_len))
+        for block in (
+            meta,
+            scales.astype(np.float32).tobytes(),
+            lists.astype(np.uint32).tobytes(),
+            centroids.astype(np.float32).tobytes(),
+            vectors.astype(np.int8).tobytes(),
+            offsets.tobytes(),
+        ):
+            f.write(block)
+            f.write(b"\0" * _pad(len(block)))
+        f.write(b"".join(texts))
+    os.replace(tmp, path)
+
+
+class VectorRecall:
+    """
+    Per-user int8 vector index over user_memory facts.
+
+    - add() only queues the fact; a background thread embeds the queue in
+      batches of up to SHINE_VECTOR_BATCH (one embedder call per batch)
+      every SHINE_VECTOR_FLUSH_MS, or sooner once a batch is full, and
+      rewrites each affected user's file (a re-saved key replaces its row)
+    - top_k() settles the user's queued facts first, so a fact is
+      recallable as soon as it is saved
+    - sync() catches up from memory.db (facts written while the server was
+      down, or all of them on first run / after an embedder change)
+    - opened files stay in an LRU of SHINE_VECTOR_CACHE users, revalidated
+      with one stat per query
+    - several worker processes can share the directory: a user's file is
+      re-read and rewritten under an flock, so each worker's facts land
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        embedder: Any = None,
+        batch: Optional[int] = None,
+        flush_ms: Optional[int] = None,
+        ivf_min: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        min_score: Optional[float] = None,
+        cache_entries: Optional[int] = None,
+    ) -> None:
+        self.directory = directory or VECTOR_INDEX_DIR
+        self.embedder = embedder or get_embedder()
+        self.batch = max(1, batch or _env_int("SHINE_VECTOR_BATCH", 256))
+        self.flush_s = max(1, flush_ms or _env_int("SHINE_VECTOR_FLUSH_MS", 2000)) / 1000.0
+        self.ivf_min = max(64, ivf_min or _env_int("SHINE_VECTOR_IVF_MIN", 4096))
+        self.nprobe = max(1, nprobe or _env_int("SHINE_VECTOR_NPROBE", 16))
+        self.min_score = _env_float("SHINE_VECTOR_MIN_SCORE", 0.1) if min_score is None else min_score
+        self.cache_entries = max(1, cache_entries or _env_int("SHINE_VECTOR_CACHE", 2048))
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, str]] = {}  # user's file -> key -> value
+        self._queued = 0
+        self._flushing: set = set()
+        self._cache: "OrderedDict[str, Tuple[Tuple[int, int], _UserIndex]]" = OrderedDict()
+        self._wake = threading.Event()
+        self._closed = False
+
+        self.queries = 0
+        self.embedded = 0
+        self.embed_s = 0.0
+        self.batches = 0
+        self.writes = 0
+        self.errors = 0
+
+        self._thread = threading.Thread(target=self._run, name="vector-recall", daemon=True)
+        self._thread.start()
+
+    # ----- files -----
+
+    def path_for(self, user_id: Any) -> str:
+        h = user_key(str(user_id))
+        return os.path.join(self.directory, h[:2], h + ".vec")
+
+    def _open(self, path: str) -> Optional[_UserIndex]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        # Every write replaces the file, so a new inode means new contents
+        stamp = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._cache.move_to_end(path)
+                return entry[1]
+        try:
+            index = _UserIndex(path)
+        except (OSError, ValueError) as e:
+            print(f"==== vector recall: unreadable {path}: {e}")
+            return None
+        with self._lock:
+            self._cache[path] = (stamp, index)
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return index
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        out = []
+        t0 = time.perf_counter()
+        for i in range(0, len(texts), self.batch):
+            out.append(self.embedder.embed(texts[i:i + self.batch]))
+            self.batches += 1
+        self.embed_s += time.perf_counter() - t0
+        self.embedded += len(texts)
+        return np.concatenate(out) if out else np.zeros((0, self.embedder.dim), dtype=np.float32)
+
+    def _locked(self, path: str) -> Any:
+        """
+        Exclusive flock on one of 256 lock files (by the user's hash
+        prefix), so workers sharing the directory take turns rewriting a
+        user; None where flock is unavailable.
+        """
+        if fcntl is None:
+            return None
+        locks = os.path.join(self.directory, ".locks")
+        os.makedirs(locks, exist_ok=True)
+        handle = open(os.path.join(locks, os.path.basename(os.path.dirname(path)) + ".lock"), "a")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        except OSError:
+            handle.close()
+            raise
+        return handle
+
+    def _merge(self, path: str, updates: Dict[str, Tuple[str, np.ndarray]]) -> None:
+        handle = self._locked(path)
+        try:
+            self._merge_locked(path, updates)
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def _merge_locked(self, path: str, updates: Dict[str, Tuple[str, np.ndarray]]) -> None:
+        """
+        Rewrite one user's file (path) with updates (key -> (value, float32 vector))
+        replacing or adding rows. Old rows keep their int8 vectors and IVF
+        lists; only an embedder change re-embeds them. The file is re-read
+        here (one stat), so rows another worker wrote are kept.
+        """
+        old = self._open(path)
+        dim = self.embedder.dim
+        if old is not None and (old.meta.get("embedder") != self.embedder.name or old.dim != dim):
+            for key, value in old.rows():
+                updates.setdefault(key, (value, None))
+            stale = [k for k, (_, vec) in updates.items() if vec is None]
+            fresh = self._embed([fact_text(k, updates[k][0]) for k in stale])
+            for k, vec in zip(stale, fresh):
+                updates[k] = (updates[k][0], vec)
+            old = None
+
+        if old is not None:
+            rows = old.rows()
+            keep = np.array([k not in updates for k, _ in rows], dtype=bool)
+            rows = [r for r, kept in zip(rows, keep) if kept]
+            vectors, scales = old.vectors[keep], old.scales[keep]
+            assign = old.assignments()[keep] if old.nlist else None
+        else:
+            rows, vectors, scales, assign = [], np.zeros((0, dim), np.int8), np.zeros(0, np.float32), None
+
+        new_q, new_s = quantize(np.stack([vec for _, vec in updates.values()]))
+        rows += [(k, v) for k, (v, _) in updates.items()]
+        vectors = np.concatenate([vectors, new_q])
+        scales = np.concatenate([scales, new_s])
+        count = len(rows)
+
+        if count < self.ivf_min:
+            lists, centroids, trained = np.zeros(1, np.uint32), np.zeros((0, dim), np.float32), 0
+            order = None
+        else:
+            if old is not None and old.nlist and count <= 2 * old.trained:
+                # Only the new rows need a list
+                centroids, trained = np.array(old.centroids), old.trained
+                added = vectors[len(assign):].astype(np.float32) * scales[len(assign):, None]
+                assign = np.concatenate([assign, np.argmax(added @ centroids.T, axis=1)])
+            else:
+                full = vectors.astype(np.float32) * scales[:, None]
+                nlist = min(1024, max(4, int(math.sqrt(count))))
+                centroids, trained = kmeans(full, nlist), count
+                assign = np.argmax(full @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable")
+            lists = np.zeros(len(centroids) + 1, np.uint32)
+            np.cumsum(np.bincount(assign, minlength=len(centroids)), out=lists[1:])
+        if order is not None:
+            vectors, scales, rows = vectors[order], scales[order], [rows[i] for i in order]
+
+        _write_user(path, self.embedder.name, vectors, scales, lists, centroids, trained, rows)
+        with self._lock:
+            self._cache.pop(path, None)
+        self.writes += 1
+
+    # ----- public API -----
+
+    def add(self, user_id: Any, key: str, value: str) -> None:
+        with self._lock:
+            facts = self._pending.setdefault(self.path_for(user_id), {})
+            if str(key) not in facts:
+                self._queued += 1
+            facts[str(key)] = str(value)
+            full = self._queued >= self.batch
+        if full:
+            self._wake.set()
+
+    def flush(self, user_id: Any = None) -> int:
+        """
+        Embed and write everything queued so far, or only user_id's queued
+        facts. Returns the number of facts written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if user_id is None:
+                    pending, self._pending = self._pending, {}
+                else:
+                    path = self.path_for(user_id)
+                    facts = self._pending.pop(path, None)
+                    pending = {path: facts} if facts else {}
+                self._queued -= sum(len(facts) for facts in pending.values())
+                self._flushing = set(pending)
+            try:
+                if not pending:
+                    return 0
+                items = [(path, k, v) for path, facts in pending.items() for k, v in facts.items()]
+                vecs = self._embed([fact_text(k, v) for _, k, v in items])
+                by_path: Dict[str, Dict[str, Tuple[str, np.ndarray]]] = {}
+                for (path, k, v), vec in zip(items, vecs):
+                    by_path.setdefault(path, {})[k] = (v, vec)
+                for path, updates in by_path.items():
+                    try:
+                        self._merge(path, updates)
+                    except Exception as e:
+                        self.errors += 1
+                        print(f"==== vector recall: writing {path} failed: {e}")
+                return len(items)
+            finally:
+                with self._lock:
+                    self._flushing = set()
+
+    def top_k(self, user_id: Any, text: str, k: int = 20) -> List[Tuple[str, str, float]]:
+        """
+        (key, value, score) of the user's k facts nearest to text, best
+        first; scores are cosine similarities, at least min_score.
+        """
+        path = self.path_for(user_id)
+        with self._lock:
+            unsettled = path in self._pending or path in self._flushing
+        if unsettled:
+            self.flush(user_id)
+        self.queries += 1
+        index = self._open(path)
+        if index is None or not index.count or index.meta.get("embedder") != self.embedder.name:
+            return []
+        q = self.embedder.embed([text])[0]
+        if not q.any():
+            return []
+        return [
+            index.row(i) + (round(score, 4),)
+            for i, score in index.search(q, max(1, k), self.nprobe)
+            if score >= self.min_score
+        ]
+
+    # ----- catch-up from memory.db -----
+
+    def _cursor_path(self) -> str:
+        return os.path.join(self.directory, "cursor.json")
+
+    def sync(self, db: Any) -> int:
+        """
+        Queue and write every fact created since the saved cursor (all of
+        them when the embedder changed). Returns the number of facts read.
+        """
+        try:
+            with open(self._cursor_path(), "r", encoding="utf-8") as f:
+                cursor = json.load(f)
+        except (OSError, ValueError):
+            cursor = {}
+        since = cursor.get("facts", "") if cursor.get("embedder") == self.embedder.name else ""
+        db.flush()
+        latest = since
+        read = 0
+        # One page of rows in memory at a time, written out before the next
+        for rows in fact_pages(db, since):
+            for user_id, key, value, created, _ in rows:
+                # Same second as the cursor: re-adding only replaces the row
+                self.add(user_id, key, value)
+                latest = str(created or latest)
+            read += len(rows)
+            self.flush()
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self._cursor_path()}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"facts": latest, "embedder": self.embedder.name}, f)
+        os.replace(tmp, self._cursor_path())
+        return read
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "embedder": self.embedder.name,
+                "dim": self.embedder.dim,
+                "queued": self._queued,
+                "queries": self.queries,
+                "embedded": self.embedded,
+                "embed_batches": self.batches,
+                "embed_us_per_fact": round(self.embed_s / self.embedded * 1e6, 1) if self.embedded else 0.0,
+                "user_writes": self.writes,
+                "errors": self.errors,
+                "cached_users": len(self._cache),
+                "ivf_min": self.ivf_min,
+                "nprobe": self.nprobe,
+            }
+
+    # ----- worker -----
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.errors += 1
+                print(f"==== vector recall: flush failed: {e}")
+
+
+_instances: Dict[str, VectorRecall] = {}
+_instances_lock = threading.Lock()
+
+
+def get_vector_recall(directory: Optional[str] = None) -> VectorRecall:
+    """
+    Process-wide VectorRecall per directory. User files are mapped on their
+    first query.
+    """
+    directory = directory or VECTOR_INDEX_DIR
+    with _instances_lock:
+        index = _instances.get(directory)
+        if index is None:
+            index = VectorRecall(directory)
+            _instances[directory] = index
+        return index
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m core.vector_recall")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="embed the facts beyond the saved cursor")
+    b.add_argument("--db", default=None)
+    b.add_argument("--dir", default=None)
+    q = sub.add_parser("query", help="top-k facts for a user and a message")
+    q.add_argument("user")
+    q.add_argument("text")
+    q.add_argument("-k", type=int, default=5)
+    q.add_argument("--dir", default=None)
+    args = ap.parse_args()
+
+    index = VectorRecall(args.dir)
+    if args.cmd == "build":
+        from core.memory_db import get_db
+
+        db = get_db(args.db)
+        t0 = time.perf_counter()
+        read = index.sync(db)
+        index.close()
+        print(f"embedded {read} facts in {time.perf_counter() - t0:.2f}s; {index.stats()}")
+    else:
+        for key, value, score in index.top_k(args.user, args.text, args.k):
+            print(f"{score:6.3f}  {key:<24} {value[:100]}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
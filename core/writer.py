@@ -0,0 +1,240 @@
+# core/writer.py
+import atexit
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+SYNC = "sync"          # commit in the caller's thread, one record at a time
+BATCHED = "batched"    # caller waits until the group commit holding its record lands
+ASYNC = "async"        # caller returns at once; record lands with the next group commit
+
+DURABILITY_MODES = (SYNC, BATCHED, ASYNC)
+
+
+def durability_from_env(name: str, default: str = SYNC) -> str:
+    mode = (os.getenv(name) or default).strip().lower()
+    return mode if mode in DURABILITY_MODES else default
+
+
+class _Waiter:
+    __slots__ = ("event", "error")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitWriter:
+    """
+    Background writer that collects records from every request and hands
+    them to commit(batch) in groups of at most max_batch.
+
+    batched: callers are blocked, so the writer commits as soon as it is
+             free; records that arrive during a commit form the next group.
+    async:   nobody is waiting, so a group is held until it reaches
+             max_batch records or its oldest record is interval_s old.
+
+    close() (also run at interpreter exit) drains the queue before returning,
+    so records accepted in async mode are not lost on a clean shutdown.
+
+    submit(record, key) tags a record (a user, a file); flush(key=key) then
+    waits only until that key's last record has landed, so a read-your-writes
+    check does not sit behind everyone else's queue.
+    """
+
+    def __init__(
+        self,
+        commit: Callable[[List[Any]], None],
+        mode: str = BATCHED,
+        max_batch: int = 256,
+        interval_s: float = 0.02,
+        name: str = "group-commit",
+    ) -> None:
+        self.commit = commit
+        self.mode = mode if mode in DURABILITY_MODES else BATCHED
+        self.max_batch = max(1, max_batch)
+        self.interval_s = max(0.0, interval_s)
+        self.name = name
+
+        self._queue: List[Any] = []
+        self._waiters: List[Optional[_Waiter]] = []
+        self._keys: List[Any] = []
+        # key -> sequence number of its newest record still to be committed
+        self._last_seq: Dict[Any, int] = {}
+        self._oldest = 0.0
+        self._submitted = 0
+        self._committed = 0
+        self._batch_waiters: List[Optional[_Waiter]] = []
+        self._batch_keys: List[Any] = []
+        self._flushers = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.batches = 0
+        self.records = 0
+        self.errors = 0
+        self.failed_records = 0
+        self.last_error: Optional[str] = None
+
+        self._thread: Optional[threading.Thread] = None
+        if self.mode != SYNC:
+            self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return self._submitted - self._committed
+
+    def _commit_inline(self, record: Any) -> None:
+        try:
+            self.commit([record])
+        except BaseException as e:
+            with self._cond:
+                self._failed(1, e)
+            raise
+        with self._cond:
+            self.batches += 1
+            self.records += 1
+
+    def _failed(self, n: int, err: BaseException) -> None:
+        # Caller holds the condition.
+        self.errors += 1
+        self.failed_records += n
+        self.last_error = f"{type(err).__name__}: {err}"
+
+    def submit(self, record: Any, key: Any = None) -> None:
+        if self.mode == SYNC:
+            self._commit_inline(record)
+            return
+
+        waiter = _Waiter() if self.mode == BATCHED else None
+        with self._cond:
+            # Checked under the lock: once close() has set it, the writer
+            # thread may already have drained and exited
+            closed = self._closed
+            if not closed:
+                if not self._queue:
+                    self._oldest = time.monotonic()
+                self._queue.append(record)
+                self._waiters.append(waiter)
+                self._keys.append(key)
+                self._submitted += 1
+                if key is not None:
+                    self._last_seq[key] = self._submitted
+                self._cond.notify_all()
+        if closed:
+            self._commit_inline(record)
+            return
+
+        if waiter is not None:
+            waiter.event.wait()
+            if waiter.error is not None:
+                raise waiter.error
+
+    def flush(self, timeout_s: Optional[float] = None, key: Any = None) -> bool:
+        """
+        Block until everything submitted so far has been committed, or with
+        key, until that key's records have.
+        """
+        if self.mode == SYNC:
+            return True
+        with self._cond:
+            if key is None:
+                target = self._submitted
+            else:
+                target = self._last_seq.get(key, 0)
+                if target <= self._committed:
+                    return True
+            # Makes whatever is queued due now instead of after interval_s
+            self._flushers += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: self._committed >= target, timeout=timeout_s)
+            finally:
+                self._flushers -= 1
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _take_batch(self) -> List[Any]:
+        # Caller holds the condition.
+        while True:
+            if self._queue:
+                due = self._oldest + self.interval_s
+                if (
+                    len(self._queue) >= self.max_batch
+                    or self.mode == BATCHED
+                    or self._closed
+                    or self._flushers
+                    or time.monotonic() >= due
+                ):
+                    break
+                self._cond.wait(timeout=max(0.0, due - time.monotonic()))
+            elif self._closed:
+                return []
+            else:
+                self._cond.wait()
+
+        batch = self._queue[:self.max_batch]
+        self._batch_waiters = self._waiters[:self.max_batch]
+        self._batch_keys = self._keys[:self.max_batch]
+        del self._queue[:self.max_batch]
+        del self._waiters[:self.max_batch]
+        del self._keys[:self.max_batch]
+        if self._queue:
+            self._oldest = time.monotonic()
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+                waiters = self._batch_waiters if batch else []
+                keys = self._batch_keys if batch else []
+            if not batch:
+                return
+
+            err: Optional[BaseException] = None
+            try:
+                self.commit(batch)
+            except BaseException as e:
+                err = e
+                print(f"==== {self.name}: group commit of {len(batch)} records failed: {e}")
+
+            with self._cond:
+                self._committed += len(batch)
+                for key in keys:
+                    if key is not None and self._last_seq.get(key, 0) <= self._committed:
+                        self._last_seq.pop(key, None)
+                self.batches += 1
+                self.records += len(batch)
+                if err is not None:
+                    # In async mode nobody is waiting: the batch is lost, and
+                    # only these counters (stats()) say so
+                    self._failed(len(batch), err)
+                self._cond.notify_all()
+            for w in waiters:
+                if w is not None:
+                    w.error = err
+                    w.event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "mode": self.mode,
+                "pending": self._submitted - self._committed,
+                "batches": self.batches,
+                "records": self.records,
+                "errors": self.errors,
+                "failed_records": self.failed_records,
+                "last_error": self.last_error,
+            }
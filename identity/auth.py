@@ -1,4 +1,3 @@
-import json
 import os
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
@@ -6,46 +5,39 @@ from typing import Optional, Dict, Any
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from passlib.context import CryptContext
+
+from identity.passwords import hasher
+from identity.token_cache import VerifiedTokenCache
+from identity.user_store import get_store
 
 # OAuth2 "password" flow endpoint (login)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# Storage (simple JSON for now; later swap to SQLite)
-USERS_FILE = os.path.join(os.path.dirname(__file__), "users.json")
+# Storage: SQLite user store (identity/user_store.py); the legacy
+# identity/users.json is imported by user_store.import_legacy() at startup
+def _users():
+    return get_store()
 
-def _load_users() -> Dict[str, Any]:
-    if not os.path.exists(USERS_FILE):
-        return {"users": {}}
-    with open(USERS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def _save_users(data: Dict[str, Any]) -> None:
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+# Verified JWT payloads, bounded by each token's exp
+_token_cache = VerifiedTokenCache()
 
+# bcrypt runs on identity.passwords' process pool (BCRYPT_ROUNDS work factor)
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hasher.hash(password)
+
+hash_password = get_password_hash
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return hasher.verify(plain_password, hashed_password)
 
 def get_user(username: str) -> Optional[Dict[str, Any]]:
-    db = _load_users()
-    return db["users"].get(username)
+    return _users().get(username)
 
 def create_user(username: str, password: str) -> None:
-    db = _load_users()
-    if username in db["users"]:
+    if _users().exists(username):
+        raise HTTPException(status_code=400, detail="User already exists")
+    if not _users().add(username, get_password_hash(password)):
         raise HTTPException(status_code=400, detail="User already exists")
-    db["users"][username] = {
-        "username": username,
-        "password_hash": get_password_hash(password),
-        "created_utc": datetime.utcnow().isoformat() + "Z"
-    }
-    _save_users(db)
 
 def authenticate_user(username: str, password: str) -> Optional[Dict[str, Any]]:
     user = get_user(username)
@@ -83,12 +75,16 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, _secret_key(), algorithms=[_algo()])
-        username: str = payload.get("sub")
-        if username is None:
+    payload = _token_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, _secret_key(), algorithms=[_algo()])
+        except JWTError:
             raise credentials_exception
-    except JWTError:
+        _token_cache.put(token, payload)
+
+    username: str = payload.get("sub")
+    if username is None:
         raise credentials_exception
 
     user = get_user(username)
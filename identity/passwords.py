@@ -0,0 +1,212 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import bcrypt
+from fastapi import HTTPException, status
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def _secret(password: str) -> bytes:
+    # bcrypt only looks at the first 72 bytes; older bcrypt / passlib
+    # truncated silently, bcrypt>=5 raises instead.
+    return password.encode("utf-8")[:72]
+
+
+def _watch_parent(parent_pid: int) -> None:
+    # Pool workers block on their call queue forever; if the server dies
+    # without shutting the pool down they would be left behind.
+    while os.getppid() == parent_pid:
+        time.sleep(1.0)
+    os._exit(0)
+
+
+def _worker_init(nice: int, parent_pid: int) -> None:
+    # Hashing yields the CPU to the server process
+    if nice and hasattr(os, "nice"):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+    threading.Thread(target=_watch_parent, args=(parent_pid,), daemon=True).start()
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(_secret(password), bcrypt.gensalt(rounds)).decode("ascii")
+
+
+def _verify(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(_secret(password), hashed.encode("ascii"))
+    except (ValueError, TypeError, UnicodeEncodeError):
+        # Not a bcrypt hash (e.g. a legacy plaintext entry)
+        return False
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing / verification on a small dedicated process pool, so a
+    burst of logins burns CPU in worker processes instead of the threads and
+    event loop serving /chat.
+
+    - rounds:    bcrypt work factor (BCRYPT_ROUNDS, default 12)
+    - workers:   pool size (PASSWORD_HASH_WORKERS, default min(2, cpus));
+                 0 hashes inline in the calling thread
+    - max_queue: operations allowed in flight or queued at once
+                 (PASSWORD_HASH_QUEUE, default 8 per worker); beyond that
+                 callers get a 503 instead of piling up
+    - per_ip:    concurrent password operations per client address
+                 (PASSWORD_MAX_PER_IP, default 2); beyond that a 429
+    - nice:      CPU priority drop for the workers (PASSWORD_HASH_NICE,
+                 default 10), so hashing only gets cycles /chat is not using
+    The pool is started lazily on first use.
+    """
+
+    def __init__(
+        self,
+        rounds: Optional[int] = None,
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        per_ip: Optional[int] = None,
+        nice: Optional[int] = None,
+    ) -> None:
+        self.rounds = min(31, max(4, rounds or _env_int("BCRYPT_ROUNDS", 12)))
+        default_workers = min(2, os.cpu_count() or 1)
+        self.workers = max(0, workers if workers is not None else _env_int("PASSWORD_HASH_WORKERS", default_workers))
+        self.max_queue = max(1, max_queue or _env_int("PASSWORD_HASH_QUEUE", 8 * max(1, self.workers)))
+        self.per_ip = max(1, per_ip or _env_int("PASSWORD_MAX_PER_IP", 2))
+        self.nice = max(0, nice if nice is not None else _env_int("PASSWORD_HASH_NICE", 10))
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._by_ip: Dict[str, int] = {}
+
+        self.completed = 0
+        self.rejected_busy = 0
+        self.rejected_ip = 0
+
+    # ----- pool -----
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: never fork a process that is running server threads
+                ctx = multiprocessing.get_context("spawn")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=ctx,
+                    initializer=_worker_init,
+                    initargs=(self.nice, os.getpid()),
+                )
+            return self._pool
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self.rejected_busy += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many login attempts in progress, try again shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+
+    def _done(self, _fut: Optional[Future] = None) -> None:
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def _submit(self, fn, *args) -> Future:
+        self._admit()
+        try:
+            fut = self._executor().submit(fn, *args)
+        except BaseException:
+            self._done()
+            raise
+        fut.add_done_callback(self._done)
+        return fut
+
+    # ----- sync -----
+
+    def hash(self, password: str) -> str:
+        if not self.workers:
+            return _hash(password, self.rounds)
+        return self._submit(_hash, password, self.rounds).result()
+
+    def verify(self, password: str, hashed: str) -> bool:
+        if not self.workers:
+            return _verify(password, hashed)
+        return self._submit(_verify, password, hashed).result()
+
+    # ----- async -----
+
+    async def ahash(self, password: str) -> str:
+        if not self.workers:
+            return await asyncio.to_thread(_hash, password, self.rounds)
+        return await asyncio.wrap_future(self._submit(_hash, password, self.rounds))
+
+    async def averify(self, password: str, hashed: str) -> bool:
+        if not self.workers:
+            return await asyncio.to_thread(_verify, password, hashed)
+        return await asyncio.wrap_future(self._submit(_verify, password, hashed))
+
+    # ----- per-client cap -----
+
+    @contextmanager
+    def client_slot(self, ip: Optional[str]):
+        key = ip or "unknown"
+        with self._lock:
+            if self._by_ip.get(key, 0) >= self.per_ip:
+                self.rejected_ip += 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many concurrent login attempts",
+                    headers={"Retry-After": "1"},
+                )
+            self._by_ip[key] = self._by_ip.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                n = self._by_ip.get(key, 1) - 1
+                if n > 0:
+                    self._by_ip[key] = n
+                else:
+                    self._by_ip.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "per_ip": self.per_ip,
+                "nice": self.nice,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected_busy": self.rejected_busy,
+                "rejected_ip": self.rejected_ip,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+hasher = PasswordHasher()
+atexit.register(hasher.close)
@@ -1,17 +1,30 @@
-from fastapi import APIRouter
+import asyncio
+
+from fastapi import APIRouter, Request
 from pydantic import BaseModel
-from identity.users import create_user, authenticate_user
+from identity.users import create_user_async, authenticate_user_async
 from identity.auth import create_access_token
+from identity.passwords import hasher
+from identity.user_store import import_legacy
 
 router = APIRouter()
 
+@router.on_event("startup")
+async def import_legacy_users():
+    # bcrypt for plaintext legacy users runs here, not in the first login
+    await asyncio.to_thread(import_legacy)
+
 class UserRequest(BaseModel):
     username: str
     password: str
 
+def client_ip(request: Request):
+    return request.client.host if request.client else None
+
 @router.post("/register")
-def register(user: UserRequest):
-    success = create_user(user.username, user.password)
+async def register(user: UserRequest, request: Request):
+    with hasher.client_slot(client_ip(request)):
+        success = await create_user_async(user.username, user.password)
 
     if not success:
         return {"status":"error","message":"User already exists"}
@@ -19,9 +32,11 @@ def register(user: UserRequest):
     return {"status":"ok","message":"User created"}
 
 @router.post("/login")
-def login(user: UserRequest):
+async def login(user: UserRequest, request: Request):
+    with hasher.client_slot(client_ip(request)):
+        ok = await authenticate_user_async(user.username, user.password)
 
-    if not authenticate_user(user.username, user.password):
+    if not ok:
         return {"status":"error","message":"Invalid credentials"}
 
     token = create_access_token({"sub": user.username})
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+def _exp_ts(payload: Dict[str, Any]) -> Optional[float]:
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        return float(exp)
+    if isinstance(exp, datetime):
+        return exp.timestamp()
+    return None
+
+
+class VerifiedTokenCache:
+    """
+    Remembers tokens whose signature has already been verified, so the hot
+    path of an authenticated request is a dict lookup instead of a decode +
+    HMAC. An entry never outlives the token's own exp claim (tokens without
+    one are kept for at most max_ttl_s). Only successfully verified tokens
+    are cached; garbage tokens always take the slow path.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_ttl_s: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+        self.max_ttl_s = max_ttl_s if max_ttl_s is not None else float(os.getenv("TOKEN_CACHE_MAX_TTL_S", "3600"))
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, payload = entry
+            if expires <= now:
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        exp = _exp_ts(payload)
+        expires = min(exp, now + self.max_ttl_s) if exp is not None else now + self.max_ttl_s
+        if expires <= now:
+            return
+        with self._lock:
+            self._entries[token] = (expires, payload)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
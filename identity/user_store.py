@@ -0,0 +1,323 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USERS_DB_PATH = os.getenv("USERS_DB_PATH", os.path.join(_ROOT, "data", "users.db"))
+
+# Same layout as the existing data/users.db; UNIQUE(username) is the index
+# every lookup goes through.
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """,
+    # Legacy JSON files already imported (one-shot migration bookkeeping)
+    """
+    CREATE TABLE IF NOT EXISTS user_imports (
+        source TEXT PRIMARY KEY,
+        imported_at TEXT NOT NULL,
+        rows INTEGER NOT NULL
+    )
+    """,
+)
+
+SQL_GET = "SELECT username, password_hash, created_at FROM users WHERE username=?"
+SQL_ADD = "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)"
+SQL_ADD_IGNORE = "INSERT OR IGNORE INTO users (username, password_hash, created_at) VALUES (?, ?, ?)"
+SQL_UPSERT = (
+    "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(username) DO UPDATE SET password_hash=excluded.password_hash"
+)
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def legacy_records(raw: Any) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, str]]]:
+    """
+    Split any of the three legacy users.json shapes into
+    (hashed rows, plaintext rows):
+    - {"users": [{"username", "password"}]}            identity/users.py (bcrypt)
+    - {"users": {name: {"password_hash", "created_utc"}}} identity/auth.py (bcrypt)
+    - {name: "password"}                                 server.py / app.py (plaintext)
+    """
+    hashed: List[Tuple[str, str, str]] = []
+    plain: List[Tuple[str, str]] = []
+    if not isinstance(raw, dict):
+        return hashed, plain
+
+    users = raw.get("users") if "users" in raw else None
+    if isinstance(users, list):
+        for u in users:
+            if isinstance(u, dict) and u.get("username") and u.get("password"):
+                hashed.append((str(u["username"]), str(u["password"]), str(u.get("created_at") or _now())))
+    elif isinstance(users, dict):
+        for name, u in users.items():
+            if isinstance(u, dict) and u.get("password_hash"):
+                hashed.append((str(u.get("username") or name), str(u["password_hash"]), str(u.get("created_utc") or _now())))
+    else:
+        for name, password in raw.items():
+            if isinstance(password, str):
+                plain.append((str(name), password))
+    return hashed, plain
+
+
+class UserStore:
+    """
+    Username -> user record in SQLite (data/users.db by default).
+
+    - lookups go through the UNIQUE(username) index: O(log N), no file read
+    - add() is a single INSERT, so concurrent signups can neither lose each
+      other nor create duplicates (the loser gets False)
+    - one connection per thread, WAL journaling so logins never wait on a
+      signup
+    - recently seen users are kept in a small LRU (USER_CACHE_ENTRIES). A
+      forced re-import can change a password from another process, so at
+      most every USER_CACHE_RECHECK_MS each thread asks SQLite whether the
+      file changed (PRAGMA data_version) and drops the LRU if it did
+    """
+
+    def __init__(self, path: Optional[str] = None, cache_entries: Optional[int] = None, timeout_s: float = 5.0) -> None:
+        self.path = path or USERS_DB_PATH
+        self.timeout_s = timeout_s
+        self.cache_entries = max(0, cache_entries if cache_entries is not None else _env_int("USER_CACHE_ENTRIES", 10000))
+        self.recheck_s = _env_int("USER_CACHE_RECHECK_MS", 1000) / 1000.0
+
+        self._local = threading.local()
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        conn = self._conn()
+        for stmt in SCHEMA:
+            conn.execute(stmt)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout_s, cached_statements=16)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _recheck(self) -> None:
+        # data_version moves when another connection commits to the file
+        now = time.monotonic()
+        if now - getattr(self._local, "checked", 0.0) < self.recheck_s:
+            return
+        self._local.checked = now
+        version = self._conn().execute("PRAGMA data_version").fetchone()[0]
+        seen = getattr(self._local, "version", None)
+        self._local.version = version
+        if seen is not None and seen != version:
+            with self._lock:
+                self._cache.clear()
+
+    # ----- reads -----
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        self._recheck()
+        with self._lock:
+            user = self._cache.get(username)
+            if user is not None:
+                self._cache.move_to_end(username)
+                self.hits += 1
+                return user
+            self.misses += 1
+
+        row = self._conn().execute(SQL_GET, (username,)).fetchone()
+        if row is None:
+            return None
+        user = {"username": row[0], "password_hash": row[1], "created_at": row[2]}
+        self._remember(user)
+        return user
+
+    def exists(self, username: str) -> bool:
+        return self.get(username) is not None
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def _remember(self, user: Dict[str, Any]) -> None:
+        if not self.cache_entries:
+            return
+        with self._lock:
+            self._cache[user["username"]] = user
+            self._cache.move_to_end(user["username"])
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    # ----- writes -----
+
+    def add(self, username: str, password_hash: str) -> bool:
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute(SQL_ADD, (username, password_hash, _now()))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def add_many(self, rows: Iterable[Tuple[str, str, str]], batch: int = 10000, replace: bool = False) -> int:
+        """
+        Bulk insert of (username, password_hash, created_at); existing
+        usernames are left alone, or get the new password_hash when
+        replace=True. Returns the number of rows added or updated.
+        """
+        sql = SQL_UPSERT if replace else SQL_ADD_IGNORE
+        conn = self._conn()
+        before = conn.total_changes
+        chunk: List[Tuple[str, str, str]] = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= batch:
+                with conn:
+                    conn.executemany(sql, chunk)
+                chunk = []
+        if chunk:
+            with conn:
+                conn.executemany(sql, chunk)
+        if replace:
+            with self._lock:
+                self._cache.clear()
+        return conn.total_changes - before
+
+    # ----- legacy migration -----
+
+    def import_json(
+        self,
+        path: str,
+        hash_password: Callable[[str], str],
+        lowercase: bool = False,
+        force: bool = False,
+    ) -> int:
+        """
+        One-shot import of a legacy users.json (any shape, see legacy_records).
+        Plaintext passwords are hashed on the way in. The source is recorded in
+        user_imports and skipped next time unless force=True. Usernames already
+        in the store win over the file, except with force=True, where the
+        file's password replaces the stored one. lowercase=True applies
+        server.py's username normalisation.
+        """
+        source = os.path.abspath(path)
+        conn = self._conn()
+        if not force and conn.execute("SELECT 1 FROM user_imports WHERE source=?", (source,)).fetchone():
+            return 0
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                raw = json.load(f)
+            except ValueError:
+                print(f"user_store: {path} is not valid JSON, not imported")
+                return 0
+
+        hashed, plain = legacy_records(raw)
+
+        def norm(name: str) -> str:
+            name = name.strip()
+            return name.lower() if lowercase else name
+
+        def rows() -> Iterator[Tuple[str, str, str]]:
+            for name, password_hash, created in hashed:
+                yield norm(name), password_hash, created
+            for name, password in plain:
+                # bcrypt is the expensive part: skip it for users that stay
+                if force or not self.exists(norm(name)):
+                    yield norm(name), hash_password(password), _now()
+
+        added = self.add_many(rows(), replace=force)
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO user_imports (source, imported_at, rows) VALUES (?, ?, ?)",
+                (source, _now(), added),
+            )
+        if added:
+            print(f"user_store: imported {added} users from {path}{' (existing users updated)' if force else ''}")
+        return added
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# Legacy files imported the first time the store is opened:
+# (path, lowercase usernames)
+LEGACY_SOURCES = (
+    (os.path.join(_ROOT, "identity", "users.json"), False),
+    (os.getenv("USERS_PATH", "users.json"), True),
+)
+
+_instances: Dict[str, UserStore] = {}
+_instances_lock = threading.Lock()
+
+
+def get_store(path: Optional[str] = None) -> UserStore:
+    """
+    Process-wide UserStore per database path. Opening it never hashes
+    anything; the legacy import is import_legacy(), run at app startup.
+    """
+    path = path or USERS_DB_PATH
+    with _instances_lock:
+        store = _instances.get(path)
+        if store is None:
+            store = _instances[path] = UserStore(path)
+        return store
+
+
+def import_legacy(path: Optional[str] = None) -> int:
+    """
+    One-shot import of LEGACY_SOURCES into the store. Plaintext files are
+    bcrypt-hashed row by row, so call it off the event loop (the apps run
+    it in a worker thread at startup).
+    """
+    from identity.passwords import hasher
+
+    store = get_store(path)
+    return sum(store.import_json(source, hasher.hash, lowercase=lowercase) for source, lowercase in LEGACY_SOURCES)
+
+
+if __name__ == "__main__":
+    # python -m identity.user_store path/to/users.json [--lowercase] [--force]
+    import sys
+
+    from identity.passwords import hasher
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    store = UserStore()
+    for p in args:
+        n = store.import_json(p, hasher.hash, lowercase="--lowercase" in sys.argv, force="--force" in sys.argv)
+        print(f"{p}: {n} users added or updated ({store.count()} total)")
+    hasher.close()
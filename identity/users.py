@@ -1,40 +1,46 @@
-import json
-import os
 from identity.auth import hash_password, verify_password
+from identity.passwords import hasher
+from identity.user_store import get_store
 
-USER_FILE = "identity/users.json"
+# Users live in SQLite (identity/user_store.py); the old identity/users.json
+# list is imported into it at startup (see routes.py).
 
-def load_users():
-    if not os.path.exists(USER_FILE):
-        return {"users": []}
-    with open(USER_FILE, "r") as f:
-        return json.load(f)
-
-def save_users(data):
-    with open(USER_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+def find_user(username):
+    return get_store().get(username)
 
 def create_user(username, password):
-    data = load_users()
-
-    for u in data["users"]:
-        if u["username"] == username:
-            return False
+    store = get_store()
 
-    data["users"].append({
-        "username": username,
-        "password": hash_password(password)
-    })
+    if store.exists(username):
+        return False
 
-    save_users(data)
-    return True
+    # The INSERT is the real uniqueness check: a concurrent signup for the
+    # same name that got there first makes this return False.
+    return store.add(username, hash_password(password))
 
 def authenticate_user(username, password):
-    data = load_users()
+    u = find_user(username)
+
+    if u is None:
+        return False
+
+    return verify_password(password, u["password_hash"])
+
+# Async variants for route handlers: the bcrypt work is awaited on the
+# password pool instead of holding a server thread while it runs.
+
+async def create_user_async(username, password):
+    store = get_store()
+
+    if store.exists(username):
+        return False
+
+    return store.add(username, await hasher.ahash(password))
+
+async def authenticate_user_async(username, password):
+    u = find_user(username)
 
-    for u in data["users"]:
-        if u["username"] == username:
-            if verify_password(password, u["password"]):
-                return True
+    if u is None:
+        return False
 
-    return False
+    return await hasher.averify(password, u["password_hash"])
@@ -1,12 +1,19 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
-from openai import OpenAI
 import os
+import time
+
+from core.http_pool import openai_client
+from core.response_cache import ResponseCache
 
 app = FastAPI()
 
-# OpenAI Client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Opt-in via RESPONSE_CACHE_IDENTITIES=companion. Exact matches only: this
+# app has no users or context to scope a similarity match by
+response_cache = ResponseCache(semantic=False)
+
+# OpenAI Client (shared connection pool, core/http_pool.py)
+client = openai_client(os.getenv("OPENAI_API_KEY"))
 
 # Request schema
 class ChatRequest(BaseModel):
@@ -23,6 +30,13 @@ def read_root():
 @app.post("/chat")
 def chat(req: ChatRequest):
 
+    # Fixed system prompt and no per-user memory, so no fingerprint
+    cached = response_cache.lookup("gpt-4o-mini", "companion", req.message)
+    if cached is not None:
+        return {"reply": cached}
+
+    started = time.perf_counter()
+
     completion = client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
@@ -66,9 +80,18 @@ Growth through reflection.
         temperature=0.7
     )
 
+    reply = completion.choices[0].message.content
+
+    response_cache.store("gpt-4o-mini", "companion", req.message, "", reply, time.perf_counter() - started)
+
     return {
-        "reply": completion.choices[0].message.content
+        "reply": reply
     }
+
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    return response_cache.stats()
 # ==============================
 # SHINE AUTH SYSTEM
 # ==============================
@@ -1,24 +1,222 @@
 import json
 import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
 
 MEMORY_FILE = "memory.json"
 
-def load_memory():
+
+def _env_int(name, default):
     try:
-        with open(MEMORY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return {}
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+class KeyValueLog:
+    """
+    Key/value memory as a snapshot plus an append-only log.
+
+    - MEMORY_FILE (memory.json) is the compacted snapshot, a plain JSON
+      object -- the same format this module always wrote
+    - MEMORY_FILE + ".log" holds one JSON line per remember() since then
+    - the whole map lives in memory; recall() is a dict lookup after one
+      stat() of the log to pick up lines other processes appended
+    - once the log holds more than max(MEMORY_COMPACT_MIN, live keys) lines
+      it is folded into a new snapshot (temp file, fsync, os.replace) and
+      truncated. Replaying a log over a snapshot that already contains it is
+      harmless, so a crash between the two steps loses nothing
+    - appends and compaction take an flock on MEMORY_FILE + ".lock", so
+      several processes can share the files (POSIX only)
+    MEMORY_FSYNC=1 also fsyncs every append.
+    """
+
+    def __init__(self, path=None, compact_min=None, fsync=None):
+        self.path = path or MEMORY_FILE
+        self.log_path = self.path + ".log"
+        self.lock_path = self.path + ".lock"
+        self.compact_min = compact_min or _env_int("MEMORY_COMPACT_MIN", 1000)
+        self.fsync = fsync if fsync is not None else os.getenv("MEMORY_FSYNC", "0") == "1"
+
+        self._lock = threading.RLock()
+        self._data = None
+        self._snap_sig = None
+        self._log_offset = 0
+        self._log_records = 0
+
+    # ----- files -----
+
+    def _flock(self):
+        if fcntl is None:
+            return None
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def _unflock(self, fd):
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _sig(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _log_size(self):
+        try:
+            return os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return 0
+
+    def _read_snapshot(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _replay(self, start):
+        # Apply log lines from byte offset start; returns the new offset.
+        # A torn last line (crash mid-append) is left for the next read.
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return start
+        with f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                self._data[rec["k"]] = rec["v"]
+                self._log_records += 1
+        return offset
+
+    def _sync(self):
+        # Caller holds self._lock. Bring the in-memory map up to date with
+        # the files, reading only what changed.
+        snap_sig = self._sig(self.path)
+        size = self._log_size()
+        if self._data is None or snap_sig != self._snap_sig or size < self._log_offset:
+            # First use, or another process compacted: reload everything
+            self._data = self._read_snapshot()
+            self._snap_sig = snap_sig
+            self._log_offset = 0
+            self._log_records = 0
+        if size > self._log_offset:
+            self._log_offset = self._replay(self._log_offset)
+
+    # ----- api -----
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._sync()
+            return self._data.get(key, default)
+
+    def snapshot(self):
+        with self._lock:
+            self._sync()
+            return dict(self._data)
+
+    def set(self, key, value):
+        line = (json.dumps({"k": key, "v": value}, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            fd = self._flock()
+            try:
+                self._sync()
+                if self._log_size() > self._log_offset:
+                    # Torn line from a crashed writer: cut it off so this
+                    # record starts on a line of its own
+                    os.truncate(self.log_path, self._log_offset)
+                with open(self.log_path, "ab") as f:
+                    f.write(line)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                self._data[key] = value
+                self._log_offset += len(line)
+                self._log_records += 1
+                if self._log_records > max(self.compact_min, len(self._data)):
+                    self._write_snapshot()
+            finally:
+                self._unflock(fd)
+
+    def replace(self, data):
+        with self._lock:
+            fd = self._flock()
+            try:
+                self._data = dict(data)
+                self._write_snapshot()
+            finally:
+                self._unflock(fd)
+
+    def compact(self):
+        with self._lock:
+            fd = self._flock()
+            try:
+                self._sync()
+                self._write_snapshot()
+            finally:
+                self._unflock(fd)
+
+    def _write_snapshot(self):
+        # Caller holds both locks
+        tmp = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        _fsync_dir(self.path)
+        # Everything in the log is now in the snapshot
+        with open(self.log_path, "wb"):
+            pass
+        self._snap_sig = self._sig(self.path)
+        self._log_offset = 0
+        self._log_records = 0
+
+
+def _fsync_dir(path):
+    # Make the rename itself durable (no-op where directories can't be opened)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+_store = KeyValueLog()
+
+
+def load_memory():
+    return _store.snapshot()
 
 def save_memory(memory):
-    with open(MEMORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(memory, f, indent=2)
+    _store.replace(memory)
 
 def remember(key, value):
-    memory = load_memory()
-    memory[key] = value
-    save_memory(memory)
+    _store.set(key, value)
 
 def recall(key):
-    memory = load_memory()
-    return memory.get(key, None)
+    return _store.get(key, None)
+
+def compact():
+    _store.compact()
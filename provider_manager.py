@@ -1,6 +1,11 @@
 import os
+import threading
 from core.engine import CoreEngine
-from core.memory import MemoryStore
+from core.memory import MemoryStore, split_mode
+from core.prompt import PromptAssembler
+from core.recall_index import get_index as get_recall_index
+from core.summarizer import RollingSummarizer, summary_messages
+from core import resilience
 from identity.companion_identity import CompanionIdentity
 from identity.safespace_identity import SafeSpaceIdentity
 
@@ -17,42 +22,128 @@ class ProviderManager:
 
         self.memory = MemoryStore(data_dir=os.path.join(os.path.dirname(__file__), "data"), max_turns=max(1, turns))
 
+        # Token budget for system prompt + history + new message
+        self.prompt = PromptAssembler(model=self.engine.model)
+
+        # Turns older than the window are folded into a rolling summary in
+        # the background. SHINE_SUMMARY=extractive (default) | llm | off;
+        # llm costs an extra model call every few turns per conversation
+        summary_mode = os.getenv("SHINE_SUMMARY", "extractive").strip().lower()
+        self.summarizer = None
+        if summary_mode != "off":
+            self.summarizer = RollingSummarizer(
+                self.memory,
+                summarize_fn=self._summarize if summary_mode == "llm" else None,
+            )
+
+        # Older turns that share terms with the message (core/recall_index.py);
+        # SHINE_RECALL_TURNS=0 turns recall off, the index is still kept current
+        try:
+            self.recall_turns = max(0, int(os.getenv("SHINE_RECALL_TURNS", "3").strip()))
+        except:
+            self.recall_turns = 3
+        self.recall = get_recall_index()
+        threading.Thread(target=self.recall.sync, kwargs={"data_dir": self.memory.data_dir}, daemon=True).start()
+
+        # Built once: each mode's system prompt is the same string on every
+        # request, the first block of the cacheable prefix (core/prompt.py)
         self.identities = {
             "companion": CompanionIdentity(),
             "safespace": SafeSpaceIdentity(),
         }
 
-    def chat(self, message, mode="companion"):
+    def chat(self, message, mode="companion", user=None):
+        # History is per (user, mode); "Doug:companion" still means user Doug
+        if user is None:
+            user, mode = split_mode(mode)
         mode = (mode or "companion").lower().strip()
         identity = self.identities.get(mode, self.identities["companion"])
         system_prompt = identity.get_prompt()
 
-        history = self.memory.load_messages(mode)
+        history = self.memory.load_messages(mode, user)
+
+        summary_block = None
+        if self.summarizer is not None:
+            summary = self.summarizer.get(mode, user)
+            if summary:
+                summary_block = f"Summary of the earlier conversation:\n{summary}"
 
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(history)
-        messages.append({"role": "user", "content": message})
+        # The summary only changes on a fold; recalled lines change with every
+        # message, so they sit after the history, next to it
+        messages = self.prompt.build(
+            system_prompt,
+            history,
+            message,
+            memory_block=summary_block,
+            context_block=self._recalled(message, mode, user, history),
+        )
 
         reply = self.engine.generate_from_messages(messages)
 
-        # Persist the turn to the mode-specific memory file
-        self.memory.append(mode, "user", message)
-        self.memory.append(mode, "assistant", reply)
+        # Persist the turn to the user's mode-specific memory file (one write).
+        # A failed write is logged and counted (memory writer stats); the
+        # user still gets the reply.
+        try:
+            self.memory.append_turn(mode, message, reply, user)
+        except Exception as e:
+            print(f"==== MEMORY WRITE FAILED ({mode}): {e}")
+        self.recall.add_turn(user, mode, message, reply)
+        if self.summarizer is not None:
+            self.summarizer.schedule(mode, user)
 
         return reply
 
-    def memory_status(self):
-        return self.memory.status()
+    def _recalled(self, message, mode, user, history):
+        if not self.recall_turns:
+            return None
+        in_window = {m["content"] for m in history}
+        lines = []
+        for hit in self.recall.top_k(user, message, self.recall_turns + len(history), kinds=("turn",)):
+            if hit["text"] in in_window or not hit["ref"].startswith(mode + ":"):
+                continue
+            who = "User" if hit["ref"].endswith(":user") else "Companion"
+            lines.append(f"- {who}: {hit['text'][:300]}")
+            if len(lines) >= self.recall_turns:
+                break
+        return "Related earlier messages:\n" + "\n".join(lines) if lines else None
+
+    def _summarize(self, previous, msgs, max_chars):
+        return self.engine.generate_from_messages(summary_messages(previous, msgs, max_chars))
+
+    def recall_stats(self):
+        return self.recall.stats()
+
+    def summary_stats(self):
+        return self.summarizer.stats() if self.summarizer is not None else {"enabled": False}
+
+    def memory_status(self, user=None):
+        return self.memory.status(user)
+
+    def memory_cache_stats(self):
+        stats = self.memory.cache_stats()
+        stats["handles"] = self.memory.handle_stats()
+        return stats
+
+    def prompt_stats(self):
+        return self.prompt.stats()
+
+    def provider_metrics(self):
+        return resilience.metrics()
 
-    def memory_clear(self, mode="companion"):
+    def memory_clear(self, mode="companion", user=None):
+        if user is None:
+            user, mode = split_mode(mode)
         mode = (mode or "companion").lower().strip()
         if mode not in ("companion", "safespace", "all"):
             mode = "companion"
-        self.memory.clear(mode)
+        self.memory.clear(mode, user)
+        self.recall.forget(user, mode)
 
-    def memory_peek(self, mode="companion", n=10):
+    def memory_peek(self, mode="companion", n=10, user=None):
+        if user is None:
+            user, mode = split_mode(mode)
         mode = (mode or "companion").lower().strip()
         if mode not in ("companion", "safespace"):
             mode = "companion"
-        msgs = self.memory.load_messages(mode)
+        msgs = self.memory.load_messages(mode, user)
         return msgs[-max(1, int(n)):]
@@ -2,6 +2,12 @@ from abc import ABC, abstractmethod
 
 class BaseProvider(ABC):
 
+    # Label used by the router, in metrics and in trace spans
+    name = "provider"
+
     @abstractmethod
     async def ask(self, message: str) -> str:
         pass
+
+    async def aclose(self) -> None:
+        pass
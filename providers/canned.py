@@ -0,0 +1,11 @@
+# The SafeSpace brain's canned replies: brain.py serves them over HTTP and
+# LocalProvider returns them in-process. No network, no model.
+
+
+def reply_for(message):
+    msg = message.lower()
+
+    if "name" in msg:
+        return "Your name is Doug. I am here."
+
+    return "I hear you Doug."
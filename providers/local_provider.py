@@ -0,0 +1,27 @@
+import asyncio
+import os
+from typing import Optional
+
+from providers.canned import reply_for
+from providers.base import BaseProvider
+
+class LocalProvider(BaseProvider):
+    """
+    Offline stand-in: the SafeSpace brain's canned replies, no network.
+    A cheap backend to test the router against. It is never a standby
+    unless PROVIDERS names it ("openai:1,local:0"): its replies are not
+    answers, and real users should see an error rather than those.
+    LOCAL_PROVIDER_LATENCY_MS adds an artificial delay.
+    """
+
+    name = "local"
+
+    def __init__(self, latency_s: Optional[float] = None):
+        if latency_s is None:
+            latency_s = float(os.getenv("LOCAL_PROVIDER_LATENCY_MS", "0")) / 1000.0
+        self.latency_s = latency_s
+
+    async def ask(self, message: str) -> str:
+        if self.latency_s > 0:
+            await asyncio.sleep(self.latency_s)
+        return reply_for(message)
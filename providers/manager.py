@@ -1,10 +1,53 @@
 import os
+from typing import Dict, List, Tuple
+
+from providers.base import BaseProvider
+from providers.local_provider import LocalProvider
 from providers.openai_provider import OpenAIProvider
+from providers.router import ProviderRouter
+
+# Backends that AI_PROVIDER / PROVIDERS can name
+PROVIDER_TYPES = {
+    "openai": OpenAIProvider,
+    "local": LocalProvider,
+}
+
+_providers: Dict[str, BaseProvider] = {}
+
+
+def parse_backends(spec: str) -> List[Tuple[str, float]]:
+    # "openai:3,local:1" -> [("openai", 3.0), ("local", 1.0)]; weight defaults to 1
+    backends = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition(":")
+        backends.append((name.strip().lower(), float(weight) if weight.strip() else 1.0))
+    return backends
+
+
+def _build(provider_name: str) -> BaseProvider:
+    if provider_name == "router":
+        # No standby by default; "openai:1,local:0" opts into canned replies
+        spec = parse_backends(os.getenv("PROVIDERS", "openai:1"))
+        return ProviderRouter([(_build(name), weight) for name, weight in spec])
+
+    provider_type = PROVIDER_TYPES.get(provider_name)
+    if provider_type is None:
+        raise Exception(f"Unknown provider: {provider_name}")
+    return provider_type()
+
 
 def get_provider():
+    """
+    AI_PROVIDER=openai|local|router. "router" spreads calls over the
+    PROVIDERS list (name:weight, e.g. "openai:3,local:1"; default
+    "openai:1"). Providers are built once per process and shared.
+    """
     provider_name = os.getenv("AI_PROVIDER", "openai").lower()
 
-    if provider_name == "openai":
-        return OpenAIProvider()
-
-    raise Exception(f"Unknown provider: {provider_name}")
+    provider = _providers.get(provider_name)
+    if provider is None:
+        provider = _providers[provider_name] = _build(provider_name)
+    return provider
@@ -1,15 +1,22 @@
 import os
-from openai import OpenAI
+from typing import Optional
+
+from core.http_pool import async_openai_client
 from providers.base import BaseProvider
 
 class OpenAIProvider(BaseProvider):
 
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    name = "openai"
+
+    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        self.model = model or os.getenv("SHINE_MODEL", "gpt-4o-mini")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+        # AsyncOpenAI on the shared pool: awaiting the call frees the event loop
+        self.client = async_openai_client(api_key, self.base_url)
 
     async def ask(self, message: str) -> str:
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = await self.client.chat.completions.create(
+            model=self.model,
             messages=[{"role": "user", "content": message}]
         )
-        return response.choices[0].message.content
+        return response.choices[0].message.content or ""
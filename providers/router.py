@@ -0,0 +1,236 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from core.resilience import OPEN, CircuitBreaker, ProviderUnavailable, breaker_for, is_upstream_failure
+from core.tracing import span
+from providers.base import BaseProvider
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+def backend_id(provider: BaseProvider, label: Optional[str] = None) -> str:
+    """
+    The key a backend's breaker and stats live under: the explicit label
+    if one was given, else the provider's name plus its base_url (when it
+    has one), so two "openai" backends on different endpoints stay apart.
+    """
+    if label:
+        return label
+    base_url = getattr(provider, "base_url", None)
+    return f"{provider.name}@{base_url}" if base_url else provider.name
+
+
+class Backend:
+    """
+    One provider behind the router, with its static weight, a window of
+    recent latencies (for p95), an EWMA (for routing) and its own circuit
+    breaker ("provider:<id>" in /metrics/provider).
+    """
+
+    def __init__(self, provider: BaseProvider, weight: float, window: int, key: Optional[str] = None) -> None:
+        self.provider = provider
+        self.name = provider.name
+        self.id = key or backend_id(provider)
+        self.weight = max(0.0, weight)
+        self.breaker: CircuitBreaker = breaker_for(f"provider:{self.id}")
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.ewma_s: Optional[float] = None
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+        self.ewma_s = seconds if self.ewma_s is None else 0.8 * self.ewma_s + 0.2 * seconds
+
+    def p95(self, min_samples: int) -> Optional[float]:
+        if len(self.latencies) < min_samples:
+            return None
+        xs = sorted(self.latencies)
+        return xs[min(len(xs) - 1, int(len(xs) * 0.95))]
+
+    def available(self) -> bool:
+        # Open and still cooling down; a half-open breaker lets the router probe
+        b = self.breaker
+        return not (b.state == OPEN and time.monotonic() - b.opened_at < b.reset_timeout_s)
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95(1)
+        return {
+            "weight": self.weight,
+            "ewma_ms": round(self.ewma_s * 1000, 1) if self.ewma_s is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "breaker": self.breaker.snapshot()["state"],
+        }
+
+
+class ProviderRouter(BaseProvider):
+    """
+    Spreads ask() over several providers.
+
+    - picks a backend at random, weight / EWMA latency (and in-flight
+      count), so a slow or busy backend gets less traffic; backends with an
+      open breaker are skipped
+    - hedging: if the chosen backend has not answered by its own p95
+      (PROVIDER_HEDGE_DELAY_MS until PROVIDER_HEDGE_MIN_SAMPLES calls are
+      in), the same message goes to a second backend and the first answer
+      wins; the loser is cancelled
+    - a backend that fails hands over to the next one at once; weight 0
+      backends (e.g. "local:0") are standby, tried only after every
+      weighted backend has failed
+
+    backends are (provider, weight) or (provider, weight, label) tuples.
+    Each gets a unique id (backend_id(); "#2", "#3"... when two would still
+    collide), and breakers and stats are keyed by it, not by provider.name.
+    """
+
+    name = "router"
+
+    def __init__(
+        self,
+        backends: Sequence[Tuple[Any, ...]],
+        hedge: Optional[bool] = None,
+        hedge_delay_s: Optional[float] = None,
+        min_samples: Optional[int] = None,
+    ) -> None:
+        window = _env_int("PROVIDER_LATENCY_WINDOW", 200)
+        self.backends: List[Backend] = []
+        seen: Dict[str, int] = {}
+        for provider, weight, *label in backends:
+            key = backend_id(provider, label[0] if label else None)
+            seen[key] = seen.get(key, 0) + 1
+            if seen[key] > 1:
+                key = f"{key}#{seen[key]}"
+            self.backends.append(Backend(provider, weight, window, key))
+        if not self.backends:
+            raise ValueError("ProviderRouter needs at least one backend")
+        self.hedge = hedge if hedge is not None else os.getenv("PROVIDER_HEDGE", "1") != "0"
+        self.hedge_delay_s = hedge_delay_s if hedge_delay_s is not None else _env_float("PROVIDER_HEDGE_DELAY_MS", 1000.0) / 1000.0
+        self.min_samples = min_samples if min_samples is not None else _env_int("PROVIDER_HEDGE_MIN_SAMPLES", 20)
+
+    def _pick(self, exclude: Sequence[Backend] = (), standby: bool = False) -> Optional[Backend]:
+        candidates = [b for b in self.backends if b not in exclude and b.weight > 0 and b.available()]
+        if not candidates and standby:
+            # Weight 0 = standby: only used once every weighted backend has failed
+            candidates = [b for b in self.backends if b not in exclude and b.available()]
+            return candidates[0] if candidates else None
+        if not candidates:
+            return None
+        known = [b.ewma_s for b in candidates if b.ewma_s is not None]
+        # Untried backends are scored as the fastest known one, so they get traffic
+        default = min(known) if known else 1.0
+        scores = [
+            b.weight / (max(b.ewma_s if b.ewma_s is not None else default, 0.001) * (1 + b.in_flight))
+            for b in candidates
+        ]
+        return random.choices(candidates, weights=scores)[0]
+
+    def _hedge_after(self, backend: Backend) -> float:
+        p95 = backend.p95(self.min_samples)
+        return p95 if p95 is not None else self.hedge_delay_s
+
+    async def _call(self, backend: Backend, message: str) -> str:
+        backend.breaker.before_call()
+        backend.calls += 1
+        backend.in_flight += 1
+        start = time.perf_counter()
+        try:
+            with span("provider", backend=backend.id):
+                reply = await backend.provider.ask(message)
+        except asyncio.CancelledError:
+            # Lost a hedge race: says nothing about the backend's health
+            backend.breaker.record_neutral()
+            raise
+        except Exception as e:
+            backend.errors += 1
+            if is_upstream_failure(e):
+                backend.breaker.record_failure()
+            else:
+                backend.breaker.record_neutral()
+            raise
+        else:
+            backend.observe(time.perf_counter() - start)
+            backend.breaker.record_success()
+            return reply
+        finally:
+            backend.in_flight -= 1
+
+    async def ask(self, message: str) -> str:
+        tried: List[Backend] = []
+        running: Dict["asyncio.Task[str]", Backend] = {}
+        last_err: Optional[BaseException] = None
+        hedged = False
+
+        def launch(exclude: Sequence[Backend], standby: bool = False) -> Optional[Backend]:
+            backend = self._pick(exclude, standby)
+            if backend is not None:
+                tried.append(backend)
+                running[asyncio.ensure_future(self._call(backend, message))] = backend
+            return backend
+
+        first = launch(tried, standby=True)
+        if first is None:
+            raise ProviderUnavailable("No provider available", min(b.breaker.reset_timeout_s for b in self.backends))
+        timeout: Optional[float] = self._hedge_after(first) if self.hedge and len(self.backends) > 1 else None
+
+        try:
+            while running:
+                done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is past its p95: hedge once
+                    timeout = None
+                    hedge = launch(tried)
+                    if hedge is not None:
+                        hedged = True
+                        hedge.hedges += 1
+                    continue
+                for task in done:
+                    backend = running.pop(task)
+                    if task.exception() is None:
+                        if hedged and backend is not tried[0]:
+                            backend.hedge_wins += 1
+                        return task.result()
+                    last_err = task.exception()
+                if not running and launch(tried, standby=True) is None:
+                    break
+        finally:
+            for task in running:
+                task.cancel()
+
+        if last_err is not None:
+            raise last_err
+        raise ProviderUnavailable("No provider available", 1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedge": self.hedge,
+            "hedge_delay_ms": self.hedge_delay_s * 1000,
+            "backends": {b.id: b.snapshot() for b in self.backends},
+        }
+
+    async def aclose(self) -> None:
+        for b in self.backends:
+            await b.provider.aclose()
@@ -1,21 +1,39 @@
 import os
 import json
 import time
-import sqlite3
+import math
+import asyncio
 import jwt
 
 from datetime import datetime, timedelta
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm, HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-
-from openai import OpenAI
+from starlette.background import BackgroundTask
+
+from core.memory_db import get_db
+from core.recall_index import get_index as get_recall_index
+from core.vector_recall import get_vector_recall
+from identity.passwords import hasher
+from identity.token_cache import VerifiedTokenCache
+from identity.user_store import get_store as get_user_store, import_legacy as import_legacy_users
+from core.prompt import PromptAssembler, cache_stats
+from core.response_cache import ResponseCache, fingerprint
+from core import http_pool, resilience
+from core.resilience import ProviderUnavailable, guard_async
+from core import tracing
+from core.tracing import TraceMiddleware, span
 
 APP_TITLE = "Shine Companion"
 
-USERS_PATH = os.getenv("USERS_PATH", "users.json")
 DB_PATH = os.getenv("MEMORY_DB_PATH", "memory.db")
+# "recent" = newest 20 facts, "ranked" = facts most relevant to the message first
+# (through RecallIndex/, whose per-user terms keep it sub-ms however big memory.db is),
+# "index" = the same over facts + knowledge_memory, then the newest,
+# "vector" = facts nearest the message by embedding (core/vector_recall.py), then the newest
+MEMORY_RECALL_MODE = os.getenv("MEMORY_RECALL_MODE", "recent").strip().lower()
 
 JWT_SECRET = os.getenv("JWT_SECRET", "change-me-please")
 JWT_ALG = os.getenv("JWT_ALGORITHM", "HS256")
@@ -26,67 +44,91 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
 app = FastAPI(title=APP_TITLE)
 
+# Per-request stage spans -> logs/trace.log (JSON lines) and /metrics
+app.add_middleware(TraceMiddleware)
+
 bearer = HTTPBearer(auto_error=False)
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# One keep-alive connection pool for every upstream call (core/http_pool.py)
+client = http_pool.async_openai_client(OPENAI_API_KEY)
+
+@app.exception_handler(ProviderUnavailable)
+async def provider_unavailable(request, exc: ProviderUnavailable):
+    # Shed fast instead of queueing behind a degraded upstream
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after_s))}
+    )
 
 # -------------------------
 # DATABASE INIT
 # -------------------------
 
-def db_init():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+memory_db = get_db(DB_PATH)
 
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS user_memory (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT,
-        key TEXT,
-        value TEXT,
-        created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
+# Inverted index over facts and knowledge (core/recall_index.py); the file
+# is mapped on first use and caught up from memory.db in the background.
+# Kept only when MEMORY_RECALL_MODE=ranked|index: nothing else queries it.
+recall_index = get_recall_index() if MEMORY_RECALL_MODE in ("ranked", "index") else None
+if recall_index is not None:
+    recall_index.attach(memory_db)
 
-    conn.commit()
-    conn.close()
+# Per-user int8 embedding index over facts (core/vector_recall.py), kept
+# only when MEMORY_RECALL_MODE=vector
+vector_recall = get_vector_recall() if MEMORY_RECALL_MODE == "vector" else None
 
-db_init()
+prompt = PromptAssembler(model=SHINE_MODEL)
 
-# -------------------------
-# USERS
-# -------------------------
+# Opt-in via RESPONSE_CACHE_IDENTITIES=companion
+response_cache = ResponseCache()
+IDENTITY = "companion"
 
-_users_cache = {"time": 0, "data": {}}
 
-def load_users():
-    try:
-        st = os.stat(USERS_PATH)
-    except FileNotFoundError:
-        return {}
+@app.on_event("startup")
+async def sync_recall_index():
+    if recall_index is not None:
+        asyncio.get_running_loop().run_in_executor(None, recall_index.sync, memory_db)
+    if vector_recall is not None:
+        asyncio.get_running_loop().run_in_executor(None, vector_recall.sync, memory_db)
+
 
-    if st.st_mtime != _users_cache["time"]:
-        with open(USERS_PATH, "r", encoding="utf-8") as f:
-            raw = json.load(f)
+@app.on_event("shutdown")
+def flush_memory():
+    # Queued writes (MEMORY_DB_DURABILITY=batched|async) land before exit
+    memory_db.flush()
+    if recall_index is not None:
+        recall_index.close()
+    if vector_recall is not None:
+        vector_recall.close()
 
-        cooked = {}
-        for k, v in raw.items():
-            cooked[str(k).strip().lower()] = str(v)
 
-        _users_cache["time"] = st.st_mtime
-        _users_cache["data"] = cooked
+@app.on_event("shutdown")
+async def close_http_pool():
+    await http_pool.aclose()
+
+# -------------------------
+# USERS
+# -------------------------
 
-    return _users_cache["data"]
+# Users live in the SQLite user store; the flat USERS_PATH file
+# ({"name": "password"}) is imported once, lowercased and bcrypt-hashed,
+# by a worker thread at startup. Edits to the file are no longer picked up
+# on the fly (the old mtime reload is gone); re-import them with
+#   python -m identity.user_store users.json --lowercase --force
+# which also overwrites the passwords of users already in the store.
 
+@app.on_event("startup")
+async def import_users():
+    await asyncio.to_thread(import_legacy_users)
 
 def verify_user(username, password):
-    users = load_users()
-    username = username.strip().lower()
+    user = get_user_store().get(username.strip().lower())
 
-    if username not in users:
+    if user is None:
         return False
 
-    return users[username] == password
+    return hasher.verify(password, user["password_hash"])
 
 
 # -------------------------
@@ -102,53 +144,77 @@ def create_token(user_id):
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
 
+# Verified JWT payloads, bounded by each token's exp
+token_cache = VerifiedTokenCache()
+
+
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer)):
+
+    with span("auth"):
+        return authenticate(credentials)
+
+
+def authenticate(credentials):
     if credentials is None:
         raise HTTPException(status_code=401, detail="Missing token")
 
     token = credentials.credentials
 
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload["id"]
+
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-        return payload["id"]
+        user_id = payload["id"]
     except:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+    token_cache.put(token, payload)
+
+    return user_id
+
 
 # -------------------------
 # MEMORY
 # -------------------------
 
-def load_user_memory(user_id):
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def load_user_memory(user_id, message=None):
 
-    cursor.execute(
-        "SELECT key, value FROM user_memory WHERE user_id=? ORDER BY created DESC LIMIT 20",
-        (user_id,)
-    )
+    if MEMORY_RECALL_MODE in ("ranked", "index") and message:
+        kinds = ("fact",) if MEMORY_RECALL_MODE == "ranked" else ("fact", "knowledge")
+        rows = recall_index.facts(user_id, message, k=20, kinds=kinds)
+        if len(rows) < 20:
+            seen = {k for k, _ in rows}
+            rows += [(k, v) for k, v in memory_db.load_user_memory(user_id, limit=20) if k not in seen]
+            rows = rows[:20]
+    elif MEMORY_RECALL_MODE == "vector" and message:
+        rows = [(k, v) for k, v, _ in vector_recall.top_k(user_id, message, k=20)]
+        if len(rows) < 20:
+            seen = {k for k, _ in rows}
+            rows += [(k, v) for k, v in memory_db.load_user_memory(user_id, limit=20) if k not in seen]
+            rows = rows[:20]
+    else:
+        rows = memory_db.load_user_memory(user_id, limit=20)
 
-    rows = cursor.fetchall()
-    conn.close()
-
-    memory_text = "\n".join([f"{k}: {v}" for k, v in rows])
-
-    return memory_text
+    # Facts arrive most relevant / most recent first; keep what fits
+    return prompt.memory_block([f"{k}: {v}" for k, v in rows])
 
 
 def save_user_memory(user_id, key, value):
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    memory_db.save_user_memory(user_id, key, value)
+    if recall_index is not None:
+        recall_index.add_fact(user_id, key, value)
+    if vector_recall is not None:
+        vector_recall.add(user_id, key, value)
 
-    cursor.execute(
-        "INSERT INTO user_memory (user_id, key, value) VALUES (?, ?, ?)",
-        (user_id, key, value)
-    )
 
-    conn.commit()
-    conn.close()
+def save_session_turn(user_id, message, reply):
+
+    if reply:
+        with span("memory_write", kind="turn"):
+            memory_db.save_session_turn(user_id, message, reply)
 
 
 # -------------------------
@@ -165,9 +231,14 @@ class ChatRequest(BaseModel):
 
 @app.post("/login")
 
-def login(form: OAuth2PasswordRequestForm = Depends()):
+def login(request: Request, form: OAuth2PasswordRequestForm = Depends()):
 
-    if not verify_user(form.username, form.password):
+    # Per-IP cap on concurrent bcrypt checks (429 past it), so one client
+    # cannot fill the whole password pool queue
+    with hasher.client_slot(request.client.host if request.client else None):
+        ok = verify_user(form.username, form.password)
+
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid login")
 
     token = create_token(form.username)
@@ -182,15 +253,11 @@ def login(form: OAuth2PasswordRequestForm = Depends()):
 # CHAT
 # -------------------------
 
-@app.post("/chat")
-
-def chat(data: ChatRequest, user_id: str = Depends(get_current_user)):
-
-    message = data.message.strip()
-
-    # -------------------------
-    # MEMORY CAPTURE
-    # -------------------------
+def capture_memory(user_id, message):
+    """
+    Handles "remember key: value". Returns the reply if the message was a
+    memory instruction, otherwise None.
+    """
 
     if message.lower().startswith("remember"):
 
@@ -199,39 +266,256 @@ def chat(data: ChatRequest, user_id: str = Depends(get_current_user)):
         if ":" in content:
             key, value = content.split(":", 1)
 
-            save_user_memory(user_id, key.strip(), value.strip())
+            with span("memory_write", kind="fact"):
+                save_user_memory(user_id, key.strip(), value.strip())
 
-            return {"reply": "Got it. I'll remember that."}
+            return "Got it. I'll remember that."
 
-    # -------------------------
-    # LOAD MEMORY
-    # -------------------------
+    return None
 
-    memory_context = load_user_memory(user_id)
 
-    system_prompt = f"""
+# Identical for every user and every request, so it forms a shared cacheable
+# prefix upstream. Per-user memory follows it in its own system message.
+SYSTEM_PROMPT = """
 You are Shine Companion.
 
 You remember important things about the user.
 
-Known user facts:
-{memory_context}
-
-Use these memories when helping the user.
+Use the known user facts below when helping the user.
 """
 
-    # -------------------------
-    # OPENAI CALL
-    # -------------------------
 
-    response = client.chat.completions.create(
-        model=SHINE_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ]
+def build_messages(user_id, message):
+
+    with span("memory_load"):
+        memory_block = load_user_memory(user_id, message)
+
+    with span("prompt"):
+        # Facts picked per message change with every request, so they go
+        # after the cached prefix rather than in it
+        if MEMORY_RECALL_MODE in ("ranked", "index", "vector"):
+            return prompt.build(SYSTEM_PROMPT, [], message, context_block=memory_block)
+        return prompt.build(SYSTEM_PROMPT, [], message, memory_block=memory_block)
+
+
+def context_fingerprint(messages):
+
+    # Everything but the new message: static prompt + this user's facts
+    return fingerprint("\n".join(m["content"] for m in messages[:-1]))
+
+
+class GuardedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that always exits the provider guard it was handed,
+    even when the client disconnects before the body is iterated.
+    """
+
+    def __init__(self, content, guarded, outcome, **kwargs):
+        super().__init__(content, **kwargs)
+        self.guarded = guarded
+        self.outcome = outcome
+
+    async def __call__(self, scope, receive, send):
+        err = None
+        try:
+            await super().__call__(scope, receive, send)
+        except BaseException as e:
+            err = e
+            raise
+        finally:
+            err = self.outcome["error"] or err
+            await self.guarded.__aexit__(type(err) if err else None, err, None)
+
+
+def sse(event):
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat")
+
+async def chat(data: ChatRequest, background: BackgroundTasks, user_id: str = Depends(get_current_user)):
+
+    message = data.message.strip()
+
+    # SQLite work runs in the threadpool so the event loop stays free
+
+    reply = await asyncio.to_thread(capture_memory, user_id, message)
+
+    if reply:
+        return {"reply": reply}
+
+    messages = await asyncio.to_thread(build_messages, user_id, message)
+
+    fp = context_fingerprint(messages)
+    reply = await asyncio.to_thread(response_cache.lookup, SHINE_MODEL, IDENTITY, message, fp)
+
+    if reply is None:
+        started = time.perf_counter()
+
+        with span("provider", model=SHINE_MODEL):
+            async with guard_async(SHINE_MODEL):
+                response = await client.chat.completions.create(
+                    model=SHINE_MODEL,
+                    messages=messages
+                )
+
+        cache_stats.record(response.usage)
+
+        reply = response.choices[0].message.content
+
+        await asyncio.to_thread(
+            response_cache.store, SHINE_MODEL, IDENTITY, message, fp, reply, time.perf_counter() - started
+        )
+
+    # Persisted after the response is sent
+    background.add_task(save_session_turn, user_id, message, reply)
+
+    return {"reply": reply}
+
+
+@app.post("/chat/stream")
+
+async def chat_stream(data: ChatRequest, user_id: str = Depends(get_current_user)):
+
+    message = data.message.strip()
+
+    reply = await asyncio.to_thread(capture_memory, user_id, message)
+
+    if reply:
+        async def ack():
+            yield sse({"delta": reply})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(ack(), media_type="text/event-stream")
+
+    messages = await asyncio.to_thread(build_messages, user_id, message)
+
+    fp = context_fingerprint(messages)
+    cached = await asyncio.to_thread(response_cache.lookup, SHINE_MODEL, IDENTITY, message, fp)
+
+    if cached is not None:
+        async def replay():
+            yield sse({"delta": cached})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(
+            replay(),
+            media_type="text/event-stream",
+            background=BackgroundTask(save_session_turn, user_id, message, cached)
+        )
+
+    parts = []
+    outcome = {"error": None}
+    started = time.perf_counter()
+
+    async def events():
+        try:
+            with span("provider", model=SHINE_MODEL, stream=True) as attrs:
+                stream = await client.chat.completions.create(
+                    model=SHINE_MODEL,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+
+                async for chunk in stream:
+                    if not chunk.choices:
+                        # Final usage-only chunk
+                        cache_stats.record(getattr(chunk, "usage", None))
+                        continue
+
+                    delta = chunk.choices[0].delta.content
+
+                    if delta:
+                        if not parts:
+                            attrs["ttft_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                        parts.append(delta)
+                        yield sse({"delta": delta})
+
+        except Exception as e:
+            outcome["error"] = e
+            yield f"event: error\ndata: {json.dumps({'error': 'provider_error', 'detail': str(e)})}\n\n"
+            return
+
+        await asyncio.to_thread(
+            response_cache.store, SHINE_MODEL, IDENTITY, message, fp, "".join(parts), time.perf_counter() - started
+        )
+
+        yield "data: [DONE]\n\n"
+
+    # Admission and breaker checks happen before any bytes are sent, so a
+    # shed request still gets a proper 503. The slot is held until the
+    # response finishes (or the client goes away).
+    guarded = guard_async(SHINE_MODEL)
+    await guarded.__aenter__()
+
+    # The background task runs once the stream has been fully sent, in the
+    # threadpool, with the reply assembled from the streamed parts.
+    persist = BackgroundTask(lambda: save_session_turn(user_id, message, "".join(parts)))
+
+    return GuardedStreamingResponse(
+        events(),
+        guarded=guarded,
+        outcome=outcome,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=persist
     )
 
-    reply = response.choices[0].message.content
 
-    return {"reply": reply}
\ No newline at end of file
+# -------------------------
+# METRICS
+# -------------------------
+
+@app.get("/metrics/provider")
+
+def provider_metrics():
+
+    return resilience.metrics()
+
+
+@app.get("/metrics/cache")
+
+def response_cache_metrics():
+
+    return response_cache.stats()
+
+
+@app.get("/metrics/prompt")
+
+def prompt_metrics():
+
+    return prompt.stats()
+
+
+@app.get("/metrics/http")
+
+def http_pool_metrics():
+
+    return http_pool.stats()
+
+
+@app.get("/metrics/recall")
+
+def recall_index_metrics():
+
+    return recall_index.stats() if recall_index is not None else {"enabled": False}
+
+
+@app.get("/metrics/vector")
+
+def vector_recall_metrics():
+
+    return vector_recall.stats() if vector_recall is not None else {"enabled": False}
+
+
+@app.get("/metrics")
+
+def prometheus_metrics():
+
+    # Per-stage and per-route latency histograms plus connection pool
+    # gauges (Prometheus text format)
+    return PlainTextResponse(
+        tracing.metrics_text() + http_pool.metrics_text(),
+        media_type="text/plain; version=0.0.4"
+    )
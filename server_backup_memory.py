@@ -1,9 +1,10 @@
 from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.security import HTTPBearer
 from jose import jwt
-import sqlite3
 import os
 
+from core.memory_db import get_db
+
 app = FastAPI()
 
 SECRET = os.getenv("JWT_SECRET","shine_secret")
@@ -24,33 +25,14 @@ def root():
 
 @app.post("/memory/save")
 def save_memory(data:dict, user=Depends(verify_token)):
-    conn = sqlite3.connect("memory.db")
-    c = conn.cursor()
-
-    c.execute(
-        "INSERT INTO user_memory (user_id,key,value) VALUES (?,?,?)",
-        (user["id"], data["key"], data["value"])
-    )
-
-    conn.commit()
-    conn.close()
+    get_db("memory.db").save_user_memory(user["id"], data["key"], data["value"])
 
     return {"status":"saved"}
 
 @app.get("/memory/get")
 def get_memory(user=Depends(verify_token)):
 
-    conn = sqlite3.connect("memory.db")
-    c = conn.cursor()
-
-    c.execute(
-        "SELECT key,value FROM user_memory WHERE user_id=?",
-        (user["id"],)
-    )
-
-    data = c.fetchall()
-
-    conn.close()
+    data = get_db("memory.db").all_user_memory(user["id"])
 
     return {"memory":data}
 # ==============================
@@ -59,7 +41,6 @@ def get_memory(user=Depends(verify_token)):
 
 from fastapi import Request
 from openai import OpenAI
-import sqlite3
 import os
 
 client = OpenAI()
@@ -70,15 +51,7 @@ async def chat(request: Request, user=Depends(verify_token)):
     data = await request.json()
     message = data.get("message")
 
-    conn = sqlite3.connect("memory.db")
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT key,value FROM user_memory WHERE user_id=?",
-        (user["id"],)
-    )
-
-    memories = cursor.fetchall()
+    memories = get_db("memory.db").all_user_memory(user["id"])
 
     memory_context = ""
     for m in memories:
@@ -102,6 +75,4 @@ User message:
 
     reply = response.choices[0].message.content
 
-    conn.close()
-
     return {"reply": reply}
\ No newline at end of file